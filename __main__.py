@@ -1,16 +1,229 @@
+import sys
+from utils.startup import startup
+if '--startup-report' in sys.argv:
+    # Has to be installed before the imports below to time them
+    startup.record_imports()
+
+import argparse
 import asyncio
-import anthropic
-from ui.state_manager import DialogStateManager
-from config.prompts import SYSTEM_PROMPT
-from utils.logging import setup_logging
-from utils.history import DialogueHistory
-from config.config_manager import ConfigManager
+import importlib
+import time
+from pathlib import Path
+from typing import Any, Callable, List, Dict, Optional, Set, Mapping, TYPE_CHECKING
+from prompt_toolkit.application import get_app
+from ui.state_manager import COMMANDS, DialogStateManager
+from ui.stream_output import OUTPUT_MODES, StreamDialog, resolve_output_mode
+from utils.prompt_builder import PromptBuilder, build_request
+from utils.logging import LOG_FORMATS, setup_logging, route_console, release_console
+from utils.history import DialogueHistory, HistoryCompactor
+from config.prompts import SUMMARY_PROMPT
+from config.config_manager import ConfigManager, ConfigSnapshot
 from utils.time_utils import get_formatted_datetime
+from utils.signals import cancel_on_interrupt
+from storage.session_store import SessionStore
+from storage.fact_store import FactStore
+from storage.recordings import StreamRecorder
+from providers.base import Completion, Usage
+from providers.retry import RetryPolicy, call_with_retries, stream_with_retries
+from utils.metrics import MetricsRegistry
+from utils.batch import BatchOutput, BatchRunner, load_conversations, run_workers
+from utils.workers import open_provider
+from utils.turns import Item
+from server.dialogue_server import DialogueServer
+from server.pool import WorkerPool
 import logging
 
-async def main():
+if TYPE_CHECKING:
+    from providers.base import Provider
+
+def new_provider(
+    config: Mapping[str, Any],
+    api_key: Optional[str],
+    recorder: Optional[StreamRecorder] = None,
+    cache_config: Optional[Mapping[str, Any]] = None
+) -> "Provider":
+    factory = importlib.import_module('providers.factory')
+    return factory.create_provider(config, api_key, recorder, cache_config)
+
+async def create_provider(
+    config_manager: ConfigManager,
+    prompt_shown: asyncio.Event,
+    base_url: Optional[str] = None,
+    recorder: Optional[StreamRecorder] = None
+) -> "Provider":
+    # Importing the SDK and setting up its HTTP client takes a few hundred ms,
+    # so it happens on a worker thread while the user types
+    await prompt_shown.wait()
+    config = config_manager.get_provider_config()
+    if base_url:
+        config = {**config, 'base_url': base_url}
+    return await asyncio.to_thread(
+        new_provider, config, config_manager.get_api_key(), recorder, config_manager.get_response_cache_config()
+    )
+
+async def stream_response(
+    provider: "Provider",
+    manager: DialogStateManager,
+    provider_config: Mapping[str, Any],
+    on_restart: Optional[Callable[[], None]] = None,
+    **request: Any
+) -> Completion:
+    completion = await stream_with_retries(
+        provider,
+        manager.process_response_chunk,
+        RetryPolicy.from_config(provider_config),
+        provider_config['resume'],
+        on_restart,
+        **request
+    )
+    log_usage(completion.usage)
+    return completion
+
+def log_usage(usage: Usage) -> None:
+    logging.getLogger(__name__).info(
+        "Prompt cache: %s tokens read, %s tokens written, %s uncached input tokens, %s output tokens",
+        usage.cache_read_input_tokens, usage.cache_creation_input_tokens, usage.input_tokens, usage.output_tokens
+    )
+
+async def warm_up_cache(provider_task: "asyncio.Future[Provider]", model_config: Mapping[str, Any], system: List[Dict[str, Any]]) -> None:
+    logger = logging.getLogger(__name__)
+    try:
+        provider = await provider_task
+        if not provider.supports_prompt_cache:
+            return
+        completion = await provider.complete(
+            model=model_config['name'],
+            max_tokens=1,
+            system=system,
+            messages=[{"role": "user", "content": "."}]
+        )
+        log_usage(completion.usage)
+    except Exception as e:
+        logger.warning("Prompt cache warm-up failed: %s", e)
+
+async def summarize_history(
+    provider: "Provider",
+    model_config: Mapping[str, Any],
+    provider_config: Mapping[str, Any],
+    previous_summary: Optional[str],
+    messages: List[Dict[str, str]]
+) -> str:
+    transcript = "\n\n".join(f"{msg['role'].upper()}: {msg['content']}" for msg in messages)
+    if previous_summary:
+        transcript = f"PREVIOUS SUMMARY: {previous_summary}\n\n{transcript}"
+
+    completion = await call_with_retries(
+        RetryPolicy.from_config(provider_config),
+        lambda: provider.complete(
+            model=model_config['name'],
+            max_tokens=1024,
+            temperature=0,
+            system=SUMMARY_PROMPT,
+            messages=[{"role": "user", "content": transcript}]
+        ),
+        "Summary"
+    )
+    return completion.text
+
+def open_session(
+    sessions_config: Mapping[str, Any],
+    args: argparse.Namespace,
+    history: DialogueHistory,
+    budget_tokens: int
+) -> Optional[SessionStore]:
+    logger = logging.getLogger(__name__)
+    if not sessions_config['enabled']:
+        if args.resume or args.session:
+            raise ValueError("--resume and --session need sessions.enabled in config/config.yml")
+        return None
+
+    session_id = args.session
+    if args.resume:
+        session_id = SessionStore.latest_session_id(sessions_config['path'])
+        if session_id is None:
+            logger.warning("No session to resume, starting a new one")
+
+    store = SessionStore(sessions_config['path'], session_id or SessionStore.new_session_id())
+    if store.exists():
+        started = time.perf_counter()
+        try:
+            history.load(*store.load_tail(budget_tokens))
+        except ValueError:
+            store.close()
+            raise
+        logger.info(
+            "Resumed session %s: %s messages in %.1f ms",
+            store.session_id, len(history.messages), (time.perf_counter() - started) * 1000
+        )
+    else:
+        logger.info("Started session %s", store.session_id)
+    return store
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Disco Elysium-style terminal assistant")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--session', metavar='ID', help="open the session with this id, creating it if needed")
+    group.add_argument('--resume', action='store_true', help="reopen the most recent session")
+    parser.add_argument('--startup-report', action='store_true',
+                        help="print import times and time to prompt, then exit")
+    parser.add_argument('--record', metavar='DIR', help="save the raw stream events of every turn to DIR")
+    parser.add_argument('--log-format', choices=LOG_FORMATS, default='text',
+                        help="log file format, json writes one object per line to logs/disco_inferno.jsonl")
+    parser.add_argument('--base-url', metavar='URL',
+                        help="send API requests here instead, e.g. to benchmarks.fake_anthropic")
+    parser.add_argument('--output-mode', choices=OUTPUT_MODES, default='auto',
+                        help="tty is the interactive UI; plain and json write one line per skill check, "
+                             "without styling or CONTINUE; auto picks plain when stdin or stdout isn't a terminal")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="run the conversations in FILE (JSON lines) without the UI and write the parsed items")
+    parser.add_argument('--output', metavar='FILE', help="batch results file, FILE.out.jsonl next to the input by default")
+    parser.add_argument('--concurrency', type=int, default=4, metavar='N',
+                        help="conversations run at once in batch mode (default: 4)")
+    parser.add_argument('--serve', action='store_true',
+                        help="host dialogue sessions over HTTP instead of the terminal UI, see the server section of the config")
+    parser.add_argument('--port', type=int, metavar='PORT', help="server port, instead of server.port")
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help="spread --batch or --serve over N processes, to use more than one core (default: 1)")
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.batch and args.serve:
+        parser.error("--batch and --serve can't be combined")
+    if args.startup_report:
+        # The report is about the interactive UI
+        args.output_mode = 'tty'
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.workers > 1 and args.serve and sys.platform == 'win32':
+        parser.error("--serve with --workers needs a POSIX system")
+    return args
+
+async def run_batch(args: argparse.Namespace) -> int:
+    setup_logging(args.log_format)
+    logger = logging.getLogger(__name__)
+    output = BatchOutput(args.output or Path(args.batch).with_suffix('.out.jsonl'))
+    provider = None
+    try:
+        config_manager = ConfigManager()
+        pending = output.pending(load_conversations(args.batch))
+        if args.workers > 1:
+            await run_workers(pending, args.workers, args.concurrency, output.write, args.log_format, args.base_url)
+        else:
+            provider = open_provider(config_manager, args.base_url)
+            await BatchRunner(provider, config_manager, args.concurrency).run(pending, output.write)
+        logger.info("Batch finished: %s done, %s failed, results in %s", output.finished, output.failed, output.path)
+        return 1 if output.failed or output.finished < len(pending) else 0
+    except Exception as e:
+        logger.error("Check failure: %s", e)
+        return 1
+    finally:
+        output.close()
+        if provider is not None:
+            await provider.close()
+
+async def main(args: argparse.Namespace):
     try:
-        setup_logging()
+        setup_logging(args.log_format)
         logger = logging.getLogger(__name__)
 
         logger.info("Mr. Evrart is helping me find my API key.")
@@ -18,19 +231,84 @@ async def main():
         config_manager = ConfigManager()
 
         api_key = config_manager.get_api_key()
-        if not api_key:
+        if not api_key and config_manager.get_provider_config()['type'] == 'anthropic':
             raise ValueError("No API key found in config or environment variables")
 
-        base_prompt = SYSTEM_PROMPT
-        user_context = config_manager.get_user_context()
+        context_config = config_manager.get_user_context_config()
+        fact_store = FactStore(
+            context_config['file'],
+            fsync_every=context_config['fsync_every'],
+            journal_max_bytes=int(context_config['journal_max_kb'] * 1024)
+        )
 
         model_config = config_manager.get_model_config()
+        cache_config = config_manager.get_prompt_cache_config()
+        history_config = config_manager.get_history_config()
+        prompt_builder = PromptBuilder(cache_enabled=cache_config['enabled'])
 
-        client = anthropic.Anthropic(api_key=api_key)
-        manager = DialogStateManager(config_manager)
+        prompt_shown = asyncio.Event()
+        recorder = StreamRecorder(args.record) if args.record else None
+        provider_task = asyncio.ensure_future(create_provider(config_manager, prompt_shown, args.base_url, recorder))
+        output_mode = resolve_output_mode(args.output_mode)
+        if output_mode == 'tty':
+            manager = DialogStateManager(config_manager, fact_store)
+        else:
+            manager = StreamDialog(output_mode, config_manager, fact_store)
+        metrics = MetricsRegistry(config_manager.get_metrics_config())
+        # From here on errors are drawn by the renderer instead of printed over the UI
+        route_console(manager.show_error, asyncio.get_running_loop())
         history = DialogueHistory()
+        session_store = open_session(
+            config_manager.get_sessions_config(), args, history, history_config['budget_tokens']
+        )
+        compactor = HistoryCompactor(
+            history,
+            lambda summary, messages: summarize_history(
+                provider_task.result(), config_manager.get_model_config(), config_manager.get_provider_config(),
+                summary, messages
+            ),
+            history_config['budget_tokens'],
+            on_compacted=lambda h: session_store.append_summary(h.offset, h.summary) if session_store else None
+        )
+        # Items of the turn being answered, stored only once the turn completes
+        turn_items: List[Item] = []
+        if session_store:
+            manager.item_listeners.append(turn_items.append)
+
+        def restart_turn() -> None:
+            # The new attempt is parsed from its start, items of the broken one don't count
+            turn_items.clear()
+            manager.restart_response()
+
+        def apply_config_change(snapshot: ConfigSnapshot, changed: Set[str]) -> None:
+            # Model, language, temperature and retry settings are read from the snapshot on every turn
+            if 'api_key' in changed and snapshot.api_key and provider_task.done() and not provider_task.exception():
+                provider_task.result().set_api_key(snapshot.api_key)
+            if 'user_context' in changed:
+                fact_store.reload(snapshot.user_context['file'])
+            prompt_builder.cache_enabled = snapshot.prompt_cache['enabled']
+            compactor.budget_tokens = snapshot.history['budget_tokens']
 
-        manager.sound_manager.play_startup()
+        config_manager.add_listener(apply_config_change)
+        config_manager.start_watching()
+
+        def prompt_ready() -> None:
+            startup.mark('time to prompt')
+            prompt_shown.set()
+            startup.prewarm()
+            if args.startup_report:
+                get_app().exit(exception=EOFError)
+            else:
+                manager.sound_manager.play_startup()
+
+        manager.on_prompt = prompt_ready
+
+        warmup: Optional[asyncio.Future] = None
+        if cache_config['enabled'] and cache_config['warmup'] and not args.startup_report:
+            # Runs while the user is typing the first message
+            warmup = asyncio.ensure_future(
+                warm_up_cache(provider_task, model_config, prompt_builder.build_system())
+            )
 
         while config_manager.YOUR_CODE_BETRAYS_YOUR_DEGENERACY:
             try:
@@ -38,50 +316,149 @@ async def main():
 
                 if user_input is None:
                     continue
+                if user_input.strip() in COMMANDS:
+                    manager.show_notice(metrics.report())
+                    continue
 
+                provider = await provider_task
                 history.add_message("user", user_input)
+                # Items belong to the user message that is being answered
+                user_seq = history.next_seq() - 1
+                turn_items.clear()
 
-                current_datetime = get_formatted_datetime()
-                language_instruction = "You communicate in Russian." if config_manager.get_language() == 'ru' else "You communicate in English."
-                final_prompt = f"Current date and time: {current_datetime}\n\n{language_instruction}\n\n" + base_prompt
+                model_config = config_manager.get_model_config()
+                history_config = config_manager.get_history_config()
+                context_config = config_manager.get_user_context_config()
 
-                if user_context:
-                    final_prompt = f"{user_context}\n\n" + final_prompt
+                facts = None
+                if context_config['enabled']:
+                    facts = fact_store.search(user_input, context_config['top_k'], context_config['max_tokens'])
+                volatile = prompt_builder.build_volatile(get_formatted_datetime(), config_manager.get_language(), facts)
+                system, messages, estimated_tokens = await build_request(
+                    provider, prompt_builder, history, model_config, history_config, volatile
+                )
 
-                with client.messages.stream(
+                turn = asyncio.ensure_future(stream_response(
+                    provider,
+                    manager,
+                    config_manager.get_provider_config(),
+                    restart_turn,
                     model=model_config['name'],
                     max_tokens=model_config['max_tokens'],
                     temperature=model_config['temperature'],
-                    system=final_prompt,
-                    messages=[msg for msg in history.get_messages() if msg["role"] != "system"]
-                ) as stream:
-                    response_content = ""
-                    for chunk in stream:
-                        if chunk.type == "content_block_delta":
-                            delta = chunk.delta.text
-                            response_content += delta
-                            await manager.process_response_chunk(delta)
-
-                history.add_message("assistant", response_content)
+                    system=system,
+                    messages=messages
+                ))
+                with cancel_on_interrupt(turn) as interrupt:
+                    # Ctrl-C on CONTINUE cancels the generation the same way as during streaming
+                    manager.begin_response(on_interrupt=interrupt.trigger)
+                    try:
+                        completion = await turn
+                    except asyncio.CancelledError:
+                        if not interrupt.triggered:
+                            raise
+                        logger.info("Generation interrupted, back to the prompt.")
+                        manager.abort_response()
+                        # Keep user/assistant turns alternating
+                        history.pop_message()
+                        continue
+
+                history.add_message("assistant", completion.text)
+                if session_store:
+                    seq = history.next_seq()
+                    session_store.append_message(seq - 2, "user", user_input)
+                    session_store.append_message(seq - 1, "assistant", completion.text)
+                if completion.attempts == 1:
+                    # A resumed response also paid for its prefill, the count would be off
+                    history.calibrate(estimated_tokens, completion.usage.prompt_tokens)
+                compactor.maybe_compact()
                 await manager.finish_response()
+                if session_store:
+                    # Written after the messages, an interrupted or failed turn leaves none behind
+                    for item in turn_items:
+                        session_store.append_item(user_seq, item)
+                turn_items.clear()
+                metrics.record(
+                    manager.turn_timer.values(completion.usage),
+                    model=model_config['name'], provider=provider.name, attempts=completion.attempts
+                )
 
             except (EOFError, KeyboardInterrupt):
                 logger.info("Leave without comment. [Leave.]")
                 break
             except Exception as e:
-                logger.error(f"Check failure: {e}")
+                logger.error("Check failure: %s", e)
+                manager.abort_response()
+                if history.messages and history.messages[-1]['role'] == 'user':
+                    # The turn is lost, keep user/assistant turns alternating
+                    history.pop_message()
                 continue
 
     except (KeyboardInterrupt, EOFError):
         logger.info("Leave without comment. [Leave.]")
     except Exception as e:
-        logger.error(f"Check failure: {e}")
+        logger.error("Check failure: %s", e)
     finally:
         logger.info("Cuno doesn't fucking care.")
+        release_console()
         try:
+            config_manager.stop_watching()
+            compactor.cancel()
+            if warmup is not None:
+                # Still waiting for the provider when the user leaves right away
+                warmup.cancel()
+            metrics.close()
+            fact_store.close()
+            if session_store:
+                session_store.close()
             manager.sound_manager.cleanup()
+            if provider_task.done() and not provider_task.cancelled() and not provider_task.exception():
+                await provider_task.result().close()
+            else:
+                provider_task.cancel()
         except Exception as e:
-            logger.error(f"Check failure: {e}")
+            logger.error("Check failure: %s", e)
+        if args.startup_report:
+            startup.join()
+            print(startup.report())
+
+async def run_server(args: argparse.Namespace) -> None:
+    setup_logging(args.log_format)
+    logger = logging.getLogger(__name__)
+    config_manager = ConfigManager()
+    server_config = config_manager.get_server_config()
+    port = args.port if args.port is not None else server_config['port']
+    provider = None
+    try:
+        if args.workers > 1:
+            await WorkerPool(config_manager, args.workers, args.log_format, args.base_url).serve(server_config['host'], port)
+            return
+
+        # All sessions share this provider, so its pool is sized for the server
+        provider = open_provider(config_manager, args.base_url, max_connections=server_config['model_connections'])
+
+        def on_config_change(snapshot: ConfigSnapshot, changed: Set[str]) -> None:
+            if 'api_key' in changed and snapshot.api_key:
+                provider.set_api_key(snapshot.api_key)
+
+        config_manager.add_listener(on_config_change)
+        config_manager.start_watching()
+        await DialogueServer(provider, config_manager).serve(server_config['host'], port)
+    except Exception as e:
+        logger.error("Check failure: %s", e)
+    finally:
+        config_manager.stop_watching()
+        if provider is not None:
+            await provider.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    if args.serve:
+        try:
+            asyncio.run(run_server(args))
+        except KeyboardInterrupt:
+            pass
+    elif args.batch:
+        sys.exit(asyncio.run(run_batch(args)))
+    else:
+        asyncio.run(main(args))
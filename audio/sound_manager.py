@@ -1,62 +1,187 @@
 from pathlib import Path
-import pygame
+import hashlib
 import logging
-from typing import Dict
+import mmap
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from config.constants import CATEGORY_SOUNDS
 
-class SoundManager:
-    def __init__(self):
+# Sound effects by key, relative to audio/source
+SOUND_FILES: Dict[str, str] = {
+    'startup': 'switch-04.wav',
+    'click': 'dialogue-click.wav',
+    'FYS': 'interface-skill-passiveFYS-03-01.wav',
+    'INT': 'interface-skill-passiveINT-04-01.wav',
+    'MOT': 'interface-skill-passiveMOT-04-01.wav',
+    'PSY': 'interface-skill-passivePSY-04-02.wav'
+}
+
+# Sounds requested while the engine was still starting are dropped once they are this old
+MAX_SOUND_DELAY = 0.5
+
+
+class _NullBackend:
+    """Used when sound is disabled or there is no audio device."""
+
+    def play(self, key: str) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class _PygameBackend:
+    """pygame mixer with sounds loaded from a cache of decoded PCM.
+
+    Each WAV file is decoded once into the mixer's sample format and written
+    to `cache_dir`; later launches map the cached file instead of decoding.
+    """
+
+    def __init__(self, pygame: Any, sfx_path: Path, cache_dir: Optional[Path]):
         self._logger = logging.getLogger(__name__)
+        self._pygame = pygame
+        self._maps: List[mmap.mmap] = []
+        self.sounds: Dict[str, Any] = {}
+
         pygame.mixer.init()
+        mixer_format = pygame.mixer.get_init()
+        for key, name in SOUND_FILES.items():
+            try:
+                self.sounds[key] = self._load(sfx_path / name, cache_dir, mixer_format)
+            except Exception as e:
+                self._logger.error("Check failure: Failed to load sound effect %s: %s", name, e)
+        self._logger.info("Sound effects loaded: %s of %s", len(self.sounds), len(SOUND_FILES))
+
+    def _cache_path(self, source: Path, cache_dir: Path, mixer_format: Tuple[int, int, int]) -> Path:
+        stat = source.stat()
+        key = f"{source.resolve()}:{stat.st_mtime_ns}:{stat.st_size}:{mixer_format}"
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        return cache_dir / f"{source.stem}-{digest}.pcm"
+
+    def _load(self, source: Path, cache_dir: Optional[Path], mixer_format: Tuple[int, int, int]) -> Any:
+        if cache_dir is None:
+            return self._pygame.mixer.Sound(str(source))
+
+        cached = self._cache_path(source, cache_dir, mixer_format)
+        if not cached.exists():
+            raw = self._pygame.mixer.Sound(str(source)).get_raw()
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            partial = cached.with_suffix('.tmp')
+            with open(partial, 'wb') as f:
+                f.write(raw)
+            os.replace(partial, cached)
+
+        with open(cached, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(data)
+        return self._pygame.mixer.Sound(buffer=data)
+
+    def play(self, key: str) -> None:
+        sound = self.sounds.get(key)
+        if sound is not None:
+            sound.play()
+
+    def close(self) -> None:
+        self._pygame.mixer.quit()
+        self.sounds.clear()
+        for data in self._maps:
+            data.close()
+        self._maps.clear()
 
+
+class SoundManager:
+    """Plays the interface sounds from a background thread.
+
+    The mixer is initialised and the sounds are loaded on that thread, so
+    neither startup nor the event loop ever waits for the audio device. Play
+    calls only enqueue the sound. Without an audio device, or with sound
+    disabled in the config, a no-op backend is used.
+    """
+
+    def __init__(self, config_manager=None):
+        self._logger = logging.getLogger(__name__)
         self.sfx_path = Path(__file__).parent / 'source'
-        self.sounds: Dict[str, pygame.mixer.Sound] = {}
+        self.enabled = True
+        self.cache_dir: Optional[Path] = None
+        if config_manager:
+            self._apply_config(config_manager.snapshot)
+            config_manager.add_listener(lambda snapshot, changed: self._apply_config(snapshot))
 
+        self._requests: "queue.SimpleQueue[Optional[Tuple[str, Optional[float]]]]" = queue.SimpleQueue()
+        self._backend: Any = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _apply_config(self, snapshot) -> None:
+        self.enabled = snapshot.sound['enabled']
+        self.cache_dir = Path(snapshot.sound['cache_dir']) if snapshot.sound['cache_dir'] else None
+
+    def start(self) -> None:
+        """Starts the sound thread; called once the prompt is up, or by the first play call."""
+        with self._lock:
+            if self._thread is None and self.enabled:
+                self._thread = threading.Thread(target=self._run, name="sound", daemon=True)
+                self._thread.start()
+
+    def _create_backend(self) -> Any:
         try:
-            self.sounds['startup'] = pygame.mixer.Sound(str(self.sfx_path / 'switch-04.wav'))
-            self.sounds['click'] = pygame.mixer.Sound(str(self.sfx_path / 'dialogue-click.wav'))
-            self.sounds['FYS'] = pygame.mixer.Sound(str(self.sfx_path / 'interface-skill-passiveFYS-03-01.wav'))
-            self.sounds['INT'] = pygame.mixer.Sound(str(self.sfx_path / 'interface-skill-passiveINT-04-01.wav'))
-            self.sounds['MOT'] = pygame.mixer.Sound(str(self.sfx_path / 'interface-skill-passiveMOT-04-01.wav'))
-            self.sounds['PSY'] = pygame.mixer.Sound(str(self.sfx_path / 'interface-skill-passivePSY-04-02.wav'))
-            self._logger.info("Sound effects loaded successfully")
+            os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+            import pygame
+            started = time.perf_counter()
+            backend = _PygameBackend(pygame, self.sfx_path, self.cache_dir)
+            self._logger.debug("Sound engine ready in %.1f ms", (time.perf_counter() - started) * 1000)
+            return backend
         except Exception as e:
-            self._logger.error(f"Check failure: Failed to load sound effects: {e}")
+            self._logger.warning("Sound disabled, no audio device available: %s", e)
+            return _NullBackend()
+
+    def _run(self) -> None:
+        self._backend = self._create_backend()
+        while True:
+            request = self._requests.get()
+            if request is None:
+                break
+
+            key, deadline = request
+            if not self.enabled or (deadline is not None and time.monotonic() > deadline):
+                continue
+            try:
+                self._backend.play(key)
+                self._logger.debug("Playing sound: %s", key)
+            except Exception as e:
+                self._logger.error("Check failure: Failed to play sound %s: %s", key, e)
+
+    def _play(self, key: str, timely: bool = True) -> None:
+        if not self.enabled:
+            return
+        if self._thread is None:
+            self.start()
+        self._requests.put((key, time.monotonic() + MAX_SOUND_DELAY if timely else None))
 
     def play_startup(self) -> None:
-        try:
-            if 'startup' in self.sounds:
-                self.sounds['startup'].play()
-                self._logger.debug("Playing startup sound")
-        except Exception as e:
-            self._logger.error(f"Check failure: Failed to play startup sound: {e}")
+        # Played whenever the engine is ready, however long that takes
+        self._play('startup', timely=False)
 
     def play_skill_sound(self, category: str) -> None:
-        try:
-            category_to_sound = {
-                'INTELLECT': 'INT',
-                'PSYCHE': 'PSY',
-                'PHYSIQUE': 'FYS',
-                'MOTORICS': 'MOT'
-            }
-
-            sound_key = category_to_sound.get(category)
-            if sound_key and sound_key in self.sounds:
-                self.sounds[sound_key].play()
-                self._logger.debug(f"Playing sound for category: {category}")
-        except Exception as e:
-            self._logger.error(f"Check failure: Failed to play skill sound: {e}")
+        sound_key = CATEGORY_SOUNDS.get(category)
+        if sound_key:
+            self._play(sound_key)
 
     def play_click(self) -> None:
-        try:
-            if 'click' in self.sounds:
-                self.sounds['click'].play()
-                self._logger.debug("Playing click sound")
-        except Exception as e:
-            self._logger.error(f"Check failure: Failed to play click sound: {e}")
+        self._play('click')
 
     def cleanup(self) -> None:
         try:
-            pygame.mixer.quit()
-            self._logger.info("Sound system cleaned up")
+            if self._thread is None:
+                return
+            self._requests.put(None)
+            # An audio device that hangs on init must not keep the app from exiting
+            self._thread.join(timeout=1)
+            if not self._thread.is_alive() and self._backend is not None:
+                self._backend.close()
+                self._logger.info("Sound system cleaned up")
         except Exception as e:
-            self._logger.error(f"Check failure: Error cleaning up sound system: {e}")
+            self._logger.error("Check failure: Error cleaning up sound system: %s", e)
@@ -0,0 +1,260 @@
+"""Local stand-in for the Anthropic Messages API that replays recorded streams.
+
+Serves POST /v1/messages (streaming over SSE, or as a single message) and
+POST /v1/messages/count_tokens over plain HTTP/1.1 with keep-alive, plus
+POST /v1/chat/completions with the same content for the openai provider.
+Each request gets the next recording from --recordings, in order and
+wrapping around, replayed with the recorded inter-arrival times divided by
+--speed, after --latency seconds and with up to --jitter seconds of random
+delay per event. Without recordings, synthetic responses full of skill
+checks are streamed instead.
+
+With --fail-rate, that share of the responses fails: half of them with a
+529 overloaded error, the other half by dropping the connection halfway
+through the stream, to exercise retries and resuming.
+
+    python -m benchmarks.fake_anthropic --recordings recordings/ --speed 4
+    python3 . --base-url http://127.0.0.1:8765
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.xml_processor_bench import make_tagged_stream
+from storage.recordings import load_recording, recording_paths, text_deltas
+
+Events = List[Tuple[float, Dict[str, Any]]]
+
+# Synthetic streams: characters per delta and seconds between deltas
+SYNTHETIC_DELTA_SIZE = 12
+SYNTHETIC_INTERVAL = 0.02
+
+
+def synthetic_events(text: str, model: str) -> Events:
+    message = {
+        'id': f"msg_{uuid.uuid4().hex[:24]}", 'type': 'message', 'role': 'assistant', 'model': model,
+        'content': [], 'stop_reason': None, 'stop_sequence': None,
+        'usage': {'input_tokens': 100, 'output_tokens': 1}
+    }
+    events: Events = [
+        (0.0, {'type': 'message_start', 'message': message}),
+        (0.0, {'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}})
+    ]
+    for i in range(0, len(text), SYNTHETIC_DELTA_SIZE):
+        delta = {'type': 'text_delta', 'text': text[i:i + SYNTHETIC_DELTA_SIZE]}
+        events.append((SYNTHETIC_INTERVAL, {'type': 'content_block_delta', 'index': 0, 'delta': delta}))
+    events += [
+        (0.0, {'type': 'content_block_stop', 'index': 0}),
+        (0.0, {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+               'usage': {'output_tokens': len(text) // 4}}),
+        (0.0, {'type': 'message_stop'})
+    ]
+    return events
+
+
+def final_message(events: Events) -> Dict[str, Any]:
+    """The non-streaming response equivalent to a recorded stream."""
+    message: Dict[str, Any] = {}
+    for _, event in events:
+        if event['type'] == 'message_start':
+            message = dict(event['message'])
+        elif event['type'] == 'message_delta':
+            message.update(event['delta'])
+            message['usage'] = {**message.get('usage', {}), **event.get('usage', {})}
+    message['content'] = [{'type': 'text', 'text': ''.join(text_deltas(events))}]
+    return message
+
+
+def sse(timed: Tuple[float, Dict[str, Any]]) -> Tuple[float, str]:
+    delay, event = timed
+    return delay, f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def chat_usage(events: Events) -> Dict[str, int]:
+    usage = final_message(events).get('usage', {})
+    prompt = usage.get('input_tokens', 0)
+    completion = usage.get('output_tokens', 0)
+    return {'prompt_tokens': prompt, 'completion_tokens': completion, 'total_tokens': prompt + completion}
+
+
+def chat_chunks(events: Events, model: str) -> Events:
+    """The recorded stream as Chat Completions chunks."""
+    base = {'id': f"chatcmpl-{uuid.uuid4().hex[:24]}", 'object': 'chat.completion.chunk', 'model': model}
+    chunks: Events = []
+    delay = 0.0
+    for event_delay, event in events:
+        delay += event_delay
+        if event['type'] == 'content_block_delta' and event['delta'].get('type') == 'text_delta':
+            delta = {'content': event['delta']['text']}
+            chunks.append((delay, {**base, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]}))
+            delay = 0.0
+    chunks.append((delay, {**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}))
+    chunks.append((0.0, {**base, 'choices': [], 'usage': chat_usage(events)}))
+    return chunks
+
+
+def chat_completion(events: Events, model: str) -> Dict[str, Any]:
+    message = {'role': 'assistant', 'content': ''.join(text_deltas(events))}
+    return {
+        'id': f"chatcmpl-{uuid.uuid4().hex[:24]}", 'object': 'chat.completion', 'model': model,
+        'choices': [{'index': 0, 'message': message, 'finish_reason': 'stop'}],
+        'usage': chat_usage(events)
+    }
+
+
+class FakeAnthropic:
+    def __init__(
+        self, recordings: List[Events], speed: float, latency: float, jitter: float,
+        seed: int = 0, fail_rate: float = 0.0
+    ):
+        self._logger = logging.getLogger(__name__)
+        self._recordings = itertools.cycle(recordings) if recordings else None
+        self.speed = speed
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self._rng = random.Random(seed)
+        self._requests = 0
+
+    def _next_events(self, model: str) -> Events:
+        self._requests += 1
+        if self._recordings is not None:
+            return next(self._recordings)
+        return synthetic_events(make_tagged_stream(2048, seed=self._requests), model)
+
+    def _delay(self, recorded: float) -> float:
+        delay = recorded / self.speed if self.speed > 0 else 0.0
+        return delay + (self._rng.uniform(0, self.jitter) if self.jitter > 0 else 0.0)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                await self._respond(writer, method, path, body)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        method, path, _ = line.decode('latin-1').split(' ', 2)
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+        return method, path.split('?', 1)[0], headers, body
+
+    def _failure(self) -> Optional[str]:
+        if self.fail_rate <= 0 or self._rng.random() >= self.fail_rate:
+            return None
+        return self._rng.choice(('overloaded', 'drop'))
+
+    async def _respond(self, writer: asyncio.StreamWriter, method: str, path: str, body: bytes) -> None:
+        payload = json.loads(body or b'{}')
+        stream = bool(payload.get('stream'))
+        failure = self._failure() if path in ('/v1/messages', '/v1/chat/completions') else None
+        self._logger.info("%s %s stream=%s failure=%s", method, path, stream, failure)
+        if failure == 'overloaded' or (failure and not stream):
+            error = {'type': 'error', 'error': {'type': 'overloaded_error', 'message': 'Overloaded'}}
+            self._send_json(writer, 529, error)
+        elif method == 'POST' and path == '/v1/messages/count_tokens':
+            self._send_json(writer, 200, {'input_tokens': len(body) // 4})
+        elif method == 'POST' and path == '/v1/messages':
+            events = self._next_events(payload.get('model', 'fake'))
+            if stream:
+                await self._stream(writer, [sse(event) for event in self._timed(events)], failure == 'drop')
+            else:
+                await asyncio.sleep(self.latency + sum(self._delay(delay) for delay, _ in events))
+                self._send_json(writer, 200, final_message(events))
+        elif method == 'POST' and path == '/v1/chat/completions':
+            events = self._next_events(payload.get('model', 'fake'))
+            if stream:
+                chunks = chat_chunks(events, payload.get('model', 'fake'))
+                await self._stream(writer, [(delay, f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+                                            for delay, chunk in self._timed(chunks)] + [(0.0, "data: [DONE]\n\n")],
+                                   failure == 'drop')
+            else:
+                await asyncio.sleep(self.latency + sum(self._delay(delay) for delay, _ in events))
+                self._send_json(writer, 200, chat_completion(events, payload.get('model', 'fake')))
+        else:
+            self._send_json(writer, 404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': path}})
+        await writer.drain()
+
+    def _send_json(self, writer: asyncio.StreamWriter, status: int, data: Dict[str, Any]) -> None:
+        body = json.dumps(data).encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            f"content-type: application/json\r\ncontent-length: {len(body)}\r\n"
+            f"request-id: req_{uuid.uuid4().hex[:16]}\r\n\r\n".encode('latin-1') + body
+        )
+
+    def _timed(self, events: List[Tuple[float, Any]]) -> List[Tuple[float, Any]]:
+        return [(self._delay(delay), event) for delay, event in events]
+
+    async def _stream(self, writer: asyncio.StreamWriter, messages: List[Tuple[float, str]], drop: bool = False) -> None:
+        writer.write(
+            b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\ncache-control: no-cache\r\n"
+            b"transfer-encoding: chunked\r\n\r\n"
+        )
+        await asyncio.sleep(self.latency)
+        cut = len(messages) // 2 if drop else None
+        for index, (wait, message) in enumerate(messages):
+            if index == cut:
+                await writer.drain()
+                writer.transport.abort()
+                raise ConnectionResetError("Dropped on purpose")
+            if wait > 0:
+                await writer.drain()
+                await asyncio.sleep(wait)
+            data = message.encode('utf-8')
+            writer.write(f"{len(data):x}\r\n".encode('latin-1') + data + b"\r\n")
+        writer.write(b"0\r\n\r\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--recordings', metavar='PATH', help="Recorded turn file, or a directory of them")
+    parser.add_argument('--speed', type=float, default=1.0, help="Replay speed factor, 0 for no delays at all")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds before the first event")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Up to this many extra seconds per event")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Share of responses that fail, from 0 to 1")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    recordings = [load_recording(path)[1] for path in recording_paths(args.recordings)] if args.recordings else []
+    server = FakeAnthropic(recordings, args.speed, args.latency, args.jitter, args.seed, args.fail_rate)
+
+    async def serve() -> None:
+        listener = await asyncio.start_server(server.handle, args.host, args.port)
+        print(f"Serving {len(recordings) or 'synthetic'} recordings on http://{args.host}:{args.port}")
+        async with listener:
+            await listener.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""End-to-end benchmark of the response pipeline, without a terminal or audio.
+
+Streams of text deltas go through XMLStreamProcessor on its own and through
+DialogStateManager (processor, presenter and DialogRenderer) with a null
+terminal, the sound backend disabled and CONTINUE answered automatically.
+For each scenario it reports events/s, per-chunk latency percentiles and
+peak traced memory. The processor stage counts every event it yields,
+streaming starts and deltas included; the pipeline stage counts finished
+skill checks and context updates. Live checks are redrawn after every
+chunk, without the frame cap, so their numbers are a worst case.
+
+    python -m benchmarks.pipeline_bench --save baseline.json
+    python -m benchmarks.pipeline_bench --compare baseline.json
+
+A comparison run exits with status 1 if any scenario's throughput (the
+fastest of --repeat runs) or peak memory got worse than the baseline by
+more than --tolerance. Latency percentiles are reported but not compared:
+single chunks are too short to time steadily, and their p95 moved by over
+a third between runs of an unchanged tree. Throughput moved by up to 40%
+on a shared CPU, hence the default tolerance of 50%; on a quiet machine a
+lower one catches smaller regressions. benchmarks/pipeline_baseline.json
+is a reference run with the default options; the machine it ran on is
+stored with it, and timings only compare between similar machines, so on
+another one save a baseline of your own from a clean checkout first.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from blessed import Terminal
+from rich.console import Console
+from benchmarks.xml_processor_bench import make_tagged_stream, make_untagged_stream, chunked
+from processors.xml_processor import XMLStreamProcessor
+from storage.recordings import load_recording, text_deltas
+import ui.state_manager
+from ui.state_manager import DialogStateManager
+
+WIDTH = 100
+RU_SKILLS = ['Логика', 'Внутренняя империя', 'Сила воли', 'Электрохимия', 'Трепет', 'Восприятие', 'Драма']
+RU_WORDS = ['город', 'дождь', 'коп', 'детектив', 'ревашоль', 'галстук', 'диско', 'гавань', 'и', 'ночь']
+
+
+class NullFile:
+    """Terminal stand-in that accepts and drops everything written to it."""
+
+    def write(self, data: str) -> int:
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def isatty(self) -> bool:
+        return True
+
+
+def make_cyrillic_stream(size: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts: List[str] = []
+    total = 0
+    while total < size:
+        words = ' '.join(rng.choice(RU_WORDS) for _ in range(rng.randint(20, 120)))
+        part = f'<skill name="{rng.choice(RU_SKILLS)}" difficulty="Средне" success="true">{words}</skill>\n'
+        parts.append(part)
+        total += len(part)
+    return ''.join(parts)
+
+
+def varied_chunks(text: str, seed: int = 0, smallest: int = 1, largest: int = 64) -> List[str]:
+    rng = random.Random(seed)
+    chunks: List[str] = []
+    pos = 0
+    while pos < len(text):
+        size = rng.randint(smallest, largest)
+        chunks.append(text[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def load_deltas(path: str) -> List[str]:
+    """A recorded turn (see storage.recordings) or a JSON list of text deltas."""
+    if path.endswith('.jsonl'):
+        return list(text_deltas(load_recording(path)[1]))
+    with open(path, 'r', encoding='utf-8') as f:
+        return [str(delta) for delta in json.load(f)]
+
+
+def make_manager(language: str, streaming: bool) -> DialogStateManager:
+    manager = DialogStateManager()
+    manager.sound_manager.enabled = False
+
+    async def auto_continue(*args, **kwargs) -> str:
+        return ""
+
+    manager.session.prompt_async = auto_continue
+    renderer = manager.renderer
+    renderer.console = Console(file=NullFile(), width=WIDTH, force_terminal=True, color_system='truecolor')
+    renderer.term = Terminal(kind='xterm-256color', stream=NullFile(), force_styling=True)
+    renderer.locale.set_language(language)
+    manager.processor.streaming = streaming
+    return manager
+
+
+async def run_pipeline(chunks: List[str], language: str, streaming: bool) -> Dict[str, object]:
+    manager = make_manager(language, streaming)
+    events = 0
+
+    def count(item) -> None:
+        nonlocal events
+        events += 1
+
+    manager.item_listeners.append(count)
+    latencies: List[float] = []
+    manager.begin_response()
+    started = time.perf_counter()
+    for chunk in chunks:
+        chunk_started = time.perf_counter()
+        await manager.process_response_chunk(chunk)
+        # One loop turn, so the redraws caused by this chunk are counted with it
+        await asyncio.sleep(0)
+        latencies.append(time.perf_counter() - chunk_started)
+    await manager.finish_response()
+    return {'seconds': time.perf_counter() - started, 'events': events, 'latencies': latencies}
+
+
+def run_processor(chunks: List[str], language: str, streaming: bool) -> Dict[str, object]:
+    processor = XMLStreamProcessor(streaming)
+    events = 0
+    latencies: List[float] = []
+    started = time.perf_counter()
+    for chunk in chunks:
+        chunk_started = time.perf_counter()
+        for item in processor.process_stream(chunk):
+            if item:
+                events += 1
+        latencies.append(time.perf_counter() - chunk_started)
+    events += len(processor.flush())
+    return {'seconds': time.perf_counter() - started, 'events': events, 'latencies': latencies}
+
+
+STAGES: Dict[str, Callable[[List[str], str, bool], Dict[str, object]]] = {
+    'processor': run_processor,
+    'pipeline': lambda chunks, language, streaming: asyncio.run(run_pipeline(chunks, language, streaming)),
+}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(stage: str, chunks: List[str], language: str, streaming: bool, repeat: int) -> Dict[str, float]:
+    runs = [STAGES[stage](chunks, language, streaming) for _ in range(repeat)]
+    best = min(runs, key=lambda run: run['seconds'])
+    latencies = [latency for run in runs for latency in run['latencies']]
+
+    # Separate run, tracing allocations slows everything down
+    tracemalloc.start()
+    STAGES[stage](chunks, language, streaming)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'events': best['events'],
+        'events_per_s': best['events'] / best['seconds'],
+        'p50_us': percentile(latencies, 0.50) * 1e6,
+        'p95_us': percentile(latencies, 0.95) * 1e6,
+        'p99_us': percentile(latencies, 0.99) * 1e6,
+        'max_us': max(latencies) * 1e6,
+        'peak_kb': peak / 1024,
+    }
+
+
+def build_scenarios(size: int, deltas: Optional[str]) -> Dict[str, tuple]:
+    """name -> (chunks, language, streaming)"""
+    tagged = make_tagged_stream(size)
+    scenarios = {
+        'tagged-16': (list(chunked(tagged, 16)), 'en', False),
+        'tagged-varied': (varied_chunks(tagged), 'en', False),
+        'tagged-live': (list(chunked(tagged, 16)), 'en', True),
+        'untagged': (list(chunked(make_untagged_stream(size), 16)), 'en', False),
+        'cyrillic': (varied_chunks(make_cyrillic_stream(size)), 'ru', True),
+    }
+    if deltas:
+        scenarios['recorded'] = (load_deltas(deltas), 'en', True)
+    return scenarios
+
+
+# metric -> True if higher is better; the latency percentiles are too noisy to gate on
+COMPARED = {'events_per_s': True, 'peak_kb': False}
+
+
+def environment(args: argparse.Namespace) -> Dict[str, object]:
+    return {
+        'python': platform.python_version(), 'machine': platform.machine(), 'system': platform.system(),
+        'cpus': os.cpu_count(), 'size_kb': args.size_kb, 'repeat': args.repeat
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    regressions: List[str] = []
+    for key, metrics in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            if metric not in base or base[metric] <= 0:
+                continue
+            change = metrics[metric] / base[metric] - 1
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{key} {metric}: {base[metric]:.1f} -> {metrics[metric]:.1f} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-kb', type=int, default=64, help="Size of each synthetic stream")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per scenario, the fastest one counts")
+    parser.add_argument('--deltas', metavar='FILE', help="Also run a recorded turn (.jsonl) or a JSON list of text deltas")
+    parser.add_argument('--only', metavar='NAME', action='append', help="Run only these scenarios")
+    parser.add_argument('--save', metavar='FILE', help="Store the results as a baseline")
+    parser.add_argument('--compare', metavar='FILE', help="Fail if the results regress against this baseline")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="Allowed regression, as a fraction")
+    args = parser.parse_args()
+
+    # The renderer measures wraps against the terminal width
+    os.environ['COLUMNS'] = str(WIDTH)
+    # Every redraw of a live check is part of the measurement
+    ui.state_manager.LIVE_FRAME_INTERVAL = 0
+
+    scenarios = build_scenarios(args.size_kb * 1024, args.deltas)
+    results: Dict[str, Dict[str, float]] = {}
+    print(f"{'scenario':<16}{'stage':<11}{'events':>8}{'events/s':>11}{'p50 us':>9}{'p95 us':>9}"
+          f"{'p99 us':>9}{'max us':>10}{'peak KB':>10}")
+    for name, (chunks, language, streaming) in scenarios.items():
+        if args.only and name not in args.only:
+            continue
+        for stage in STAGES:
+            metrics = measure(stage, chunks, language, streaming, args.repeat)
+            results[f"{name}/{stage}"] = metrics
+            print(f"{name:<16}{stage:<11}{metrics['events']:>8}{metrics['events_per_s']:>11.0f}"
+                  f"{metrics['p50_us']:>9.1f}{metrics['p95_us']:>9.1f}{metrics['p99_us']:>9.1f}"
+                  f"{metrics['max_us']:>10.1f}{metrics['peak_kb']:>10.0f}")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            # Not a scenario, so compare() never looks at it
+            json.dump({'_environment': environment(args), **results}, f, indent=2)
+        print(f"Baseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        reference = baseline.get('_environment')
+        if reference and reference != environment(args):
+            print(f"The baseline ran elsewhere ({reference}), timings may differ for that alone")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Load test for the session server (python3 . --serve).
+
+Starts benchmarks.fake_anthropic and the server as separate processes, the
+server with a copy of config/config.yml whose model connection pool is large
+enough for the biggest level. Then, for each concurrency level, runs that
+many clients for --duration seconds: each opens a session, sends messages
+back to back reading every event stream to the end, and closes the session.
+
+For each level it reports finished turns/s, events/s, time to the first
+event and to the end of the stream, errors, and the CPU share of the server
+processes (from /stats), of the fake API and of the load generator. Each
+server process runs one event loop, so a server CPU share near 100% per
+worker means its cores are saturated; the last line estimates how many
+concurrent streaming sessions one core can sustain.
+
+    python -m benchmarks.server_load --levels 25,50,100,200 --duration 20
+    python -m benchmarks.server_load --workers 4 --levels 100,200,400,800
+    python -m benchmarks.server_load --server http://127.0.0.1:8080
+
+With --server, an already running server is tested instead, and its
+server.model_connections should be at least the largest level.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import yaml
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+# Above this share of one core, a level doesn't count as sustained
+SUSTAINED_CPU = 0.9
+# Nor if its median turn takes this many times longer than at the lowest level
+SUSTAINED_SLOWDOWN = 1.25
+PROMPTS = ["Where is my gun?", "Who killed the man in the yard?", "Should I have another drink?"]
+
+
+def process_cpu_seconds(pid: int) -> Optional[float]:
+    """CPU time of another process, where /proc is available."""
+    try:
+        fields = Path(f"/proc/{pid}/stat").read_text().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime, fields 14 and 15 of the whole line
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Results:
+    def __init__(self):
+        self.turns = 0
+        self.errors = 0
+        self.events = 0
+        self.first_event_ms: List[float] = []
+        self.turn_ms: List[float] = []
+
+
+async def open_request(
+    host: str, port: int, method: str, path: str, data: Optional[Dict[str, Any]] = None
+) -> Tuple[int, asyncio.StreamReader, asyncio.StreamWriter]:
+    """Sends one request on a new connection and reads the response head; kept minimal so the clients stay cheap."""
+    reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps(data).encode('utf-8') if data is not None else b''
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nhost: {host}\r\ncontent-type: application/json\r\n"
+        f"content-length: {len(body)}\r\nconnection: close\r\n\r\n".encode('latin-1') + body
+    )
+    status = int((await reader.readline()).split()[1])
+    while (await reader.readline()) not in (b'\r\n', b''):
+        pass
+    return status, reader, writer
+
+
+async def call(host: str, port: int, method: str, path: str, data: Optional[Dict[str, Any]] = None) -> Any:
+    status, reader, writer = await open_request(host, port, method, path, data)
+    try:
+        body = await reader.read()
+    finally:
+        writer.close()
+    if status >= 300:
+        raise ConnectionError(f"{method} {path}: HTTP {status}")
+    return json.loads(body) if body else None
+
+
+async def run_client(host: str, port: int, deadline: float, results: Results, index: int) -> None:
+    try:
+        session_id = (await call(host, port, 'POST', '/sessions', {}))['id']
+    except (OSError, ValueError):
+        results.errors += 1
+        return
+
+    turn = 0
+    while time.perf_counter() < deadline:
+        text = PROMPTS[(index + turn) % len(PROMPTS)]
+        turn += 1
+        started = time.perf_counter()
+        first: Optional[float] = None
+        outcome = None
+        try:
+            status, reader, writer = await open_request(host, port, 'POST', f"/sessions/{session_id}/messages", {'text': text})
+            try:
+                while status == 200:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    if not line.startswith(b'event: '):
+                        continue
+                    if first is None:
+                        first = time.perf_counter()
+                    results.events += 1
+                    outcome = line[7:].strip()
+            finally:
+                writer.close()
+        except OSError:
+            outcome = None
+        if outcome != b'done':
+            results.errors += 1
+            continue
+        results.turns += 1
+        if first is not None:
+            results.first_event_ms.append((first - started) * 1000)
+        results.turn_ms.append((time.perf_counter() - started) * 1000)
+
+    try:
+        await call(host, port, 'DELETE', f"/sessions/{session_id}")
+    except (OSError, ValueError):
+        pass
+
+
+async def run_level(host: str, port: int, clients: int, duration: float, api_pid: Optional[int]) -> Dict[str, float]:
+    before = (await call(host, port, 'GET', '/stats'))['cpu_seconds']
+    api_before = process_cpu_seconds(api_pid) if api_pid else None
+    client_before = time.process_time()
+    started = time.perf_counter()
+    results = Results()
+    await asyncio.gather(*(run_client(host, port, started + duration, results, index) for index in range(clients)))
+    elapsed = time.perf_counter() - started
+    after = (await call(host, port, 'GET', '/stats'))['cpu_seconds']
+    api_after = process_cpu_seconds(api_pid) if api_pid else None
+
+    return {
+        'clients': clients,
+        'turns_per_s': results.turns / elapsed,
+        'events_per_s': results.events / elapsed,
+        'first_p50_ms': percentile(results.first_event_ms, 0.5),
+        'first_p99_ms': percentile(results.first_event_ms, 0.99),
+        'turn_p50_ms': statistics.median(results.turn_ms) if results.turn_ms else 0.0,
+        'errors': results.errors,
+        'server_cpu': (after - before) / elapsed,
+        'api_cpu': (api_after - api_before) / elapsed if api_before is not None and api_after is not None else -1.0,
+        'client_cpu': (time.process_time() - client_before) / elapsed
+    }
+
+
+async def wait_until_up(host: str, port: int, timeout: float = 30.0) -> None:
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            await call(host, port, 'GET', '/stats')
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"Server on {host}:{port} didn't come up")
+            await asyncio.sleep(0.2)
+
+
+def start_processes(args: argparse.Namespace, workdir: Path) -> List[subprocess.Popen]:
+    with open(REPO_ROOT / 'config' / 'config.yml', 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f) or {}
+    config['server'] = {**(config.get('server') or {}), 'model_connections': max(args.levels) + 16}
+    config['metrics'] = {**(config.get('metrics') or {}), 'enabled': False}
+    (workdir / 'config').mkdir()
+    with open(workdir / 'config' / 'config.yml', 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+
+    env = {**os.environ, 'ANTHROPIC_API_KEY': os.environ.get('ANTHROPIC_API_KEY') or 'fake', 'PYTHONPATH': str(REPO_ROOT)}
+    api = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.fake_anthropic', '--port', str(args.api_port), '--speed', str(args.speed)],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    # Run from the scratch directory, so it reads the config above and logs there
+    server = subprocess.Popen(
+        [sys.executable, str(REPO_ROOT), '--serve', '--port', str(args.port), '--workers', str(args.workers),
+         '--base-url', f"http://127.0.0.1:{args.api_port}"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return [api, server]
+
+
+async def run(args: argparse.Namespace, api_pid: Optional[int]) -> None:
+    url = urlsplit(args.server or f"http://127.0.0.1:{args.port}")
+    host, port = url.hostname or '127.0.0.1', url.port or 80
+    await wait_until_up(host, port)
+    workers = (await call(host, port, 'GET', '/stats')).get('workers', 1)
+    print(f"{'clients':>8}{'turns/s':>9}{'events/s':>10}{'first p50':>11}{'first p99':>11}{'turn p50':>10}"
+          f"{'errors':>8}{'server cpu':>12}{'api cpu':>9}{'client cpu':>12}")
+    sustained: Optional[Dict[str, float]] = None
+    baseline_turn_ms: Optional[float] = None
+    for clients in args.levels:
+        metrics = await run_level(host, port, clients, args.duration, api_pid)
+        api_cpu = f"{metrics['api_cpu']:.0%}" if metrics['api_cpu'] >= 0 else "-"
+        print(f"{clients:>8}{metrics['turns_per_s']:>9.1f}{metrics['events_per_s']:>10.0f}"
+              f"{metrics['first_p50_ms']:>9.0f}ms{metrics['first_p99_ms']:>9.0f}ms{metrics['turn_p50_ms']:>8.0f}ms"
+              f"{metrics['errors']:>8}{metrics['server_cpu']:>12.0%}{api_cpu:>9}{metrics['client_cpu']:>12.0%}")
+        if baseline_turn_ms is None:
+            baseline_turn_ms = metrics['turn_p50_ms']
+        # Sustained: no errors, CPU to spare and streams no slower than at the lowest level
+        if (metrics['errors'] == 0 and metrics['server_cpu'] < SUSTAINED_CPU * workers
+                and metrics['turn_p50_ms'] <= baseline_turn_ms * SUSTAINED_SLOWDOWN):
+            sustained = metrics
+        if metrics['client_cpu'] > SUSTAINED_CPU:
+            print("The load generator itself is near a full core, so the levels from here on are limited by it")
+
+    if sustained is None:
+        print(f"No level was sustained without errors, below {SUSTAINED_CPU:.0%} of a core per worker "
+              f"and within {SUSTAINED_SLOWDOWN}x of the lowest level's turn time")
+    else:
+        per_core = sustained['clients'] / max(sustained['server_cpu'], 1e-3)
+        print(f"Sustained {sustained['clients']} streaming sessions with {workers} workers at "
+              f"{sustained['server_cpu']:.0%} of a core; "
+              f"one core would carry about {per_core:.0f} at this stream rate")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--levels', type=lambda value: [int(level) for level in value.split(',')],
+                        default=[10, 50, 100, 200], help="Comma-separated numbers of concurrent clients")
+    parser.add_argument('--duration', type=float, default=15.0, help="Seconds per level")
+    parser.add_argument('--speed', type=float, default=1.0, help="Replay speed of the fake API, 1 is realistic pacing")
+    parser.add_argument('--server', metavar='URL', help="Test this running server instead of starting one")
+    parser.add_argument('--port', type=int, default=8767, help="Port for the server that is started")
+    parser.add_argument('--api-port', type=int, default=8766, help="Port for the fake API that is started")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes of the server that is started")
+    args = parser.parse_args()
+
+    processes: List[subprocess.Popen] = []
+    workdir = Path(tempfile.mkdtemp(prefix='server_load_'))
+    try:
+        if not args.server:
+            processes = start_processes(args, workdir)
+        asyncio.run(run(args, processes[0].pid if processes else None))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""How batch throughput scales with worker processes (python3 . --batch --workers N).
+
+Starts benchmarks.fake_anthropic, writes --conversations synthetic
+conversations and runs the same batch once per worker count, from a scratch
+directory with a copy of config/config.yml (metrics and the response cache
+off, so every turn is parsed from a fresh stream). With the fake API at
+--speed 0 the streams arrive as fast as they can be sent, so the run is
+bound by parsing and bookkeeping CPU, which is what more workers spread
+over more cores.
+
+For each worker count it reports the wall time, conversations and turns
+per second and the speedup over the first count. Speedup can't exceed the
+number of cores, printed on the first line, nor the share of one core the
+fake API leaves free.
+
+    python -m benchmarks.worker_scaling --workers 1,2,4 --conversations 400
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+import yaml
+
+from benchmarks.server_load import REPO_ROOT, PROMPTS
+
+
+def write_conversations(path: Path, count: int, turns: int) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        for index in range(count):
+            conversation = [PROMPTS[(index + turn) % len(PROMPTS)] for turn in range(turns)]
+            f.write(json.dumps({'id': f"c{index}", 'turns': conversation}) + "\n")
+
+
+def write_config(workdir: Path) -> None:
+    with open(REPO_ROOT / 'config' / 'config.yml', 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f) or {}
+    config['metrics'] = {**(config.get('metrics') or {}), 'enabled': False}
+    config['response_cache'] = {**(config.get('response_cache') or {}), 'enabled': False}
+    (workdir / 'config').mkdir()
+    with open(workdir / 'config' / 'config.yml', 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+
+
+def run_batch(args: argparse.Namespace, workdir: Path, workers: int, env: dict) -> float:
+    output = workdir / f"out.{workers}.jsonl"
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, str(REPO_ROOT), '--batch', 'in.jsonl', '--output', str(output),
+         '--workers', str(workers), '--concurrency', str(args.concurrency),
+         '--base-url', f"http://127.0.0.1:{args.api_port}"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False
+    )
+    elapsed = time.perf_counter() - started
+    with open(output, 'r', encoding='utf-8') as f:
+        done = sum(1 for line in f if json.loads(line)['type'] == 'done')
+    if done != args.conversations:
+        print(f"Only {done} of {args.conversations} conversations finished with {workers} workers")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=lambda value: [int(count) for count in value.split(',')],
+                        default=[1, 2, 4], help="Comma-separated numbers of worker processes")
+    parser.add_argument('--conversations', type=int, default=200, help="Conversations in the batch")
+    parser.add_argument('--turns', type=int, default=2, help="Turns per conversation")
+    parser.add_argument('--concurrency', type=int, default=16, help="Conversations in flight per worker")
+    parser.add_argument('--speed', type=float, default=0.0, help="Replay speed of the fake API, 0 is no pacing")
+    parser.add_argument('--api-port', type=int, default=8766, help="Port for the fake API that is started")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix='worker_scaling_'))
+    env = {**os.environ, 'ANTHROPIC_API_KEY': os.environ.get('ANTHROPIC_API_KEY') or 'fake', 'PYTHONPATH': str(REPO_ROOT)}
+    api = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.fake_anthropic', '--port', str(args.api_port), '--speed', str(args.speed)],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        write_config(workdir)
+        write_conversations(workdir / 'in.jsonl', args.conversations, args.turns)
+        # Let the fake API bind its port
+        time.sleep(1.0)
+        print(f"{os.cpu_count()} cores, {args.conversations} conversations of {args.turns} turns")
+        print(f"{'workers':>8}{'seconds':>9}{'conv/s':>9}{'turns/s':>9}{'speedup':>9}")
+        baseline: List[float] = []
+        for workers in args.workers:
+            elapsed = run_batch(args, workdir, workers, env)
+            baseline = baseline or [elapsed]
+            print(f"{workers:>8}{elapsed:>9.2f}{args.conversations / elapsed:>9.1f}"
+                  f"{args.conversations * args.turns / elapsed:>9.1f}{baseline[0] / elapsed:>8.2f}x")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.terminate()
+        api.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Micro-benchmark for XMLStreamProcessor.
+
+Feeds multi-megabyte synthetic responses through the single-pass tokenizer
+and through the previous find/slice implementation and prints the timings.
+
+    python -m benchmarks.xml_processor_bench --size-mb 4 --chunk-size 16
+"""
+import argparse
+import random
+import time
+import xml.etree.ElementTree as ET
+from typing import Callable, Iterable, List
+
+from processors.xml_processor import XMLStreamProcessor
+
+SKILLS = ['Logic', 'Inland Empire', 'Volition', 'Electrochemistry', 'Shivers', 'Perception', 'Драма']
+WORDS = ['the', 'city', 'rain', 'коп', 'детектив', 'revachol', 'tie', 'disco', 'harbour', 'и', 'ночь']
+
+
+class LegacyXMLStreamProcessor(XMLStreamProcessor):
+    """The buffer-and-find implementation this benchmark compares against."""
+
+    def __init__(self):
+        super().__init__()
+        self.legacy_buffer = ""
+
+    def process_stream(self, chunk):
+        self.legacy_buffer += str(chunk)
+
+        while True:
+            start = self.legacy_buffer.find("<skill")
+            if start != -1:
+                end = self.legacy_buffer.find("</skill>", start)
+                if end != -1:
+                    end += len("</skill>")
+                    complete_tag = self.legacy_buffer[start:end]
+                    try:
+                        skill_check = self._parse_skill_check(complete_tag)
+                        if skill_check:
+                            yield skill_check
+                        self.legacy_buffer = self.legacy_buffer[end:]
+                        continue
+                    except ET.ParseError:
+                        break
+
+            start = self.legacy_buffer.find("<context_update")
+            if start != -1:
+                end = self.legacy_buffer.find("</context_update>", start)
+                if end != -1:
+                    end += len("</context_update>")
+                    complete_tag = self.legacy_buffer[start:end]
+                    try:
+                        context_update = self._parse_context_update(complete_tag)
+                        if context_update:
+                            yield context_update
+                        self.legacy_buffer = self.legacy_buffer[end:]
+                        continue
+                    except ET.ParseError:
+                        break
+
+            break
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def make_tagged_stream(size: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts: List[str] = []
+    total = 0
+    while total < size:
+        if rng.random() < 0.1:
+            part = f"<context_update>{_words(rng, 12)}</context_update>\n"
+        else:
+            part = (
+                f'<skill name="{rng.choice(SKILLS)}" difficulty="Medium" '
+                f'success="{str(rng.random() < 0.5).lower()}">{_words(rng, rng.randint(20, 120))}</skill>\n'
+            )
+        parts.append(part)
+        total += len(part)
+    return ''.join(parts)
+
+
+def make_untagged_stream(size: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    # A few checks up front, then a long tail of prose the model wrote outside of tags
+    head = make_tagged_stream(4096, seed)
+    tail = _words(rng, max(0, size - len(head)) // 6)
+    return head + tail
+
+
+def make_malformed_stream(size: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts: List[str] = []
+    total = 0
+    while total < size:
+        if rng.random() < 0.05:
+            part = f'<skill name="Drama" difficulty="Easy" success="true">{_words(rng, 30)} & <b>broken</skill>\n'
+        else:
+            part = f'<skill name="{rng.choice(SKILLS)}" difficulty="Easy" success="true">{_words(rng, 60)}</skill>\n'
+        parts.append(part)
+        total += len(part)
+    return ''.join(parts)
+
+
+def chunked(text: str, chunk_size: int) -> Iterable[str]:
+    for i in range(0, len(text), chunk_size):
+        yield text[i:i + chunk_size]
+
+
+def run(processor_factory: Callable[[], XMLStreamProcessor], chunks: List[str]) -> tuple:
+    processor = processor_factory()
+    events = 0
+    started = time.perf_counter()
+    for chunk in chunks:
+        for item in processor.process_stream(chunk):
+            if item:
+                events += 1
+    elapsed = time.perf_counter() - started
+    return elapsed, events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=float, default=4.0, help="Size of each synthetic stream")
+    parser.add_argument('--chunk-size', type=int, default=16, help="Characters per delta")
+    parser.add_argument('--legacy-limit-mb', type=float, default=1.0,
+                        help="Skip the legacy processor on untagged streams larger than this (it is quadratic)")
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    scenarios = {
+        'tagged': make_tagged_stream(size),
+        'untagged': make_untagged_stream(size),
+        'malformed': make_malformed_stream(size),
+    }
+
+    print(f"{'scenario':<12}{'processor':<12}{'MB':>8}{'events':>10}{'seconds':>10}{'MB/s':>10}")
+    for name, text in scenarios.items():
+        chunks = list(chunked(text, args.chunk_size))
+        megabytes = len(text.encode('utf-8')) / (1024 * 1024)
+        for label, factory in (('tokenizer', XMLStreamProcessor), ('legacy', LegacyXMLStreamProcessor)):
+            if label == 'legacy' and name == 'untagged' and args.size_mb > args.legacy_limit_mb:
+                print(f"{name:<12}{label:<12}{megabytes:>8.2f}{'skipped':>10}")
+                continue
+            elapsed, events = run(factory, chunks)
+            print(f"{name:<12}{label:<12}{megabytes:>8.2f}{events:>10}{elapsed:>10.3f}{megabytes / elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,225 @@
 import os
 import yaml
+import asyncio
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Any, Optional
+from types import MappingProxyType
+from typing import Dict, Any, Optional, Mapping, Callable, List, Set, Tuple
+from utils.exceptions import ConfigurationError
+from localization.catalog import available_languages
+from storage.context_journal import Stamp, file_stamp, journal_path
 import logging
 
+API_KEY_PATH = Path(".api_key")
+
+DEFAULTS: Dict[str, Dict[str, Any]] = {
+    'model': {
+        'name': 'claude-3-5-sonnet-20241022',
+        'temperature': 1,
+        'max_tokens': 8192
+    },
+    'user_context': {
+        'enabled': False,
+        'file': 'config/user_context.txt',
+        'top_k': 8,
+        'max_tokens': 400,
+        'fsync_every': 1,
+        'journal_max_kb': 64
+    },
+    'prompt_cache': {
+        'enabled': True,
+        'warmup': True
+    },
+    'history': {
+        'context_window': 200000,
+        'budget_tokens': 50000,
+        'exact_token_count': False
+    },
+    'sessions': {
+        'enabled': True,
+        'path': 'sessions/sessions.db'
+    },
+    'reload': {
+        'enabled': True,
+        'interval': 2
+    },
+    'ui': {
+        'stream_checks': True
+    },
+    'sound': {
+        'enabled': True,
+        'cache_dir': 'cache/sounds'
+    },
+    'provider': {
+        'type': 'anthropic',
+        'base_url': None,
+        'connect_timeout': 5,
+        'read_timeout': 60,
+        'max_connections': 4,
+        'keepalive_expiry': 300,
+        'retries': 3,
+        'retry_base_delay': 0.5,
+        'retry_max_delay': 8,
+        'resume': True
+    },
+    'metrics': {
+        'enabled': True,
+        'file': 'logs/metrics.jsonl',
+        'format': 'jsonl',
+        'window': 500
+    },
+    'response_cache': {
+        'enabled': False,
+        'path': 'cache/responses',
+        'max_mb': 200,
+        'max_age_days': 30,
+        'speed': 1.0
+    },
+    'server': {
+        'host': '127.0.0.1',
+        'port': 8080,
+        'max_sessions': 1000,
+        'idle_timeout': 900,
+        'model_connections': 64,
+        'send_buffer': 65536,
+        'send_timeout': 30
+    }
+}
+
+PROVIDER_TYPES = ('anthropic', 'openai')
+METRICS_FORMATS = ('jsonl', 'prometheus')
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """Validated, read-only view of the configuration at one point in time."""
+    language: str
+    model: Mapping[str, Any]
+    user_context: Mapping[str, Any]
+    prompt_cache: Mapping[str, Any]
+    history: Mapping[str, Any]
+    sessions: Mapping[str, Any]
+    reload: Mapping[str, Any]
+    ui: Mapping[str, Any]
+    sound: Mapping[str, Any]
+    provider: Mapping[str, Any]
+    metrics: Mapping[str, Any]
+    response_cache: Mapping[str, Any]
+    server: Mapping[str, Any]
+    api_key: Optional[str]
+    version: int = 0
+
+def _section(raw: Dict[str, Any], name: str) -> Mapping[str, Any]:
+    value = raw.get(name) or {}
+    if not isinstance(value, dict):
+        raise ConfigurationError(f"'{name}' must be a mapping")
+    return MappingProxyType({**DEFAULTS[name], **value})
+
+def _require(condition: bool, message: str) -> None:
+    if not condition:
+        raise ConfigurationError(message)
+
+def build_snapshot(raw: Dict[str, Any], api_key: Optional[str], version: int = 0) -> ConfigSnapshot:
+    if not isinstance(raw, dict):
+        raise ConfigurationError("Configuration must be a mapping")
+
+    snapshot = ConfigSnapshot(
+        language=raw.get('language', 'en'),
+        model=_section(raw, 'model'),
+        user_context=_section(raw, 'user_context'),
+        prompt_cache=_section(raw, 'prompt_cache'),
+        history=_section(raw, 'history'),
+        sessions=_section(raw, 'sessions'),
+        reload=_section(raw, 'reload'),
+        ui=_section(raw, 'ui'),
+        sound=_section(raw, 'sound'),
+        provider=_section(raw, 'provider'),
+        metrics=_section(raw, 'metrics'),
+        response_cache=_section(raw, 'response_cache'),
+        server=_section(raw, 'server'),
+        api_key=api_key,
+        version=version
+    )
+
+    model = snapshot.model
+    _require(snapshot.language in available_languages(), f"Unsupported language: {snapshot.language}")
+    _require(isinstance(model['name'], str) and bool(model['name']), "model.name must be a non-empty string")
+    _require(isinstance(model['temperature'], (int, float)) and 0 <= model['temperature'] <= 1,
+             "model.temperature must be between 0 and 1")
+    _require(isinstance(model['max_tokens'], int) and model['max_tokens'] > 0, "model.max_tokens must be a positive integer")
+    _require(isinstance(snapshot.user_context['top_k'], int) and snapshot.user_context['top_k'] > 0,
+             "user_context.top_k must be a positive integer")
+    _require(isinstance(snapshot.user_context['max_tokens'], int) and snapshot.user_context['max_tokens'] > 0,
+             "user_context.max_tokens must be a positive integer")
+    _require(isinstance(snapshot.user_context['fsync_every'], int) and snapshot.user_context['fsync_every'] >= 0,
+             "user_context.fsync_every must be a non-negative integer")
+    _require(snapshot.user_context['journal_max_kb'] > 0, "user_context.journal_max_kb must be positive")
+    _require(snapshot.history['context_window'] > model['max_tokens'],
+             "history.context_window must be larger than model.max_tokens")
+    _require(snapshot.history['budget_tokens'] > 0, "history.budget_tokens must be positive")
+    _require(snapshot.reload['interval'] > 0, "reload.interval must be positive")
+    provider = snapshot.provider
+    _require(provider['type'] in PROVIDER_TYPES, f"provider.type must be one of {', '.join(PROVIDER_TYPES)}")
+    _require(provider['connect_timeout'] > 0 and provider['read_timeout'] > 0, "provider timeouts must be positive")
+    _require(isinstance(provider['max_connections'], int) and provider['max_connections'] > 0,
+             "provider.max_connections must be a positive integer")
+    _require(isinstance(provider['retries'], int) and provider['retries'] >= 0,
+             "provider.retries must be a non-negative integer")
+    _require(0 < provider['retry_base_delay'] <= provider['retry_max_delay'],
+             "provider.retry_base_delay must be positive and at most provider.retry_max_delay")
+    _require(snapshot.metrics['format'] in METRICS_FORMATS, f"metrics.format must be one of {', '.join(METRICS_FORMATS)}")
+    _require(isinstance(snapshot.metrics['window'], int) and snapshot.metrics['window'] > 0,
+             "metrics.window must be a positive integer")
+    response_cache = snapshot.response_cache
+    _require(response_cache['max_mb'] > 0 and response_cache['max_age_days'] > 0,
+             "response_cache.max_mb and response_cache.max_age_days must be positive")
+    _require(response_cache['speed'] >= 0, "response_cache.speed must not be negative")
+    server = snapshot.server
+    _require(isinstance(server['port'], int) and 0 <= server['port'] < 65536, "server.port must be a port number")
+    for name in ('max_sessions', 'model_connections', 'send_buffer'):
+        _require(isinstance(server[name], int) and server[name] > 0, f"server.{name} must be a positive integer")
+    _require(server['idle_timeout'] > 0 and server['send_timeout'] > 0, "server timeouts must be positive")
+    return snapshot
+
+
 class ConfigManager:
+    """Holds the current ConfigSnapshot and swaps it when watched files change.
+
+    Getters only read the current snapshot, so they do no I/O. The watcher polls
+    the mtimes of config.yml, .api_key and the user context file and its journal;
+    listeners are called with the new snapshot and the names of what changed
+    ('config', 'api_key', 'user_context').
+    """
+
     def __init__(self, config_path: str = "config/config.yml"):
         self._logger = logging.getLogger(__name__)
-        self._config: Dict[str, Any] = {}
         self._config_path = Path(config_path)
-        self._load_config()
+        self._listeners: List[Callable[[ConfigSnapshot, Set[str]], None]] = []
+        self._watcher: Optional[asyncio.Task] = None
+        self._snapshot = self._load_snapshot(previous=None)
+        self._stamps = self._file_stamps()
 
-    def _load_config(self) -> None:
-        try:
-            if self._config_path.exists():
-                with open(self._config_path, 'r', encoding='utf-8') as f:
-                    self._config = yaml.safe_load(f)
-                self._logger.info("Configuration loaded successfully")
-            else:
-                self._logger.warning(f"Config file not found at {self._config_path}, using defaults")
-                self._config = {}
-        except Exception as e:
-            self._logger.error(f"Check failure: Error loading config: {e}")
-            self._config = {}
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        return self._snapshot
 
-    def get_api_key(self) -> Optional[str]:
+    def _read_config(self) -> Dict[str, Any]:
+        if not self._config_path.exists():
+            self._logger.warning("Config file not found at %s, using defaults", self._config_path)
+            return {}
+        with open(self._config_path, 'r', encoding='utf-8') as f:
+            return yaml.safe_load(f) or {}
+
+    def _read_api_key(self) -> Optional[str]:
         # First, try to read from .api_key file
-        api_key_path = Path(".api_key")
-        if api_key_path.exists():
+        if API_KEY_PATH.exists():
             try:
-                with open(api_key_path, 'r', encoding='utf-8') as f:
+                with open(API_KEY_PATH, 'r', encoding='utf-8') as f:
                     api_key = f.read().strip()
                 if api_key:
                     self._logger.info("Using API key from .api_key file")
                     return api_key
             except Exception as e:
-                self._logger.error(f"Error reading .api_key file: {e}")
+                self._logger.error("Error reading .api_key file: %s", e)
 
         # Fallback to environment variable
         api_key = os.getenv("ANTHROPIC_API_KEY")
@@ -46,29 +230,102 @@ class ConfigManager:
         self._logger.warning("No API key found in .api_key file or environment")
         return None
 
+    def _load_snapshot(self, previous: Optional[ConfigSnapshot]) -> ConfigSnapshot:
+        version = previous.version + 1 if previous else 0
+        try:
+            snapshot = build_snapshot(self._read_config(), self._read_api_key(), version)
+            self._logger.info("Configuration loaded successfully")
+            return snapshot
+        except Exception as e:
+            if previous is not None:
+                self._logger.error("Check failure: Invalid configuration, keeping the previous one: %s", e)
+                return previous
+            self._logger.error("Check failure: Error loading config: %s", e)
+            return build_snapshot({}, self._read_api_key(), version)
+
+    def _file_stamps(self) -> Dict[str, Tuple[Stamp, ...]]:
+        context_path = Path(self._snapshot.user_context['file'])
+        paths = {
+            'config': [self._config_path],
+            'api_key': [API_KEY_PATH],
+            # New facts land in the journal until it is compacted into the file
+            'user_context': [context_path, journal_path(context_path)]
+        }
+        stamps: Dict[str, Tuple[Stamp, ...]] = {}
+        for name, group in paths.items():
+            stamps[name] = tuple(file_stamp(path) for path in group)
+        return stamps
+
+    def add_listener(self, listener: Callable[[ConfigSnapshot, Set[str]], None]) -> None:
+        self._listeners.append(listener)
+
+    def check_for_changes(self) -> Set[str]:
+        stamps = self._file_stamps()
+        changed = {name for name, stamp in stamps.items() if stamp != self._stamps.get(name)}
+        if not changed:
+            return changed
+
+        if changed & {'config', 'api_key'}:
+            previous = self._snapshot
+            self._snapshot = self._load_snapshot(previous)
+            if self._snapshot.user_context['file'] != previous.user_context['file']:
+                changed.add('user_context')
+            stamps = self._file_stamps()
+        self._stamps = stamps
+
+        self._logger.info("Configuration change detected: %s", ', '.join(sorted(changed)))
+        for listener in self._listeners:
+            try:
+                listener(self._snapshot, changed)
+            except Exception as e:
+                self._logger.error("Check failure: Error applying configuration change: %s", e)
+        return changed
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self._snapshot.reload['interval'])
+            self.check_for_changes()
+
+    def start_watching(self) -> None:
+        if self._snapshot.reload['enabled'] and self._watcher is None:
+            self._watcher = asyncio.ensure_future(self._watch())
+
+    def stop_watching(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    def get_api_key(self) -> Optional[str]:
+        return self._snapshot.api_key
+
     def get_language(self) -> str:
-        return self._config.get('language', 'en')
-
-    def get_user_context(self) -> Optional[str]:
-        context_config = self._config.get('user_context', {})
-        if context_config.get('enabled', False):
-            file_path = context_config.get('file')
-            if file_path:
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        return f.read().strip()
-                except FileNotFoundError:
-                    self._logger.warning(f"User context file not found: {file_path}")
-                except Exception as e:
-                    self._logger.error(f"Error reading user context file: {e}")
-            return None
-        return None
+        return self._snapshot.language
+
+    def get_user_context_config(self) -> Mapping[str, Any]:
+        return self._snapshot.user_context
+
+    def get_model_config(self) -> Mapping[str, Any]:
+        return self._snapshot.model
+
+    def get_prompt_cache_config(self) -> Mapping[str, Any]:
+        return self._snapshot.prompt_cache
+
+    def get_history_config(self) -> Mapping[str, Any]:
+        return self._snapshot.history
+
+    def get_sessions_config(self) -> Mapping[str, Any]:
+        return self._snapshot.sessions
+
+    def get_provider_config(self) -> Mapping[str, Any]:
+        return self._snapshot.provider
+
+    def get_metrics_config(self) -> Mapping[str, Any]:
+        return self._snapshot.metrics
+
+    def get_response_cache_config(self) -> Mapping[str, Any]:
+        return self._snapshot.response_cache
 
-    def get_model_config(self) -> Dict[str, Any]:
-        return self._config.get('model', {
-            'name': 'claude-3-5-sonnet-20241022',
-            'temperature': 1,
-            'max_tokens': 8192
-        })
+    def get_server_config(self) -> Mapping[str, Any]:
+        return self._snapshot.server
 
     YOUR_CODE_BETRAYS_YOUR_DEGENERACY = True
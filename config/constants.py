@@ -25,3 +25,10 @@ SKILL_COLORS: Dict[str, str] = {
     'PHYSIQUE': '#AE3C5C',
     'MOTORICS': '#C3A22B'
 }
+
+CATEGORY_SOUNDS: Dict[str, str] = {
+    'INTELLECT': 'INT',
+    'PSYCHE': 'PSY',
+    'PHYSIQUE': 'FYS',
+    'MOTORICS': 'MOT'
+}
@@ -0,0 +1,73 @@
+import difflib
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Collection, Dict, Optional, Tuple
+from config.constants import SKILL_CATEGORIES, DIFFICULTY_LEVELS, SKILL_COLORS, CATEGORY_SOUNDS
+from localization.catalog import available_languages, load_catalog
+
+# How similar an unknown name has to be to a known one to be taken for it
+MATCH_CUTOFF = 0.8
+
+_SEPARATORS_RE = re.compile(r"[\W_]+", re.UNICODE)
+
+
+@dataclass(frozen=True, slots=True)
+class Skill:
+    name: str
+    category: str
+    color: str
+    sound: str
+
+
+def alias_key(name: str) -> str:
+    """Casefolded form used for lookups: "Half-Light", "half light" and "HALF LIGHT" are the same key."""
+    return _SEPARATORS_RE.sub(' ', name.casefold().replace('ё', 'е')).strip()
+
+
+def _build_aliases(names: Collection[str], section: str) -> Dict[str, str]:
+    # Canonical names and their translations in every locale, from the catalogs' reverse tables
+    aliases: Dict[str, str] = {}
+    for name in names:
+        aliases[alias_key(name)] = name
+    for language in sorted(available_languages()):
+        for translated, name in load_catalog(language).reverse.get(section, {}).items():
+            if name in names:
+                aliases.setdefault(alias_key(translated), name)
+    return aliases
+
+
+SKILLS: Dict[str, Skill] = {
+    name: Skill(name, category, SKILL_COLORS[category], CATEGORY_SOUNDS[category])
+    for category, names in SKILL_CATEGORIES.items()
+    for name in names
+}
+
+
+@lru_cache(maxsize=None)
+def _aliases(section: str) -> Dict[str, str]:
+    # Built on first use, so importing the parser doesn't load any catalog
+    return _build_aliases(SKILLS.keys() if section == 'skills' else DIFFICULTY_LEVELS.keys(), section)
+
+
+@lru_cache(maxsize=1)
+def _skill_keys() -> Tuple[str, ...]:
+    return tuple(_aliases('skills'))
+
+
+@lru_cache(maxsize=256)
+def _closest_skill(key: str) -> Optional[str]:
+    matches = difflib.get_close_matches(key, _skill_keys(), n=1, cutoff=MATCH_CUTOFF)
+    return _aliases('skills')[matches[0]] if matches else None
+
+
+def find_skill(name: str) -> Optional[Skill]:
+    """Looks a skill up by its name in any locale, tolerating small misspellings."""
+    key = alias_key(name)
+    canonical = _aliases('skills').get(key) or _closest_skill(key)
+    return SKILLS[canonical] if canonical else None
+
+
+def normalize_difficulty(difficulty: str) -> str:
+    difficulty = difficulty.strip()
+    return _aliases('difficulties').get(alias_key(difficulty), difficulty)
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Mapping
+
+import yaml
+
+CATALOG_DIR = Path(__file__).resolve().parent / 'catalogs'
+CATALOG_SUFFIX = '.yml'
+# Compiled catalogs, named after the language and the checksum of their source
+CACHE_DIR = Path('cache') / 'locales'
+# Bumped when the compiled layout changes, so old cache files aren't read
+COMPILED_VERSION = 1
+# Hex digits of the source checksum in a compiled catalog's name
+CHECKSUM_LENGTH = 16
+REQUIRED = (('prompt', 'language_instruction'),)
+
+Table = Mapping[str, Mapping[str, str]]
+
+
+@dataclass(frozen=True, slots=True)
+class Catalog:
+    """Strings of one language: category -> key -> text, and the reverse."""
+    language: str
+    forward: Table
+    reverse: Table
+
+    def translate(self, category: str, key: str) -> str:
+        try:
+            return self.forward[category][key]
+        except KeyError:
+            return key
+
+    def reverse_translate(self, category: str, value: str) -> str:
+        try:
+            return self.reverse[category][value]
+        except KeyError:
+            return value
+
+
+def _freeze(table: Dict[str, Dict[str, str]]) -> Table:
+    return MappingProxyType({category: MappingProxyType(entries) for category, entries in table.items()})
+
+
+@lru_cache(maxsize=1)
+def available_languages() -> FrozenSet[str]:
+    """Every language with a catalog file; adding a file adds the language."""
+    return frozenset(path.stem for path in CATALOG_DIR.glob(f'*{CATALOG_SUFFIX}'))
+
+
+def compile_catalog(language: str, source: Mapping[str, Any]) -> Dict[str, Any]:
+    """Checks a parsed catalog file and builds its forward and reverse tables."""
+    if not isinstance(source, Mapping):
+        raise ValueError(f"Catalog {language} must map categories to strings")
+    forward: Dict[str, Dict[str, str]] = {}
+    reverse: Dict[str, Dict[str, str]] = {}
+    for category, entries in source.items():
+        if not isinstance(entries, Mapping):
+            raise ValueError(f"Catalog {language}: '{category}' must map keys to strings")
+        forward[category] = {str(key): str(text) for key, text in entries.items()}
+        # The first key wins if two share a translation, as the old linear scan did
+        reverse[category] = {}
+        for key, text in forward[category].items():
+            reverse[category].setdefault(text, key)
+    for category, key in REQUIRED:
+        if key not in forward.get(category, {}):
+            raise ValueError(f"Catalog {language} is missing {category}.{key}")
+    return {'version': COMPILED_VERSION, 'forward': forward, 'reverse': reverse}
+
+
+def _read_compiled(path: Path) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        compiled = json.load(f)
+    if compiled.get('version') != COMPILED_VERSION:
+        raise ValueError(f"{path} has an old layout")
+    return compiled
+
+
+def _write_compiled(language: str, path: Path, compiled: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(compiled, f, ensure_ascii=False)
+    os.replace(temporary, path)
+    # Compilations of earlier versions of the catalog, but not of "pt-BR" when compiling "pt"
+    compiled_name = re.compile(rf"{re.escape(language)}-[0-9a-f]{{{CHECKSUM_LENGTH}}}\.json")
+    for stale in path.parent.iterdir():
+        if stale != path and compiled_name.fullmatch(stale.name):
+            stale.unlink(missing_ok=True)
+
+
+@lru_cache(maxsize=None)
+def load_catalog(language: str) -> Catalog:
+    """The catalog of `language`, compiled on first use.
+
+    The YAML source is only parsed when no compiled copy with the same
+    checksum is in CACHE_DIR; otherwise the tables are read from there.
+    Not being able to write the cache only costs the parsing next time.
+    """
+    if language not in available_languages():
+        raise ValueError(f"Unsupported language: {language}")
+    logger = logging.getLogger(__name__)
+    source = (CATALOG_DIR / f"{language}{CATALOG_SUFFIX}").read_bytes()
+    checksum = hashlib.sha256(source).hexdigest()[:CHECKSUM_LENGTH]
+    path = CACHE_DIR / f"{language}-{checksum}.json"
+    try:
+        compiled = _read_compiled(path)
+    except (OSError, ValueError):
+        compiled = compile_catalog(language, yaml.safe_load(source) or {})
+        try:
+            _write_compiled(language, path, compiled)
+        except OSError as e:
+            logger.debug("Couldn't cache the %s catalog: %s", language, e)
+    return Catalog(language, _freeze(compiled['forward']), _freeze(compiled['reverse']))
@@ -1,31 +1,26 @@
-from typing import Optional
-from .translations import TRANSLATIONS
-from config.config_manager import ConfigManager
+from typing import Optional, Set
+from .catalog import available_languages, load_catalog
+from config.config_manager import ConfigManager, ConfigSnapshot
 
 class LocaleManager:
     def __init__(self, language: str = 'en', config_manager: Optional[ConfigManager] = None):
         if config_manager:
-            self.language = config_manager.get_language()
-        else:
-            self.language = language
-        self._translations = TRANSLATIONS
+            language = config_manager.get_language()
+            config_manager.add_listener(self._on_config_change)
+        self.language = language
+        # Only the active language is loaded
+        self._catalog = load_catalog(language)
+
+    def _on_config_change(self, snapshot: ConfigSnapshot, changed: Set[str]) -> None:
+        self.set_language(snapshot.language)
 
     def set_language(self, language: str) -> None:
-        if language in self._translations:
+        if language in available_languages():
+            self._catalog = load_catalog(language)
             self.language = language
 
     def translate(self, category: str, key: str) -> str:
-        try:
-            return self._translations[self.language][category][key]
-        except KeyError:
-            return key
+        return self._catalog.translate(category, key)
 
     def reverse_translate(self, category: str, value: str) -> str:
-        try:
-            trans_dict = self._translations[self.language][category]
-            for k, v in trans_dict.items():
-                if v == value:
-                    return k
-            return value
-        except KeyError:
-            return value
+        return self._catalog.reverse_translate(category, value)
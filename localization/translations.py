@@ -1,62 +0,0 @@
-TRANSLATIONS = {
-    'en': {
-        'ui': {
-            'continue_prompt': 'CONTINUE',
-            'you': 'YOU'
-        }
-    },
-    'ru': {
-        'skills': {
-            # INTELLECT
-            'Logic': 'Логика',
-            'Encyclopedia': 'Энциклопедия',
-            'Rhetoric': 'Риторика',
-            'Drama': 'Драма',
-            'Conceptualization': 'Концептуализация',
-            'Visual Calculus': 'Визуальный анализ',
-
-            # PSYCHE
-            'Volition': 'Сила воли',
-            'Inland Empire': 'Внутренняя империя',
-            'Empathy': 'Эмпатия',
-            'Authority': 'Авторитет',
-            'Esprit De Corps': 'Командный дух',
-            'Suggestion': 'Внушение',
-
-            # PHYSIQUE
-            'Endurance': 'Стойкость',
-            'Pain Threshold': 'Болевой порог',
-            'Physical Instrument': 'Грубая сила',
-            'Electrochemistry': 'Электрохимия',
-            'Shivers': 'Трепет',
-            'Half Light': 'Сумрак',
-
-            # MOTORICS
-            'Hand/Eye Coordination': 'Координация',
-            'Perception': 'Восприятие',
-            'Reaction Speed': 'Скорость реакции',
-            'Savoir Faire': 'Эквилибристика',
-            'Interfacing': 'Техника',
-            'Composure': 'Самообладание'
-        },
-        'difficulties': {
-            'Trivial': 'Элементарно',
-            'Easy': 'Легко',
-            'Medium': 'Средне',
-            'Challenging': 'Сложно',
-            'Formidable': 'Трудно',
-            'Legendary': 'Легендарно',
-            'Heroic': 'Героически',
-            'Godly': 'Божественно',
-            'Impossible': 'Невозможно'
-        },
-        'results': {
-            'Success': 'Успех',
-            'Failure': 'Неудача'
-        },
-        'ui': {
-            'continue_prompt': 'ПРОДОЛЖИТЬ',
-            'you': 'ТЫ'
-        }
-    }
-}
@@ -1,8 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from dataclasses import dataclass
 
-class ContextUpdate(BaseModel):
-    content: str = ...  # The new information to add to context
-
-    class Config:
-        frozen = True
\ No newline at end of file
+@dataclass(frozen=True, slots=True)
+class ContextUpdate:
+    content: str  # The new information to add to context
@@ -0,0 +1,71 @@
+from typing import List, Literal, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator, model_validator
+
+# Data coming from outside the process is checked here, once per line,
+# request body or stored row; the parser's own records stay plain dataclasses.
+
+
+def describe(error: ValidationError) -> str:
+    """One line naming every field that failed and why."""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc']) or 'value'}: {detail['msg']}" for detail in error.errors()
+    )
+
+
+class BatchLine(BaseModel):
+    """One line of a batch input file."""
+    model_config = ConfigDict(frozen=True)
+
+    id: Optional[Union[str, int]] = Field(None, description="Conversation id, the line number if missing")
+    prompt: Optional[str] = Field(None, description="The only message of a one-turn conversation")
+    turns: Optional[List[str]] = Field(None, description="User messages, in order")
+    language: Optional[str] = Field(None, description="Language of the answers")
+
+    @model_validator(mode='after')
+    def _has_turns(self) -> "BatchLine":
+        if not self.turns and self.prompt is None:
+            raise ValueError("needs 'prompt' or a non-empty 'turns'")
+        return self
+
+    @property
+    def messages(self) -> List[str]:
+        return self.turns or [self.prompt]
+
+
+class NewSessionBody(BaseModel):
+    """Body of POST /sessions."""
+    model_config = ConfigDict(frozen=True)
+
+    language: Optional[str] = Field(None, description="Language of the session, the configured one if missing")
+
+
+class MessageBody(BaseModel):
+    """Body of POST /sessions/<id>/messages."""
+    model_config = ConfigDict(frozen=True)
+
+    text: str = Field(..., description="The user's message")
+
+    @field_validator('text')
+    @classmethod
+    def _not_blank(cls, text: str) -> str:
+        if not text.strip():
+            raise ValueError("must be a non-empty string")
+        return text
+
+
+class StoredMessage(BaseModel):
+    """A message row read back from the session store."""
+    model_config = ConfigDict(frozen=True)
+
+    seq: int = Field(..., ge=0, description="Position in the dialogue")
+    role: Literal['user', 'assistant']
+    content: str
+
+
+class StoredSummary(BaseModel):
+    """A summary row read back from the session store."""
+    model_config = ConfigDict(frozen=True)
+
+    seq: int = Field(..., ge=0, description="First message the summary doesn't cover")
+    content: str
@@ -1,12 +1,28 @@
-from pydantic import BaseModel, Field
+from dataclasses import dataclass
 from typing import Optional
 
-class SkillCheck(BaseModel):
-    skill: str = Field(..., description="Name of the skill being checked")
-    difficulty: str = Field(..., description="Difficulty level of the check")
-    success: bool = Field(..., description="Whether the check was successful")
-    content: str = Field(..., description="The actual dialogue content")
-    category: Optional[str] = Field(None, description="Skill category")
+# Plain slotted records: one is created for every tag and every streamed chunk,
+# and their fields are already normalized by the processor.
 
-    class Config:
-        frozen = True
+@dataclass(frozen=True, slots=True)
+class SkillCheck:
+    skill: str  # Name of the skill being checked
+    difficulty: str  # Difficulty level of the check
+    success: bool  # Whether the check was successful
+    content: str  # The actual dialogue content
+    category: Optional[str] = None  # Skill category
+
+
+@dataclass(frozen=True, slots=True)
+class SkillCheckStart:
+    """Opening tag of a skill check whose text is still streaming in."""
+    skill: str
+    difficulty: str
+    success: bool
+    category: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class SkillCheckDelta:
+    """Next piece of text of the skill check that is streaming in."""
+    text: str  # Normalized dialogue text
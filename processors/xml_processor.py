@@ -1,17 +1,72 @@
-from typing import Optional, Generator, Union
+from typing import Optional, Generator, Union, List, Dict, Any
 import xml.etree.ElementTree as ET
-from models.skill_check import SkillCheck
+import html
+import re
+from models.skill_check import SkillCheck, SkillCheckStart, SkillCheckDelta
 from models.context_update import ContextUpdate
-from config.constants import SKILL_CATEGORIES
+from config.skill_registry import find_skill, normalize_difficulty
 from utils.exceptions import XMLProcessingError
-from localization.translations import TRANSLATIONS
 import logging
 
+# Tokenizer states
+_TEXT = 0
+_OPEN_TAG = 1
+_CONTENT = 2
+
+_TAG_NAMES = ('skill', 'context_update')
+_OPENERS = tuple('<' + name for name in _TAG_NAMES)
+_NAME_TERMINATORS = ' \t\r\n>/'
+# Quoted values, or bare ones such as success=true
+_ATTRIBUTE_RE = re.compile(r'([A-Za-z_][\w.-]*)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'=<>/]+))')
+# A '&' further back than this without a ';' isn't held back as a cut entity;
+# the longest named character reference has 33 characters
+_MAX_ENTITY = 40
+
+
 class XMLStreamProcessor:
-    def __init__(self):
-        self.buffer = ""
+    """Resumable single-pass tokenizer for <skill> and <context_update> tags.
+
+    Every character of the stream is inspected once. Text outside of tags is
+    discarded as soon as it has been scanned, so the only state kept between
+    chunks is the tag that is currently being received. Its scanned text is
+    kept as a list of pieces that is joined once, when the tag is complete;
+    only the few characters that can't be decided yet are carried over and
+    scanned with the next chunk.
+
+    In streaming mode a <skill> tag also produces a SkillCheckStart as soon as
+    its opening tag is complete and SkillCheckDelta events with the text
+    received so far, before the final SkillCheck.
+    """
+
+    def __init__(self, streaming: bool = False):
         self._logger = logging.getLogger(__name__)
-        self._partial_tag = ""
+        self.streaming = streaming
+        self._reset()
+
+    def _reset(self) -> None:
+        self._state = _TEXT
+        # Scanned text of the unfinished tag, starting at its '<'
+        self._parts: List[str] = []
+        # Text that follows _parts and is scanned again with the next chunk
+        self._tail = ""
+        self._tag_name = ""
+        self._closing_tag = ""
+        # Offset into _tail up to which the tokenizer has already looked
+        self._scan_from = 0
+        # Streaming mode: offset into _tail of the content not yet sent as a delta
+        self._emitted = 0
+        self._delta_started = False
+        self._space_pending = False
+
+    @property
+    def buffer(self) -> str:
+        return "".join(self._parts) + self._tail
+
+    def _tag_text(self, data: str, start: int, end: int) -> str:
+        # The whole tag, once it is complete; the pieces are only joined here
+        text = "".join(self._parts) + data[start:end]
+        self._parts = []
+        return text
 
     def _normalize_text(self, text: str) -> str:
         dashes = ['—', '–', '‐', '‑', '⁃', '−']
@@ -20,124 +75,262 @@ class XMLStreamProcessor:
         return ' '.join(text.split())
 
     def clear_buffer(self) -> None:
-        self.buffer = ""
+        self._reset()
 
-    def process_stream(self, chunk: str) -> Generator[Optional[Union[SkillCheck, ContextUpdate]], None, None]:
+    def _streaming_skill(self) -> bool:
+        return self.streaming and self._state == _CONTENT and self._tag_name == 'skill'
+
+    def process_stream(self, chunk: str) -> Generator[Optional[Union[SkillCheck, SkillCheckStart, SkillCheckDelta, ContextUpdate]], None, None]:
         if hasattr(chunk, 'text'):
             chunk = chunk.text
         elif isinstance(chunk, list) and len(chunk) > 0 and hasattr(chunk[0], 'text'):
             chunk = chunk[0].text
 
         chunk = str(chunk)
-        self.buffer += chunk
+        if not chunk:
+            return
+
+        data = self._tail + chunk if self._tail else chunk
+        pos = self._scan_from
+        # Start of the rest of the tag being received; data before it is never copied
+        base = 0
 
         while True:
-            # Check for skill tags first
-            start = self.buffer.find("<skill")
-            if start != -1:
-                end = self.buffer.find("</skill>", start)
-                if end != -1:
-                    end += len("</skill>")
-                    complete_tag = self.buffer[start:end]
-                    try:
-                        skill_check = self._parse_skill_check(complete_tag)
-                        if skill_check:
-                            yield skill_check
-                        self.buffer = self.buffer[end:]
-                        continue
-                    except ET.ParseError as e:
-                        self._logger.debug(f"Partial XML chunk received: {complete_tag}")
-                        break
-                    except Exception as e:
-                        self._logger.error(f"Check failure: Error processing XML chunk: {e}")
-                        self.buffer = self.buffer[end:]
-                        continue
-            
-            # Check for context_update tags
-            start = self.buffer.find("<context_update")
-            if start != -1:
-                end = self.buffer.find("</context_update>", start)
-                if end != -1:
-                    end += len("</context_update>")
-                    complete_tag = self.buffer[start:end]
-                    try:
-                        context_update = self._parse_context_update(complete_tag)
-                        if context_update:
-                            yield context_update
-                        self.buffer = self.buffer[end:]
-                        continue
-                    except ET.ParseError as e:
-                        self._logger.debug(f"Partial XML chunk received: {complete_tag}")
-                        break
-                    except Exception as e:
-                        self._logger.error(f"Check failure: Error processing context update: {e}")
-                        self.buffer = self.buffer[end:]
-                        continue
-            
-            # No complete tags found
-            break
-
-    def _normalize_skill_name(self, skill_name: str) -> str:
-        skill_name = skill_name.strip()
-        ru_skills = TRANSLATIONS.get('ru', {}).get('skills', {})
-        for category, skills in SKILL_CATEGORIES.items():
-            for skill in skills:
-                if skill_name.lower() == skill.lower() or skill_name.lower() == ru_skills.get(skill, '').lower():
-                    return skill
-        return skill_name
-
-    def _normalize_difficulty(self, difficulty: str) -> str:
-        from config.constants import DIFFICULTY_LEVELS
-        difficulty = difficulty.strip()
-        for level in DIFFICULTY_LEVELS.keys():
-            if difficulty.lower() == level.lower():
-                return level
-        return difficulty
+            if self._state == _TEXT:
+                start = data.find('<', pos)
+                if start == -1:
+                    # Nothing but plain text, drop it
+                    base = pos = len(data)
+                    break
 
-    def _parse_skill_check(self, xml_chunk: str) -> Optional[SkillCheck]:
+                opener = self._match_opener(data, start)
+                if opener is None:
+                    pos = start + 1
+                    continue
+                if opener == "":
+                    # Possibly the beginning of a tag cut by the chunk boundary
+                    base = pos = start
+                    break
+
+                base, pos = start, start + len(opener)
+                self._tag_name = opener[1:]
+                self._closing_tag = "</" + self._tag_name + ">"
+                self._state = _OPEN_TAG
+
+            elif self._state == _OPEN_TAG:
+                end = data.find('>', pos)
+                if end == -1:
+                    pos = len(data)
+                    break
+
+                # The character before '>' is always in data, see the end of this method
+                if data[end - 1] == '/':
+                    item = self._build_item(self._tag_text(data, base, end + 1), self_closing=True)
+                    if item:
+                        yield item
+                    self._state = _TEXT
+                    base = pos = end + 1
+                    continue
+
+                pos = end + 1
+                self._state = _CONTENT
+                if self._streaming_skill():
+                    self._emitted = pos
+                    self._delta_started = False
+                    self._space_pending = False
+                    yield self._parse_skill_start("".join(self._parts) + data[base:pos])
+
+            else:
+                start = data.find('<', pos)
+                if start == -1:
+                    pos = len(data)
+                    break
+
+                if data.startswith(self._closing_tag, start):
+                    end = start + len(self._closing_tag)
+                    item = self._build_item(self._tag_text(data, base, end))
+                    if item:
+                        yield item
+                    self._state = _TEXT
+                    base = pos = end
+                    continue
+
+                opener = self._match_opener(data, start)
+                if opener:
+                    # A new tag opened before the current one was closed.
+                    # Give up on the broken tag and resume from the new one.
+                    broken = self._tag_text(data, base, start)
+                    self._logger.debug("Unterminated <%s> tag dropped: %s", self._tag_name, broken)
+                    if self._streaming_skill():
+                        # Its header is already on screen, so close it with what has arrived
+                        yield self._parse_lenient(broken + self._closing_tag, False)
+                    self._state = _TEXT
+                    base = pos = start
+                    continue
+
+                if opener == "" or (len(data) - start < len(self._closing_tag) and self._closing_tag.startswith(data[start:])):
+                    # Closing tag or a new opener cut by the chunk boundary
+                    pos = start
+                    break
+
+                pos = start + 1
+
+        # What has been scanned moves to _parts, except for the last character of
+        # an open tag, which tells a self-closing one, and content that a held
+        # back entity still needs for its delta
+        cut = pos
+        if self._state == _TEXT:
+            cut = base
+        elif self._state == _OPEN_TAG:
+            cut = max(base, pos - 1)
+        elif self._streaming_skill():
+            delta = self._take_delta(data, pos)
+            if delta:
+                yield SkillCheckDelta(text=delta)
+            cut = min(pos, self._emitted)
+        if cut > base:
+            self._parts.append(data[base:cut])
+        self._emitted -= cut
+        self._tail = data[cut:]
+        self._scan_from = pos - cut
+
+    def flush(self) -> List[Union[SkillCheck, ContextUpdate]]:
+        items: List[Union[SkillCheck, ContextUpdate]] = []
+        if self._streaming_skill():
+            items.append(self._parse_lenient(self.buffer + self._closing_tag, False))
+        elif self.buffer:
+            self._logger.debug("Incomplete XML at the end of the response: %s", self.buffer)
+        self._reset()
+        return items
+
+    def _take_delta(self, data: str, end: int) -> str:
+        # Hold back an entity that may be cut by the chunk boundary
+        amp = data.rfind('&', max(self._emitted, end - _MAX_ENTITY), end)
+        if amp != -1 and data.find(';', amp, end) == -1:
+            end = amp
+        if end <= self._emitted:
+            return ""
+
+        text = data[self._emitted:end]
+        self._emitted = end
+        return self._normalize_delta(html.unescape(text))
+
+    def _normalize_delta(self, text: str) -> str:
+        """Incremental version of _normalize_text that keeps word breaks across deltas."""
+        leading = text[:1].isspace()
+        trailing = text[-1:].isspace()
+        words = self._normalize_text(text)
+        if not words:
+            self._space_pending = self._space_pending or (leading and self._delta_started)
+            return ""
+
+        if (leading or self._space_pending) and self._delta_started:
+            words = ' ' + words
+        self._delta_started = True
+        self._space_pending = trailing
+        return words
+
+    def _match_opener(self, data: str, start: int) -> Optional[str]:
+        """Returns the opener found at data[start], "" if the data ends before it
+        can be decided, or None if this '<' does not start a known tag."""
+        for opener in _OPENERS:
+            end = start + len(opener)
+            if data.startswith(opener, start):
+                if end >= len(data):
+                    return ""
+                if data[end] in _NAME_TERMINATORS:
+                    return opener
+            elif len(data) < end and opener.startswith(data[start:]):
+                return ""
+        return None
+
+    def _build_item(self, xml_chunk: str, self_closing: bool = False) -> Optional[Union[SkillCheck, ContextUpdate]]:
         try:
-            root = ET.fromstring(xml_chunk)
+            if self._tag_name == 'skill':
+                return self._parse_skill_check(xml_chunk)
+            return self._parse_context_update(xml_chunk)
+        except ET.ParseError:
+            self._logger.debug("Malformed XML, falling back to lenient parsing: %s", xml_chunk)
+            try:
+                return self._parse_lenient(xml_chunk, self_closing)
+            except Exception as e:
+                self._logger.error("Check failure: Error processing XML chunk: %s", e)
+                return None
+        except Exception as e:
+            self._logger.error("Check failure: Error processing XML chunk: %s", e)
+            return None
 
-            raw_skill_name = root.attrib.get('name', 'Unknown')
-            skill_name = self._normalize_skill_name(raw_skill_name)
+    def _parse_attributes(self, open_tag: str) -> Dict[str, str]:
+        attributes: Dict[str, str] = {}
+        for match in _ATTRIBUTE_RE.finditer(open_tag):
+            value = next(group for group in match.groups()[1:] if group is not None)
+            attributes[match.group(1)] = html.unescape(value)
+        return attributes
 
-            raw_difficulty = root.attrib.get('difficulty', 'medium')
-            difficulty = self._normalize_difficulty(raw_difficulty)
+    def _parse_lenient(self, xml_chunk: str, self_closing: bool) -> Optional[Union[SkillCheck, ContextUpdate]]:
+        open_end = xml_chunk.find('>')
+        attributes = self._parse_attributes(xml_chunk[:open_end])
 
-            success = root.attrib.get('success', 'false').lower() == 'true'
-            content = self._normalize_text(root.text or "")
+        if self_closing:
+            text = ""
+        else:
+            text = html.unescape(xml_chunk[open_end + 1:-len(self._closing_tag)])
 
-            category = next(
-                (cat for cat, skills in SKILL_CATEGORIES.items()
-                 if skill_name in skills),
-                None
-            )
-
-            return SkillCheck(
-                skill=skill_name,
-                difficulty=difficulty,
-                success=success,
-                content=content,
-                category=category
-            )
+        if self._tag_name == 'skill':
+            return self._make_skill_check(attributes, text)
+        content = self._normalize_text(text)
+        if content.strip():
+            return ContextUpdate(content=content)
+        return None
+
+    def _skill_fields(self, attributes: Dict[str, str]) -> Dict[str, Any]:
+        raw_skill_name = attributes.get('name', 'Unknown')
+        skill = find_skill(raw_skill_name)
+        if skill is None:
+            self._logger.debug("Unknown skill: %s", raw_skill_name)
+
+        difficulty = normalize_difficulty(attributes.get('difficulty', 'medium'))
+        success = attributes.get('success', 'false').lower() == 'true'
+
+        return {
+            'skill': skill.name if skill else raw_skill_name.strip(),
+            'difficulty': difficulty,
+            'success': success,
+            'category': skill.category if skill else None
+        }
+
+    def _make_skill_check(self, attributes: Dict[str, str], text: str) -> SkillCheck:
+        return SkillCheck(content=self._normalize_text(text), **self._skill_fields(attributes))
+
+    def _parse_skill_start(self, open_tag: str) -> SkillCheckStart:
+        try:
+            attributes = ET.fromstring(open_tag + self._closing_tag).attrib
+        except ET.ParseError:
+            attributes = self._parse_attributes(open_tag)
+        return SkillCheckStart(**self._skill_fields(attributes))
+
+    def _parse_skill_check(self, xml_chunk: str) -> Optional[SkillCheck]:
+        try:
+            root = ET.fromstring(xml_chunk)
+            return self._make_skill_check(root.attrib, root.text or "")
         except ET.ParseError as e:
             raise
         except Exception as e:
-            self._logger.error(f"Check failure: Error parsing skill check: {e}")
+            self._logger.error("Check failure: Error parsing skill check: %s", e)
             return None
 
     def _parse_context_update(self, xml_chunk: str) -> Optional[ContextUpdate]:
         try:
             root = ET.fromstring(xml_chunk)
             content = self._normalize_text(root.text or "")
-            
+
             if content.strip():
                 return ContextUpdate(content=content)
             return None
         except ET.ParseError as e:
             raise
         except Exception as e:
-            self._logger.error(f"Error parsing context update: {e}")
+            self._logger.error("Error parsing context update: %s", e)
             return None
 
     def get_remaining_buffer(self) -> str:
@@ -0,0 +1,102 @@
+import logging
+from typing import Any, List, Mapping, Optional
+
+import anthropic
+import httpx
+
+from providers.base import Completion, Provider, TextCallback, Usage
+from providers.http import RETRYABLE_STATUS, new_http_client, retry_after
+from storage.recordings import StreamRecorder
+from utils.exceptions import ProviderError
+
+# Error types that can also arrive as an event in the middle of a stream
+RETRYABLE_ERRORS = {'overloaded_error', 'api_error', 'rate_limit_error'}
+
+
+def provider_error(error: Exception) -> ProviderError:
+    if isinstance(error, (anthropic.APIConnectionError, httpx.TransportError)):
+        return ProviderError(str(error) or type(error).__name__, retryable=True)
+    if isinstance(error, anthropic.APIStatusError):
+        body = error.body if isinstance(error.body, dict) else {}
+        details = body.get('error') if isinstance(body.get('error'), dict) else {}
+        retryable = error.status_code in RETRYABLE_STATUS or details.get('type') in RETRYABLE_ERRORS
+        return ProviderError(details.get('message') or error.message, retryable, retry_after(error.response.headers))
+    return ProviderError(str(error))
+
+
+def usage_of(usage: Any) -> Usage:
+    return Usage(
+        input_tokens=usage.input_tokens or 0,
+        output_tokens=usage.output_tokens or 0,
+        cache_read_input_tokens=usage.cache_read_input_tokens or 0,
+        cache_creation_input_tokens=usage.cache_creation_input_tokens or 0
+    )
+
+
+class AnthropicProvider(Provider):
+    """Messages API through the official SDK.
+
+    The SDK's own retries are off; retrying is left to the caller, which
+    can resume a broken stream instead of starting it over.
+    """
+
+    name = "anthropic"
+    supports_prompt_cache = True
+    supports_token_count = True
+    supports_prefill = True
+
+    def __init__(self, api_key: Optional[str], config: Mapping[str, Any], recorder: Optional[StreamRecorder] = None):
+        self._logger = logging.getLogger(__name__)
+        self._client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            base_url=config['base_url'],
+            http_client=new_http_client(config),
+            max_retries=0
+        )
+        self.recorder = recorder
+
+    async def stream(self, on_text: TextCallback, **request: Any) -> Completion:
+        parts: List[str] = []
+        complete = False
+        if self.recorder:
+            self.recorder.start_turn(**request)
+        try:
+            async with self._client.messages.stream(**request) as stream:
+                async for event in stream:
+                    if self.recorder:
+                        self.recorder.record(event)
+                    if event.type == "content_block_delta" and event.delta.type == "text_delta":
+                        parts.append(event.delta.text)
+                        await on_text(event.delta.text)
+                message = await stream.get_final_message()
+            complete = True
+        except (anthropic.APIError, httpx.TransportError) as e:
+            raise provider_error(e) from e
+        finally:
+            if self.recorder:
+                # Interrupted and failed attempts are kept too, marked as incomplete
+                self.recorder.finish_turn(complete)
+        return Completion(text="".join(parts), usage=usage_of(message.usage))
+
+    async def complete(self, **request: Any) -> Completion:
+        try:
+            message = await self._client.messages.create(**request)
+        except (anthropic.APIError, httpx.TransportError) as e:
+            raise provider_error(e) from e
+        text = "".join(block.text for block in message.content if block.type == "text")
+        return Completion(text=text, usage=usage_of(message.usage))
+
+    async def count_tokens(self, **request: Any) -> Optional[int]:
+        try:
+            counted = await self._client.messages.count_tokens(
+                model=request['model'], system=request['system'], messages=request['messages']
+            )
+        except (anthropic.APIError, httpx.TransportError) as e:
+            raise provider_error(e) from e
+        return counted.input_tokens
+
+    def set_api_key(self, api_key: str) -> None:
+        self._client.api_key = api_key
+
+    async def close(self) -> None:
+        await self._client.close()
@@ -0,0 +1,66 @@
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+TextCallback = Callable[[str], Awaitable[None]]
+
+
+@dataclass(frozen=True, slots=True)
+class Usage:
+    input_tokens: int = 0  # Uncached prompt tokens
+    output_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+
+    @property
+    def prompt_tokens(self) -> int:
+        return self.input_tokens + self.cache_read_input_tokens + self.cache_creation_input_tokens
+
+    def __add__(self, other: "Usage") -> "Usage":
+        return Usage(
+            self.input_tokens + other.input_tokens,
+            self.output_tokens + other.output_tokens,
+            self.cache_read_input_tokens + other.cache_read_input_tokens,
+            self.cache_creation_input_tokens + other.cache_creation_input_tokens
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Completion:
+    text: str
+    usage: Usage
+    attempts: int = 1  # More than one if the response was resumed after an error
+
+
+class Provider:
+    """Model backend behind the turn loop.
+
+    Requests are given in the Messages API layout (model, max_tokens,
+    temperature, system as a string or a list of text blocks, and messages
+    whose content is a string or a list of text blocks); providers for other
+    APIs translate them. Failures are raised as ProviderError, with
+    `retryable` set for errors that are worth another attempt.
+    """
+
+    name = "provider"
+    # Whether cache_control breakpoints are honoured, so warming up the cache pays off
+    supports_prompt_cache = False
+    # Whether count_tokens returns exact counts
+    supports_token_count = False
+    # Whether a trailing assistant message is continued rather than answered anew
+    supports_prefill = False
+
+    async def stream(self, on_text: TextCallback, **request: Any) -> Completion:
+        """Streams the response, awaiting `on_text` with every piece of text."""
+        raise NotImplementedError
+
+    async def complete(self, **request: Any) -> Completion:
+        raise NotImplementedError
+
+    async def count_tokens(self, **request: Any) -> Optional[int]:
+        return None
+
+    def set_api_key(self, api_key: str) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import time
+from typing import Any, Optional
+
+from providers.base import Completion, Provider, TextCallback, Usage
+from storage.response_cache import ResponseCache, TimedText
+from utils.prompt_builder import request_key
+
+
+class CachingProvider(Provider):
+    """Answers repeated requests from a ResponseCache instead of the model.
+
+    A hit is replayed through the same callback as a live stream, with the
+    recorded pauses divided by `speed` (0 replays at once), and reports no
+    usage since nothing was spent. Only streamed responses that finished are
+    stored; summaries and token counts always go to the wrapped provider.
+    """
+
+    def __init__(self, provider: Provider, cache: ResponseCache, speed: float = 1.0):
+        self._logger = logging.getLogger(__name__)
+        self.provider = provider
+        self.cache = cache
+        self.speed = speed
+        self.name = provider.name
+        self.supports_prompt_cache = provider.supports_prompt_cache
+        self.supports_token_count = provider.supports_token_count
+        self.supports_prefill = provider.supports_prefill
+
+    async def stream(self, on_text: TextCallback, **request: Any) -> Completion:
+        key = request_key(request)
+        # A file read, kept off the event loop like the writes
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            pieces, _ = cached
+            self._logger.info("Response cache hit %s (%s hits, %s misses)", key[:12], self.cache.hits, self.cache.misses)
+            await self._replay(pieces, on_text)
+            return Completion(text="".join(text for _, text in pieces), usage=Usage())
+
+        self._logger.info("Response cache miss %s (%s hits, %s misses)", key[:12], self.cache.hits, self.cache.misses)
+        pieces: TimedText = []
+        last = time.perf_counter()
+
+        async def record(text: str) -> None:
+            nonlocal last
+            now = time.perf_counter()
+            pieces.append((round(now - last, 4), text))
+            last = now
+            await on_text(text)
+
+        completion = await self.provider.stream(record, **request)
+        usage = completion.usage
+        self.cache.put(key, pieces, {
+            'input_tokens': usage.input_tokens, 'output_tokens': usage.output_tokens,
+            'cache_read_input_tokens': usage.cache_read_input_tokens,
+            'cache_creation_input_tokens': usage.cache_creation_input_tokens
+        }, model=request.get('model'))
+        return completion
+
+    async def _replay(self, pieces: TimedText, on_text: TextCallback) -> None:
+        for delay, text in pieces:
+            if self.speed > 0 and delay > 0:
+                await asyncio.sleep(delay / self.speed)
+            await on_text(text)
+
+    async def complete(self, **request: Any) -> Completion:
+        return await self.provider.complete(**request)
+
+    async def count_tokens(self, **request: Any) -> Optional[int]:
+        return await self.provider.count_tokens(**request)
+
+    def set_api_key(self, api_key: str) -> None:
+        self.provider.set_api_key(api_key)
+
+    async def close(self) -> None:
+        await self.provider.close()
+        await asyncio.to_thread(self.cache.close)
@@ -0,0 +1,33 @@
+import logging
+import os
+from typing import Any, Mapping, Optional
+
+from providers.anthropic_provider import AnthropicProvider
+from providers.base import Provider
+from providers.cache import CachingProvider
+from providers.openai_provider import API_KEY_ENV, OpenAICompatibleProvider
+from storage.recordings import StreamRecorder
+from storage.response_cache import ResponseCache
+
+
+def create_provider(
+    config: Mapping[str, Any],
+    api_key: Optional[str],
+    recorder: Optional[StreamRecorder] = None,
+    cache_config: Optional[Mapping[str, Any]] = None
+) -> Provider:
+    provider: Provider
+    if config['type'] == 'openai':
+        if recorder:
+            logging.getLogger(__name__).warning("Recording is only supported with the anthropic provider")
+        # The configured key is an Anthropic one, it is not sent anywhere else
+        provider = OpenAICompatibleProvider(os.getenv(API_KEY_ENV), config)
+    else:
+        provider = AnthropicProvider(api_key, config, recorder)
+
+    if cache_config and cache_config['enabled']:
+        cache = ResponseCache(
+            cache_config['path'], int(cache_config['max_mb'] * 1024 * 1024), cache_config['max_age_days'] * 86400
+        )
+        provider = CachingProvider(provider, cache, cache_config['speed'])
+    return provider
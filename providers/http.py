@@ -0,0 +1,28 @@
+from typing import Any, Mapping, Optional
+
+import httpx
+
+# Worth retrying: timeouts, conflicts, rate limits, server errors and overload
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+def new_http_client(config: Mapping[str, Any]) -> httpx.AsyncClient:
+    """One long-lived connection pool per provider, so every request after
+    the first reuses an open connection instead of a new TCP and TLS handshake."""
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(config['read_timeout'], connect=config['connect_timeout']),
+        limits=httpx.Limits(
+            max_connections=config['max_connections'],
+            max_keepalive_connections=config['max_connections'],
+            keepalive_expiry=config['keepalive_expiry']
+        ),
+        follow_redirects=True
+    )
+
+
+def retry_after(headers: Optional[httpx.Headers]) -> Optional[float]:
+    try:
+        return float(headers['retry-after']) if headers and 'retry-after' in headers else None
+    except ValueError:
+        # HTTP dates are not worth parsing here, the backoff covers them
+        return None
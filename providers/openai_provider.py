@@ -0,0 +1,134 @@
+import json
+import logging
+from typing import Any, Dict, List, Mapping, Optional, Union
+
+import httpx
+
+from providers.base import Completion, Provider, TextCallback, Usage
+from providers.http import RETRYABLE_STATUS, new_http_client, retry_after
+from utils.exceptions import ProviderError
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+API_KEY_ENV = "OPENAI_API_KEY"
+
+
+def text_of(content: Union[None, str, List[Dict[str, Any]]]) -> str:
+    if content is None or isinstance(content, str):
+        return content or ""
+    return "\n\n".join(block['text'] for block in content if block.get('type') == 'text')
+
+
+def usage_of(usage: Optional[Dict[str, Any]]) -> Usage:
+    if not usage:
+        return Usage()
+    cached = (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0
+    return Usage(
+        input_tokens=(usage.get('prompt_tokens') or 0) - cached,
+        output_tokens=usage.get('completion_tokens') or 0,
+        cache_read_input_tokens=cached
+    )
+
+
+class OpenAICompatibleProvider(Provider):
+    """Chat Completions API, as served by OpenAI and by local model servers
+    (llama.cpp, vLLM, Ollama, LM Studio...).
+
+    System blocks are joined into one system message and cache_control
+    markers are dropped. Chat Completions answers a trailing assistant
+    message anew instead of continuing it, so a broken response is started
+    over rather than resumed. The API key comes from OPENAI_API_KEY and is
+    optional for local servers.
+    """
+
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str], config: Mapping[str, Any]):
+        self._logger = logging.getLogger(__name__)
+        self.base_url = (config['base_url'] or DEFAULT_BASE_URL).rstrip('/')
+        self._http = new_http_client(config)
+        self.api_key = api_key
+
+    def _headers(self) -> Dict[str, str]:
+        return {'Authorization': f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def _payload(self, request: Mapping[str, Any], stream: bool) -> Dict[str, Any]:
+        messages = []
+        system = text_of(request.get('system'))
+        if system:
+            messages.append({'role': 'system', 'content': system})
+        messages += [{'role': msg['role'], 'content': text_of(msg['content'])} for msg in request['messages']]
+
+        payload: Dict[str, Any] = {
+            'model': request['model'],
+            'messages': messages,
+            'max_tokens': request['max_tokens'],
+            'stream': stream
+        }
+        if 'temperature' in request:
+            payload['temperature'] = request['temperature']
+        if stream:
+            payload['stream_options'] = {'include_usage': True}
+        return payload
+
+    async def _check(self, response: httpx.Response) -> None:
+        if response.status_code < 400:
+            return
+        body = (await response.aread()).decode('utf-8', 'replace')
+        try:
+            message = json.loads(body)['error']['message']
+        except (ValueError, KeyError, TypeError):
+            message = body[:200]
+        raise ProviderError(
+            f"Error code: {response.status_code} - {message}",
+            response.status_code in RETRYABLE_STATUS,
+            retry_after(response.headers)
+        )
+
+    async def stream(self, on_text: TextCallback, **request: Any) -> Completion:
+        parts: List[str] = []
+        usage = Usage()
+        try:
+            async with self._http.stream(
+                'POST', f"{self.base_url}/chat/completions",
+                json=self._payload(request, stream=True), headers=self._headers()
+            ) as response:
+                await self._check(response)
+                async for line in response.aiter_lines():
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[5:].strip()
+                    if data == '[DONE]':
+                        break
+                    chunk = json.loads(data)
+                    if chunk.get('error'):
+                        raise ProviderError(str(chunk['error'].get('message', chunk['error'])), retryable=True)
+                    for choice in chunk.get('choices') or []:
+                        text = (choice.get('delta') or {}).get('content')
+                        if text:
+                            parts.append(text)
+                            await on_text(text)
+                    if chunk.get('usage'):
+                        usage = usage_of(chunk['usage'])
+        except httpx.TransportError as e:
+            raise ProviderError(str(e) or type(e).__name__, retryable=True) from e
+        except json.JSONDecodeError as e:
+            raise ProviderError(f"Malformed stream data: {e}", retryable=True) from e
+        return Completion(text="".join(parts), usage=usage)
+
+    async def complete(self, **request: Any) -> Completion:
+        try:
+            response = await self._http.post(
+                f"{self.base_url}/chat/completions",
+                json=self._payload(request, stream=False), headers=self._headers()
+            )
+            await self._check(response)
+            data = response.json()
+        except httpx.TransportError as e:
+            raise ProviderError(str(e) or type(e).__name__, retryable=True) from e
+        except json.JSONDecodeError as e:
+            raise ProviderError(f"Malformed response: {e}", retryable=True) from e
+        choices = data.get('choices') or [{}]
+        return Completion(text=(choices[0].get('message') or {}).get('content') or "", usage=usage_of(data.get('usage')))
+
+    async def close(self) -> None:
+        await self._http.aclose()
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import random
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, TypeVar
+
+from providers.base import Completion, Provider, TextCallback
+from utils.exceptions import ProviderError
+
+T = TypeVar('T')
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    retries: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> "RetryPolicy":
+        return cls(config['retries'], config['retry_base_delay'], config['retry_max_delay'])
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        # Exponential backoff with full jitter, so clients that failed together don't retry together
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+async def call_with_retries(policy: RetryPolicy, call: Callable[[], Awaitable[T]], what: str = "Request") -> T:
+    logger = logging.getLogger(__name__)
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except ProviderError as e:
+            if not e.retryable or attempt >= policy.retries:
+                raise
+            delay = policy.delay(attempt, e.retry_after)
+            attempt += 1
+            logger.warning("%s failed: %s; retry %s of %s in %.2f s", what, e, attempt, policy.retries, delay)
+            await asyncio.sleep(delay)
+
+
+def with_prefill(request: Dict[str, Any], prefill: str) -> Dict[str, Any]:
+    if not prefill:
+        return request
+    return {**request, 'messages': [*request['messages'], {'role': 'assistant', 'content': prefill}]}
+
+
+async def stream_with_retries(
+    provider: Provider,
+    on_text: TextCallback,
+    policy: RetryPolicy,
+    resume: bool = True,
+    on_restart: Optional[Callable[[], None]] = None,
+    **request: Any
+) -> Completion:
+    """Streams a response, retrying transient failures.
+
+    A stream that breaks after some text was delivered is resumed: the text
+    so far is sent back as the beginning of the assistant message and the
+    model continues from there, so `on_text` sees every piece of the answer
+    once. With `resume` off such a failure is final.
+
+    A provider without `supports_prefill` would answer that message anew,
+    so its response is started over instead: `on_restart` is called to drop
+    what `on_text` has seen, and without it the failure is final.
+    """
+    logger = logging.getLogger(__name__)
+    parts: List[str] = []
+    attempts = 0
+    # The prefill can't end with whitespace, so the continuation may repeat it
+    trim = False
+
+    async def forward(text: str) -> None:
+        nonlocal trim
+        if trim:
+            text = text.lstrip()
+            if not text:
+                return
+            trim = False
+        parts.append(text)
+        await on_text(text)
+
+    async def attempt() -> Completion:
+        nonlocal attempts, trim
+        received = "".join(parts)
+        if received and not resume:
+            raise ProviderError("Response broken off and resuming is disabled")
+        if received and not provider.supports_prefill:
+            if on_restart is None:
+                raise ProviderError(f"Response broken off and {provider.name} can't continue it")
+            on_restart()
+            parts.clear()
+            received = ""
+        prefill = received.rstrip()
+        trim = len(prefill) < len(received)
+        if attempts:
+            if received:
+                logger.info("Resuming the response after %s characters", len(received))
+            else:
+                logger.info("Restarting the response")
+        attempts += 1
+        completion = await provider.stream(forward, **with_prefill(request, prefill))
+        return Completion(text="".join(parts), usage=completion.usage, attempts=attempts)
+
+    return await call_with_retries(policy, attempt, "Response")
@@ -0,0 +1,331 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar, TYPE_CHECKING
+
+from config.config_manager import ConfigManager
+from localization.catalog import available_languages
+from providers.base import Provider
+from utils.history import DialogueHistory
+from utils.prompt_builder import PromptBuilder
+from utils.turns import Item, stream_turn, item_record, usage_record
+from utils.workers import shard_of
+
+if TYPE_CHECKING:
+    from pydantic import BaseModel
+
+Body = TypeVar('Body', bound='BaseModel')
+
+MAX_BODY_BYTES = 64 * 1024
+MAX_HEADERS = 100
+# Pending connections, so a burst of new clients isn't refused by the kernel
+BACKLOG = 1024
+STATUS_TEXT = {
+    200: 'OK', 201: 'Created', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found',
+    409: 'Conflict', 413: 'Payload Too Large', 503: 'Service Unavailable'
+}
+SSE_HEADERS = (
+    b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream; charset=utf-8\r\n"
+    b"cache-control: no-cache\r\nconnection: close\r\n\r\n"
+)
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ClientGone(Exception):
+    """The client disconnected or stopped reading its response stream."""
+
+
+@dataclass(eq=False)
+class Session:
+    id: str
+    language: str
+    history: DialogueHistory = field(default_factory=DialogueHistory)
+    last_active: float = field(default_factory=time.monotonic)
+    busy: bool = False
+    turns: int = 0
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, path, _ = line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise HTTPError(400, "Too many headers")
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HTTPError(400, "Invalid content-length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"Request bodies are limited to {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length)
+    return method, path.split('?', 1)[0], headers, body
+
+
+def json_response(status: int, data: Optional[Dict[str, Any]] = None, keep_alive: bool = True) -> bytes:
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8') if data is not None else b''
+    connection = "" if keep_alive else "connection: close\r\n"
+    return (
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'Error')}\r\n"
+        f"content-type: application/json\r\ncontent-length: {len(body)}\r\n{connection}\r\n".encode('latin-1') + body
+    )
+
+
+def send_json(
+    writer: asyncio.StreamWriter, status: int, data: Optional[Dict[str, Any]] = None, keep_alive: bool = True
+) -> None:
+    writer.write(json_response(status, data, keep_alive))
+
+
+def json_body(body: bytes, model: Type[Body]) -> Body:
+    from pydantic import ValidationError
+    from models.inputs import describe
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        raise HTTPError(400, "Body must be JSON")
+    if not isinstance(data, dict):
+        raise HTTPError(400, "Body must be a JSON object")
+    try:
+        return model.model_validate(data)
+    except ValidationError as e:
+        raise HTTPError(400, describe(e))
+
+
+class EventStream:
+    """Server-sent events to one client, with backpressure.
+
+    Events are written straight to the socket. Once more than `send_buffer`
+    bytes are waiting for a slow client, sending waits for it to catch up,
+    which in turn stops reading the model's stream for that session only.
+    A client that doesn't read for `send_timeout` seconds is given up on.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, send_buffer: int, send_timeout: float):
+        self._writer = writer
+        self._transport = writer.transport
+        self._transport.set_write_buffer_limits(high=send_buffer)
+        self._send_buffer = send_buffer
+        self._send_timeout = send_timeout
+        writer.write(SSE_HEADERS)
+
+    async def send(self, record: Dict[str, Any]) -> None:
+        if self._transport.is_closing():
+            raise ClientGone("Client disconnected")
+        data = json.dumps(record, ensure_ascii=False)
+        self._writer.write(f"event: {record['type']}\ndata: {data}\n\n".encode('utf-8'))
+        # Checked here so the common case doesn't pay for a timeout
+        if self._transport.get_write_buffer_size() > self._send_buffer:
+            try:
+                await asyncio.wait_for(self._writer.drain(), self._send_timeout)
+            except asyncio.TimeoutError:
+                raise ClientGone("Client stopped reading")
+            except ConnectionError as e:
+                raise ClientGone(str(e))
+
+
+class DialogueServer:
+    """Hosts many dialogue sessions in one process over HTTP.
+
+    POST /sessions                 -> {"id": ...}; optional body {"language": "en"}
+    POST /sessions/{id}/messages   {"text": ...} -> server-sent events: one per
+                                   parsed skill_check/context_update, then done or error
+    GET /sessions/{id}             -> {"id", "language", "turns"}
+    DELETE /sessions/{id}
+    GET /stats                     -> session and turn counts, CPU time
+
+    Every session has its own history and its own parser for each response;
+    all of them share one provider, and so one pool of model connections. A
+    session streams one response at a time, and sessions without a message
+    for server.idle_timeout seconds are dropped.
+
+    As worker `shard` = (index, count) of a server.pool.WorkerPool, it only
+    mints session ids that shard_of maps to its index, and answers one
+    request per connection, as the next one may belong to another worker.
+    """
+
+    def __init__(self, provider: Provider, config_manager: ConfigManager, shard: Tuple[int, int] = (0, 1)):
+        self._logger = logging.getLogger(__name__)
+        self.provider = provider
+        self.config_manager = config_manager
+        self.prompt_builder = PromptBuilder(cache_enabled=config_manager.get_prompt_cache_config()['enabled'])
+        self.sessions: Dict[str, Session] = {}
+        self.started = time.monotonic()
+        self.streaming = 0
+        self.turns = 0
+        self.failed = 0
+        self.evicted = 0
+        self.shard = shard
+        self.keep_alive = shard[1] == 1
+
+    async def serve(self, host: str, port: int) -> None:
+        listener = await asyncio.start_server(self.handle, host, port, backlog=BACKLOG)
+        evictor = asyncio.ensure_future(self.evict_idle())
+        self._logger.info("Serving dialogue sessions on http://%s:%s", host, port)
+        try:
+            async with listener:
+                await listener.serve_forever()
+        finally:
+            evictor.cancel()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    send_json(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if not await self._route(writer, method, path, body):
+                    break
+                if not self.keep_alive or headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ClientGone):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, writer: asyncio.StreamWriter, method: str, path: str, body: bytes) -> bool:
+        """Answers one request; returns False if the connection has to be closed afterwards."""
+        # pydantic stays off the interactive startup path, the server imports it on first use
+        from models.inputs import MessageBody, NewSessionBody
+
+        parts = path.strip('/').split('/')
+        try:
+            if parts == ['sessions'] and method == 'POST':
+                session = self._create_session(json_body(body, NewSessionBody).language)
+                self._send_json(writer, 201, {'id': session.id})
+            elif len(parts) == 3 and parts[0] == 'sessions' and parts[2] == 'messages' and method == 'POST':
+                text = json_body(body, MessageBody).text
+                await self._respond(writer, self._session(parts[1]), text)
+                return False
+            elif len(parts) == 2 and parts[0] == 'sessions' and method == 'GET':
+                session = self._session(parts[1])
+                self._send_json(writer, 200, {'id': session.id, 'language': session.language, 'turns': session.turns})
+            elif len(parts) == 2 and parts[0] == 'sessions' and method == 'DELETE':
+                self._session(parts[1])
+                del self.sessions[parts[1]]
+                self._send_json(writer, 204)
+            elif parts == ['stats'] and method == 'GET':
+                self._send_json(writer, 200, self.stats())
+            else:
+                raise HTTPError(404, f"No route for {method} {path}")
+        except HTTPError as e:
+            self._send_json(writer, e.status, {'error': str(e)})
+        await writer.drain()
+        return True
+
+    def _send_json(self, writer: asyncio.StreamWriter, status: int, data: Optional[Dict[str, Any]] = None) -> None:
+        send_json(writer, status, data, self.keep_alive)
+
+    def _create_session(self, language: Optional[str]) -> Session:
+        language = language or self.config_manager.get_language()
+        if language not in available_languages():
+            raise HTTPError(400, f"Unsupported language: {language}")
+        if len(self.sessions) >= self.config_manager.get_server_config()['max_sessions']:
+            raise HTTPError(503, "Too many sessions")
+        session = Session(self._new_session_id(), language)
+        self.sessions[session.id] = session
+        return session
+
+    def _new_session_id(self) -> str:
+        index, workers = self.shard
+        while True:
+            # `workers` tries on average
+            session_id = uuid.uuid4().hex
+            if workers == 1 or shard_of(session_id, workers) == index:
+                return session_id
+
+    def _session(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HTTPError(404, f"No session {session_id}")
+        return session
+
+    async def _respond(self, writer: asyncio.StreamWriter, session: Session, text: str) -> None:
+        if session.busy:
+            raise HTTPError(409, "A response is already streaming in this session")
+        config = self.config_manager.get_server_config()
+        events = EventStream(writer, config['send_buffer'], config['send_timeout'])
+
+        async def send_item(item: Item, elapsed: float) -> None:
+            await events.send({**item_record(item), 't_ms': elapsed})
+
+        session.busy = True
+        self.streaming += 1
+        session.history.add_message("user", text)
+        started = time.perf_counter()
+        try:
+            completion, ttft = await stream_turn(
+                self.provider, self.config_manager, self.prompt_builder, session.history, session.language, send_item
+            )
+        except ClientGone as e:
+            session.history.pop_message()
+            self._logger.info("Session %s: response abandoned: %s", session.id, e)
+            return
+        except Exception as e:
+            session.history.pop_message()
+            self.failed += 1
+            self._logger.error("Check failure: Session %s: %s", session.id, e)
+            await events.send({'type': 'error', 'error': str(e)})
+            return
+        finally:
+            session.busy = False
+            session.last_active = time.monotonic()
+            self.streaming -= 1
+
+        session.history.add_message("assistant", completion.text)
+        session.turns += 1
+        self.turns += 1
+        await events.send({
+            'type': 'done', 'turn': session.turns, 'seconds': round(time.perf_counter() - started, 3),
+            'ttft_ms': ttft, 'attempts': completion.attempts, 'usage': usage_record(completion.usage)
+        })
+
+    async def evict_idle(self) -> None:
+        while True:
+            idle_timeout = self.config_manager.get_server_config()['idle_timeout']
+            await asyncio.sleep(min(idle_timeout / 4, 30))
+            cutoff = time.monotonic() - idle_timeout
+            idle: List[str] = [
+                session.id for session in self.sessions.values() if not session.busy and session.last_active < cutoff
+            ]
+            for session_id in idle:
+                del self.sessions[session_id]
+            if idle:
+                self.evicted += len(idle)
+                self._logger.info("Dropped %s idle sessions, %s left", len(idle), len(self.sessions))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'sessions': len(self.sessions),
+            'streaming': self.streaming,
+            'turns': self.turns,
+            'failed': self.failed,
+            'evicted': self.evicted,
+            'uptime_seconds': round(time.monotonic() - self.started, 3),
+            # Seconds of CPU used by the whole process, for load tests
+            'cpu_seconds': round(time.process_time(), 3)
+        }
@@ -0,0 +1,255 @@
+import asyncio
+import itertools
+import logging
+import math
+import socket
+import time
+from dataclasses import dataclass, field
+from multiprocessing import reduction
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, Optional, Set
+
+from config.config_manager import ConfigManager
+from server.dialogue_server import BACKLOG, DialogueServer, json_response
+from utils.workers import WORKER_CONTEXT, init_worker, open_provider, shard_of
+
+MAX_REQUEST_LINE = 8192
+# Seconds a new connection gets to send its request line
+REQUEST_LINE_TIMEOUT = 10
+# Seconds a worker gets to answer a stats request
+STATS_TIMEOUT = 5
+# Totals of /stats summed over the workers
+SUMMED_STATS = ('sessions', 'streaming', 'turns', 'failed', 'evicted', 'cpu_seconds')
+
+
+async def wait_readable(fileno: int, timeout: Optional[float] = None) -> None:
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    loop.add_reader(fileno, lambda: ready.done() or ready.set_result(None))
+    try:
+        await asyncio.wait_for(ready, timeout)
+    finally:
+        loop.remove_reader(fileno)
+
+
+def serve_worker(
+    index: int, workers: int, handles: Connection, control: Connection, log_format: str, base_url: Optional[str]
+) -> None:
+    """Entry point of a worker process."""
+    init_worker(f"worker-{index}", log_format)
+    asyncio.run(_serve_worker(index, workers, handles, control, base_url))
+
+
+async def _serve_worker(
+    index: int, workers: int, handles: Connection, control: Connection, base_url: Optional[str]
+) -> None:
+    logger = logging.getLogger(__name__)
+    loop = asyncio.get_running_loop()
+    config_manager = ConfigManager()
+    provider = None
+    stopped = loop.create_future()
+    connections: Set[asyncio.Task] = set()
+
+    def stop() -> None:
+        loop.remove_reader(handles.fileno())
+        loop.remove_reader(control.fileno())
+        if not stopped.done():
+            stopped.set_result(None)
+
+    async def handle(fd: int) -> None:
+        reader, writer = await asyncio.open_connection(sock=socket.socket(fileno=fd))
+        await server.handle(reader, writer)
+
+    def on_connection() -> None:
+        try:
+            fd = reduction.recv_handle(handles)
+        except (EOFError, OSError):
+            # The supervisor closed the pipe
+            stop()
+            return
+        task = asyncio.ensure_future(handle(fd))
+        connections.add(task)
+        task.add_done_callback(connections.discard)
+
+    def on_control() -> None:
+        try:
+            # The id goes back with the answer, so a late answer can't be taken for the next one
+            request_id = control.recv()
+            control.send((request_id, server.stats()))
+        except (EOFError, OSError):
+            stop()
+
+    try:
+        # Every worker has its own connections to the model, together about server.model_connections
+        share = math.ceil(config_manager.get_server_config()['model_connections'] / workers)
+        provider = open_provider(config_manager, base_url, max_connections=share)
+        server = DialogueServer(provider, config_manager, (index, workers))
+        evictor = asyncio.ensure_future(server.evict_idle())
+        loop.add_reader(handles.fileno(), on_connection)
+        loop.add_reader(control.fileno(), on_control)
+        logger.info("Worker %s of %s ready", index, workers)
+        await stopped
+        evictor.cancel()
+        for task in list(connections):
+            task.cancel()
+    except Exception as e:
+        logger.error("Check failure: Worker %s: %s", index, e)
+    finally:
+        if provider is not None:
+            await provider.close()
+
+
+@dataclass
+class Worker:
+    process: Any
+    handles: Connection
+    control: Connection
+    # One socket at a time goes down the handles pipe
+    sending: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class WorkerPool:
+    """Runs the session server as `workers` processes behind one port.
+
+    The supervisor accepts every connection, peeks at its request line
+    without reading it off the socket, and passes the socket itself to a
+    worker over a pipe. Requests for a session go to the worker that
+    shard_of picks for its id, and new sessions are spread round-robin, so
+    each session lives in exactly one worker. The worker then reads the
+    request as if it had accepted the connection. GET /stats is answered by
+    the supervisor with the totals of all workers. A worker that dies is
+    started again, without the sessions it held.
+
+    Passing sockets between processes needs a POSIX system.
+    """
+
+    def __init__(self, config_manager: ConfigManager, workers: int, log_format: str = 'text', base_url: Optional[str] = None):
+        self._logger = logging.getLogger(__name__)
+        self.config_manager = config_manager
+        self.log_format = log_format
+        self.base_url = base_url
+        self.workers: List[Worker] = [self._start(index, workers) for index in range(workers)]
+        self.started = time.monotonic()
+        self._next = 0
+        self._stats_lock = asyncio.Lock()
+        self._stats_ids = itertools.count()
+
+    def _start(self, index: int, workers: int) -> Worker:
+        handles, worker_handles = WORKER_CONTEXT.Pipe()
+        control, worker_control = WORKER_CONTEXT.Pipe()
+        process = WORKER_CONTEXT.Process(
+            target=serve_worker, name=f"worker-{index}", daemon=True,
+            args=(index, workers, worker_handles, worker_control, self.log_format, self.base_url)
+        )
+        process.start()
+        worker_handles.close()
+        worker_control.close()
+        return Worker(process, handles, control)
+
+    def _worker(self, index: int) -> Worker:
+        worker = self.workers[index]
+        if not worker.process.is_alive():
+            self._logger.error("Check failure: Worker %s exited with code %s, restarting it", index, worker.process.exitcode)
+            worker.handles.close()
+            worker.control.close()
+            worker = self.workers[index] = self._start(index, len(self.workers))
+        return worker
+
+    async def serve(self, host: str, port: int) -> None:
+        loop = asyncio.get_running_loop()
+        dispatching: Set[asyncio.Task] = set()
+        listener: Optional[socket.socket] = None
+        try:
+            listener = socket.create_server((host, port), backlog=BACKLOG)
+            listener.setblocking(False)
+            self._logger.info("Serving dialogue sessions on http://%s:%s with %s workers", host, port, len(self.workers))
+            while True:
+                connection, _ = await loop.sock_accept(listener)
+                task = asyncio.ensure_future(self._dispatch(connection))
+                dispatching.add(task)
+                task.add_done_callback(dispatching.discard)
+        finally:
+            if listener is not None:
+                listener.close()
+            self.close()
+
+    async def _dispatch(self, connection: socket.socket) -> None:
+        try:
+            method, path = await self._peek_request_line(connection)
+            if method == 'GET' and path == '/stats':
+                await self._send_stats(connection)
+                return
+            parts = path.strip('/').split('/')
+            if len(parts) >= 2 and parts[0] == 'sessions':
+                index = shard_of(parts[1], len(self.workers))
+            else:
+                index = self._next
+                self._next = (self._next + 1) % len(self.workers)
+            worker = self._worker(index)
+            # Blocks while the pipe is full, on a thread so a stuck worker doesn't hold up accepting
+            async with worker.sending:
+                await asyncio.to_thread(reduction.send_handle, worker.handles, connection.fileno(), worker.process.pid)
+        except (OSError, ValueError, asyncio.TimeoutError) as e:
+            self._logger.info("Dropped a connection before handing it over: %s", e or type(e).__name__)
+        finally:
+            # The worker holds its own copy of the socket now
+            connection.close()
+
+    async def _peek_request_line(self, connection: socket.socket) -> List[str]:
+        deadline = time.monotonic() + REQUEST_LINE_TIMEOUT
+        while True:
+            await wait_readable(connection.fileno(), deadline - time.monotonic())
+            data = connection.recv(MAX_REQUEST_LINE, socket.MSG_PEEK)
+            if not data:
+                raise ConnectionResetError("Closed before sending a request")
+            if b'\n' in data or len(data) >= MAX_REQUEST_LINE:
+                method, path, _ = data.split(b'\n', 1)[0].decode('latin-1').split(' ', 2)
+                return [method, path.split('?', 1)[0]]
+            # Only part of the line is there; the socket stays readable, so peeking again at once would spin
+            await asyncio.sleep(0.005)
+
+    async def _send_stats(self, connection: socket.socket) -> None:
+        loop = asyncio.get_running_loop()
+        request = b''
+        while b'\r\n\r\n' not in request and b'\n\n' not in request:
+            data = await loop.sock_recv(connection, 4096)
+            if not data:
+                return
+            request += data
+
+        totals: Dict[str, Any] = dict.fromkeys(SUMMED_STATS, 0)
+        async with self._stats_lock:
+            for index in range(len(self.workers)):
+                worker = self._worker(index)
+                try:
+                    stats = await self._worker_stats(worker)
+                except (OSError, EOFError, asyncio.TimeoutError) as e:
+                    self._logger.warning("No stats from worker %s: %s", index, e or type(e).__name__)
+                    continue
+                for name in SUMMED_STATS:
+                    totals[name] += stats.get(name, 0)
+        totals['cpu_seconds'] = round(totals['cpu_seconds'] + time.process_time(), 3)
+        totals['workers'] = len(self.workers)
+        totals['uptime_seconds'] = round(time.monotonic() - self.started, 3)
+        await loop.sock_sendall(connection, json_response(200, totals, keep_alive=False))
+
+    async def _worker_stats(self, worker: Worker) -> Dict[str, Any]:
+        request_id = next(self._stats_ids)
+        worker.control.send(request_id)
+        deadline = time.monotonic() + STATS_TIMEOUT
+        while True:
+            await wait_readable(worker.control.fileno(), deadline - time.monotonic())
+            reply_id, stats = worker.control.recv()
+            # Answers to requests that timed out earlier are dropped
+            if reply_id == request_id:
+                return stats
+
+    def close(self) -> None:
+        # Closing the pipes lets the workers finish on their own
+        for worker in self.workers:
+            worker.handles.close()
+            worker.control.close()
+        for worker in self.workers:
+            worker.process.join(5)
+            if worker.process.is_alive():
+                worker.process.terminate()
@@ -0,0 +1,226 @@
+import json
+import logging
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: there the lock only covers the threads of one process
+    fcntl = None
+
+JOURNAL_SUFFIX = '.journal'
+LOCK_SUFFIX = '.lock'
+
+# (mtime in ns, size) of a file, None if it doesn't exist
+Stamp = Optional[Tuple[int, int]]
+
+
+def journal_path(path: Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + JOURNAL_SUFFIX)
+
+
+def file_stamp(path: Path) -> Stamp:
+    try:
+        stat = path.stat()
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+def encode_record(fact: str) -> bytes:
+    # JSON keeps a record on one line whatever the fact contains
+    payload = json.dumps(fact, ensure_ascii=False).encode('utf-8')
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+
+def decode_records(data: bytes) -> Tuple[List[str], int, int]:
+    """Facts in a journal, the length of its intact prefix and the number of damaged records."""
+    facts: List[str] = []
+    damaged = 0
+    end = 0
+    for line in data.splitlines(keepends=True):
+        if not line.endswith(b"\n"):
+            # The tail of a write that never finished
+            break
+        end += len(line)
+        checksum, _, payload = line.rstrip(b"\n").partition(b" ")
+        try:
+            if int(checksum, 16) != zlib.crc32(payload):
+                raise ValueError("checksum mismatch")
+            fact = json.loads(payload)
+        except ValueError:
+            damaged += 1
+            continue
+        if isinstance(fact, str):
+            facts.append(fact)
+    return facts, end, damaged
+
+
+class ContextJournal:
+    """Write-behind storage for the user context file.
+
+    The context file stays a plain list of facts, one per line. New facts
+    are appended to `<file>.journal` as checksummed records on a background
+    thread instead: facts that arrive while a write is under way go out
+    together in the next one, with one fsync per `fsync_every` facts (0
+    leaves flushing to the OS). Once the journal grows past `max_bytes`, it
+    is folded into the context file, which is rewritten aside and renamed
+    into place, and then emptied.
+
+    Every read and write holds an exclusive lock on `<file>.lock`, so
+    several processes can share one context. A record that was cut short
+    by a crash, or whose checksum doesn't match, is skipped, and a cut-off
+    tail is removed before anything new is appended.
+
+    The stamps of both files are remembered after every read and write, so
+    changes_from_others() can tell this process's own writes from others'.
+    """
+
+    def __init__(self, path: Union[str, Path], fsync_every: int = 1, max_bytes: int = 64 * 1024):
+        self._logger = logging.getLogger(__name__)
+        self.path = Path(path)
+        self.journal = journal_path(self.path)
+        self.fsync_every = fsync_every
+        self.max_bytes = max_bytes
+        self._pending: List[str] = []
+        self._unsynced = 0
+        self._flush_scheduled = False
+        self._closed = False
+        # Stamps of the file and the journal as this process last left them
+        self._stamps: Tuple[Stamp, Stamp] = (None, None)
+        # Set when a write found that someone else had written since
+        self._foreign = False
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="context-journal")
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with self._file_lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path.with_name(self.path.name + LOCK_SUFFIX), 'ab') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _current_stamps(self) -> Tuple[Stamp, Stamp]:
+        return file_stamp(self.path), file_stamp(self.journal)
+
+    def changes_from_others(self) -> bool:
+        """Whether another process wrote to the file or journal since this one last read or wrote them."""
+        return self._foreign or self._current_stamps() != self._stamps
+
+    def read(self) -> List[str]:
+        """Facts of the context file, then of the journal, then those not written yet."""
+        with self._locked():
+            facts = self._read_snapshot()
+            if self.journal.exists():
+                with open(self.journal, 'r+b') as f:
+                    facts.extend(self._recover(f))
+            self._stamps = self._current_stamps()
+            self._foreign = False
+        with self._lock:
+            return facts + self._pending
+
+    def _read_snapshot(self) -> List[str]:
+        if not self.path.exists():
+            return []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+
+    def _recover(self, f: BinaryIO) -> List[str]:
+        data = f.read()
+        facts, end, damaged = decode_records(data)
+        if damaged:
+            self._logger.warning("Skipped %s damaged records in %s", damaged, self.journal)
+        if end < len(data):
+            self._logger.warning("Dropped %s bytes of an unfinished write from %s", len(data) - end, self.journal)
+            f.truncate(end)
+        f.seek(end)
+        return facts
+
+    def append(self, fact: str) -> None:
+        """Queues `fact` to be written; returns without waiting for the disk."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The context journal is closed")
+            self._pending.append(fact)
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        self._writer.submit(self._flush)
+
+    def _flush(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._flush_scheduled = False
+        if not batch:
+            return
+        try:
+            with self._locked():
+                if self._current_stamps() != self._stamps:
+                    self._foreign = True
+                with open(self.journal, 'a+b') as f:
+                    f.seek(0)
+                    self._recover(f)
+                    f.write(b"".join(encode_record(fact) for fact in batch))
+                    f.flush()
+                    self._unsynced += len(batch)
+                    if self.fsync_every and self._unsynced >= self.fsync_every:
+                        os.fsync(f.fileno())
+                        self._unsynced = 0
+                    size = f.tell()
+                if size > self.max_bytes:
+                    self._compact()
+                self._stamps = self._current_stamps()
+        except Exception as e:
+            self._logger.error("Check failure: Error writing user context journal: %s", e)
+
+    def _compact(self) -> None:
+        # Called with the lock held
+        facts = self._read_snapshot()
+        with open(self.journal, 'r+b') as f:
+            facts.extend(self._recover(f))
+        unique = list(dict.fromkeys(facts))
+        temporary = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.writelines(f"{fact}\n" for fact in unique)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        # Only emptied once the snapshot that holds its records is on disk
+        with open(self.journal, 'r+b') as f:
+            f.truncate(0)
+            os.fsync(f.fileno())
+        self._unsynced = 0
+        self._logger.info("Compacted the user context journal into %s (%s facts)", self.path, len(unique))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._writer.submit(self._flush)
+        self._writer.submit(self._sync)
+        self._writer.shutdown(wait=True)
+
+    def _sync(self) -> None:
+        if not self._unsynced or not self.journal.exists():
+            return
+        try:
+            with open(self.journal, 'rb') as f:
+                os.fsync(f.fileno())
+            self._unsynced = 0
+        except OSError as e:
+            self._logger.error("Check failure: Error syncing user context journal: %s", e)
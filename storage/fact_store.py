@@ -0,0 +1,164 @@
+import heapq
+import math
+import re
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Union
+from storage.context_journal import ContextJournal
+from utils.history import estimate_tokens
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Words are cut to this many characters, a crude stemmer that works for both English and Russian
+STEM_LENGTH = 6
+SHINGLE_SIZE = 3
+
+
+def tokenize(text: str) -> List[str]:
+    return [word[:STEM_LENGTH] for word in _WORD_RE.findall(text.casefold())]
+
+
+def shingles(text: str) -> Set[str]:
+    normalized = ' '.join(_WORD_RE.findall(text.casefold()))
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+class FactStore:
+    """Local memory of user facts with a BM25 inverted index.
+
+    Facts are deduplicated on insert: a fact whose character shingles overlap
+    an existing fact by at least `duplicate_threshold` (Jaccard) is rejected.
+    Only facts that share a term with the new one are compared, via the index.
+    New facts are persisted through a ContextJournal, off the event loop.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        duplicate_threshold: float = 0.8,
+        k1: float = 1.5,
+        b: float = 0.75,
+        fsync_every: int = 1,
+        journal_max_bytes: int = 64 * 1024
+    ):
+        self._logger = logging.getLogger(__name__)
+        self.path = Path(path) if path else None
+        self.fsync_every = fsync_every
+        self.journal_max_bytes = journal_max_bytes
+        self.journal = self._open_journal()
+        self.duplicate_threshold = duplicate_threshold
+        self.k1 = k1
+        self.b = b
+        self.facts: List[str] = []
+        self._shingles: List[Set[str]] = []
+        self._lengths: List[int] = []
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._total_length = 0
+        self._load()
+
+    def _open_journal(self) -> Optional[ContextJournal]:
+        return ContextJournal(self.path, self.fsync_every, self.journal_max_bytes) if self.path else None
+
+    def reload(self, path: Optional[Union[str, Path]] = None) -> None:
+        if path is not None and Path(path) != self.path:
+            self.close()
+            self.path = Path(path)
+            self.journal = self._open_journal()
+        elif self.journal is not None and not self.journal.changes_from_others():
+            # Only this process's own appends, which are indexed already
+            return
+        self.facts = []
+        self._shingles = []
+        self._lengths = []
+        self._postings = {}
+        self._total_length = 0
+        self._load()
+
+    def _load(self) -> None:
+        if self.journal is None:
+            return
+        try:
+            for fact in self.journal.read():
+                self._insert(fact)
+            self._logger.info("Loaded %s user facts from %s", len(self.facts), self.path)
+        except Exception as e:
+            self._logger.error("Error reading user context file: %s", e)
+
+    def __len__(self) -> int:
+        return len(self.facts)
+
+    def find_duplicate(self, fact: str) -> Optional[int]:
+        fact_shingles = shingles(fact)
+        candidates: Set[int] = set()
+        for term in set(tokenize(fact)):
+            candidates.update(self._postings.get(term, ()))
+
+        for doc_id in candidates:
+            other = self._shingles[doc_id]
+            overlap = len(fact_shingles & other)
+            if overlap and overlap / len(fact_shingles | other) >= self.duplicate_threshold:
+                return doc_id
+        return None
+
+    def _insert(self, fact: str) -> bool:
+        if not fact or self.find_duplicate(fact) is not None:
+            return False
+
+        doc_id = len(self.facts)
+        terms = tokenize(fact)
+        self.facts.append(fact)
+        self._shingles.append(shingles(fact))
+        self._lengths.append(len(terms))
+        self._total_length += len(terms)
+        for term, count in Counter(terms).items():
+            self._postings.setdefault(term, {})[doc_id] = count
+        return True
+
+    def add(self, fact: str) -> bool:
+        """Indexes and persists a new fact. Returns False for (near-)duplicates."""
+        fact = ' '.join(fact.split())
+        if not self._insert(fact):
+            self._logger.debug("Duplicate fact skipped: %s", fact)
+            return False
+
+        if self.journal is not None:
+            try:
+                self.journal.append(fact)
+            except Exception as e:
+                self._logger.error("Check failure: Error writing user context file: %s", e)
+        return True
+
+    def close(self) -> None:
+        """Waits for pending facts to be written."""
+        if self.journal is not None:
+            self.journal.close()
+
+    def search(self, query: str, top_k: int = 8, max_tokens: Optional[int] = None) -> List[str]:
+        """Returns the facts most relevant to `query`, best first, within `max_tokens`."""
+        if not self.facts:
+            return []
+
+        count = len(self.facts)
+        average_length = self._total_length / count or 1
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        ranked = heapq.nlargest(top_k, scores, key=scores.get)
+        result: List[str] = []
+        used = 0
+        for doc_id in ranked:
+            cost = estimate_tokens(self.facts[doc_id])
+            if max_tokens is not None and used + cost > max_tokens:
+                continue
+            result.append(self.facts[doc_id])
+            used += cost
+        return result
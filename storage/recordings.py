@@ -0,0 +1,91 @@
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+# Event types that come over the wire; the SDK adds synthesized ones ("text", ...) on top
+RAW_EVENT_TYPES = {
+    'message_start', 'message_delta', 'message_stop',
+    'content_block_start', 'content_block_delta', 'content_block_stop'
+}
+# Fields the SDK attaches to raw events for convenience, they are not part of the protocol
+_SNAPSHOT_FIELDS = {'message_stop': 'message', 'content_block_stop': 'content_block'}
+
+
+class StreamRecorder:
+    """Saves the raw stream events of every turn with their inter-arrival times.
+
+    Each turn becomes one JSON Lines file in `directory`: a header line with
+    the request parameters, then one {"delay": seconds, "event": {...}} line
+    per event, `delay` counting from the previous event (or from the request
+    for the first one). The files are written when the turn ends.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        self._logger = logging.getLogger(__name__)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._turn = len(list(self.directory.glob('turn-*.jsonl')))
+        self._header: Dict[str, Any] = {}
+        self._events: List[Tuple[float, Dict[str, Any]]] = []
+        self._last = 0.0
+
+    def start_turn(self, **request: Any) -> None:
+        self._header = {
+            'recorded_at': time.time(),
+            'model': request.get('model'),
+            'max_tokens': request.get('max_tokens'),
+            'temperature': request.get('temperature')
+        }
+        self._events = []
+        self._last = time.perf_counter()
+
+    def record(self, event: Any) -> None:
+        if event.type not in RAW_EVENT_TYPES:
+            return
+        now = time.perf_counter()
+        data = event.to_dict()
+        data.pop(_SNAPSHOT_FIELDS.get(event.type, ''), None)
+        self._events.append((now - self._last, data))
+        self._last = now
+
+    def finish_turn(self, complete: bool = True) -> Optional[Path]:
+        if not self._events:
+            return None
+
+        self._turn += 1
+        path = self.directory / f"turn-{self._turn:04d}.jsonl"
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({**self._header, 'complete': complete}, ensure_ascii=False) + "\n")
+                for delay, event in self._events:
+                    f.write(json.dumps({'delay': round(delay, 6), 'event': event}, ensure_ascii=False) + "\n")
+            self._logger.info("Recorded %s stream events to %s", len(self._events), path)
+            return path
+        except Exception as e:
+            self._logger.error("Check failure: Error writing recording: %s", e)
+            return None
+        finally:
+            self._events = []
+
+
+def load_recording(path: Union[str, Path]) -> Tuple[Dict[str, Any], List[Tuple[float, Dict[str, Any]]]]:
+    """Returns (header, [(delay, event), ...]) of a recorded turn."""
+    with open(path, 'r', encoding='utf-8') as f:
+        header = json.loads(f.readline() or '{}')
+        lines = [json.loads(line) for line in f if line.strip()]
+    return header, [(line['delay'], line['event']) for line in lines]
+
+
+def recording_paths(source: Union[str, Path]) -> List[Path]:
+    source = Path(source)
+    if source.is_dir():
+        return sorted(source.rglob('turn-*.jsonl'))
+    return [source]
+
+
+def text_deltas(events: List[Tuple[float, Dict[str, Any]]]) -> Iterator[str]:
+    for _, event in events:
+        if event['type'] == 'content_block_delta' and event['delta'].get('type') == 'text_delta':
+            yield event['delta']['text']
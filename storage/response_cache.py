@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+# Entries start with their store time: {"stored_at": 1700000000.0, ...
+STORED_AT_RE = re.compile(rb'\{"stored_at": ([0-9.e+]+)')
+STORED_AT_BYTES = 64
+# (seconds since the previous piece, text)
+TimedText = List[Tuple[float, str]]
+
+
+class ResponseCache:
+    """Streamed responses on disk, one file per request hash.
+
+    Entries live in `directory/<2 hex digits>/<hash>.json` and hold the text
+    pieces with their inter-arrival times and the usage of the original
+    response. Files are written to a temporary name and renamed into place
+    on a background thread, so readers in this or other processes never see
+    half an entry. Entries expire `max_age` seconds after they were stored,
+    however often they are hit, and once the cache grows past `max_bytes`
+    the least recently used ones go first; a hit bumps the file's mtime,
+    which records the last use. Each process keeps its own index, so
+    entries stored by others count towards the size from the next start.
+    """
+
+    def __init__(self, directory: Union[str, Path], max_bytes: int, max_age: float):
+        self._logger = logging.getLogger(__name__)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        # hash -> (size, stored at, last use); loaded once, kept current by this process
+        self._index: Dict[str, Tuple[int, float, float]] = {}
+        self._size = 0
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache")
+        self._writer.submit(self._load_index)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _load_index(self) -> None:
+        for path in self.directory.glob('*/*.json'):
+            try:
+                stat = path.stat()
+                stored_at = self._stored_at(path)
+            except (OSError, ValueError):
+                continue
+            with self._lock:
+                self._index[path.stem] = (stat.st_size, stored_at, stat.st_mtime)
+                self._size += stat.st_size
+        self._evict()
+
+    @staticmethod
+    def _stored_at(path: Path) -> float:
+        # The first field of every entry, so only the start of the file is read
+        with open(path, 'rb') as f:
+            head = f.read(STORED_AT_BYTES)
+        match = STORED_AT_RE.match(head)
+        if match is None:
+            raise ValueError(f"No stored_at in {path}")
+        return float(match.group(1))
+
+    def get(self, key: str) -> Optional[Tuple[TimedText, Dict[str, int]]]:
+        """The recorded pieces and usage, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            if time.time() - entry['stored_at'] > self.max_age:
+                self._writer.submit(self._remove, key)
+                raise KeyError(key)
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        with self._lock:
+            if key in self._index:
+                size, stored_at, _ = self._index[key]
+                self._index[key] = (size, stored_at, time.time())
+        self.hits += 1
+        return [(delay, text) for delay, text in entry['pieces']], entry['usage']
+
+    def put(self, key: str, pieces: TimedText, usage: Dict[str, int], **info: Any) -> None:
+        entry = {'stored_at': time.time(), **info, 'usage': usage, 'pieces': pieces}
+        self._writer.submit(self._write, key, entry)
+
+    def _write(self, key: str, entry: Dict[str, Any]) -> None:
+        path = self._path(key)
+        temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            path.parent.mkdir(exist_ok=True)
+            data = json.dumps(entry, ensure_ascii=False).encode('utf-8')
+            with open(temporary, 'wb') as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except OSError as e:
+            self._logger.warning("Could not store a cached response: %s", e)
+            return
+        with self._lock:
+            previous = self._index.get(key)
+            self._index[key] = (len(data), entry['stored_at'], time.time())
+            self._size += len(data) - (previous[0] if previous else 0)
+        self._evict()
+
+    def _remove(self, key: str) -> None:
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+        with self._lock:
+            entry = self._index.pop(key, None)
+            if entry:
+                self._size -= entry[0]
+
+    def _evict(self) -> None:
+        with self._lock:
+            cutoff = time.time() - self.max_age
+            expired = {key for key, (_, stored_at, _) in self._index.items() if stored_at < cutoff}
+            if self._size > self.max_bytes:
+                by_use = sorted(self._index.items(), key=lambda item: item[1][2])
+                size = self._size - sum(self._index[key][0] for key in expired)
+                for key, (entry_size, _, _) in by_use:
+                    if size <= self.max_bytes:
+                        break
+                    if key not in expired:
+                        expired.add(key)
+                        size -= entry_size
+        for key in expired:
+            self._remove(key)
+        if expired:
+            self._logger.info("Evicted %s cached responses, %.1f MB left", len(expired), self._size / 1e6)
+
+    def close(self) -> None:
+        self._writer.shutdown(wait=True)
+        if self.hits or self.misses:
+            self._logger.info("Response cache: %s hits, %s misses", self.hits, self.misses)
@@ -0,0 +1,175 @@
+import json
+import sqlite3
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Tuple, Type, TypeVar, Union, TYPE_CHECKING
+from models.skill_check import SkillCheck
+from models.context_update import ContextUpdate
+from utils.history import estimate_tokens
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT,
+    content TEXT NOT NULL,
+    data TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_by_kind ON records (session_id, kind, seq);
+"""
+
+if TYPE_CHECKING:
+    from models.inputs import StoredMessage, StoredSummary
+
+Row = TypeVar('Row', 'StoredMessage', 'StoredSummary')
+
+# Rows fetched per round trip while walking a session backwards
+TAIL_BATCH = 64
+
+
+class SessionStore:
+    """Append-only session log in SQLite (WAL mode).
+
+    Every message, parsed skill check, context update and history summary is
+    one row. Messages carry `seq`, their absolute position in the dialogue, so
+    a session can be resumed from the newest summary plus just the tail of
+    messages that fits the prompt window. Writes go through a single
+    background thread and never block the event loop.
+    """
+
+    def __init__(self, path: Union[str, Path], session_id: str):
+        self._logger = logging.getLogger(__name__)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.session_id = session_id
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-store")
+
+    @staticmethod
+    def new_session_id() -> str:
+        return time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+
+    @staticmethod
+    def latest_session_id(path: Union[str, Path]) -> Optional[str]:
+        if not Path(path).exists():
+            return None
+        conn = sqlite3.connect(str(path))
+        try:
+            row = conn.execute("SELECT id FROM sessions ORDER BY updated_at DESC LIMIT 1").fetchone()
+            return row[0] if row else None
+        except sqlite3.DatabaseError:
+            return None
+        finally:
+            conn.close()
+
+    def exists(self) -> bool:
+        row = self._conn.execute("SELECT 1 FROM sessions WHERE id = ?", (self.session_id,)).fetchone()
+        return row is not None
+
+    def _append(self, kind: str, seq: int, role: Optional[str], content: str, data: Optional[Dict[str, Any]] = None) -> None:
+        self._writer.submit(self._write, kind, seq, role, content, json.dumps(data, ensure_ascii=False) if data else None)
+
+    def _write(self, kind: str, seq: int, role: Optional[str], content: str, data: Optional[str]) -> None:
+        now = time.time()
+        try:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO records (session_id, kind, seq, role, content, data, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.session_id, kind, seq, role, content, data, now)
+                )
+                self._conn.execute(
+                    "INSERT INTO sessions (id, created_at, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET updated_at = excluded.updated_at",
+                    (self.session_id, now, now)
+                )
+        except Exception as e:
+            self._logger.error("Check failure: Error writing session record: %s", e)
+
+    def append_message(self, seq: int, role: str, content: str) -> None:
+        self._append('message', seq, role, content)
+
+    def append_item(self, seq: int, item: Union[SkillCheck, ContextUpdate]) -> None:
+        if isinstance(item, SkillCheck):
+            data = {'skill': item.skill, 'difficulty': item.difficulty, 'success': item.success, 'category': item.category}
+            self._append('skill_check', seq, None, item.content, data)
+        else:
+            self._append('context_update', seq, None, item.content)
+
+    def append_summary(self, offset: int, summary: str) -> None:
+        # `offset` is the seq of the first message that the summary does not cover
+        self._append('summary', offset, None, summary)
+
+    def load_tail(self, budget_tokens: int) -> Tuple[List[Dict[str, str]], Optional[str], int]:
+        """Returns (messages, summary, offset of the first message) for resuming.
+
+        Reads the newest summary and walks messages backwards from the end only
+        until `budget_tokens` is used up, so the cost doesn't grow with the
+        length of the session. Raises ValueError if a row read is damaged.
+        """
+        # pydantic is only needed when resuming, not on the way to the first prompt
+        from models.inputs import StoredMessage, StoredSummary
+
+        row = self._conn.execute(
+            "SELECT seq, content FROM records WHERE session_id = ? AND kind = 'summary' ORDER BY id DESC LIMIT 1",
+            (self.session_id,)
+        ).fetchone()
+        summary_offset, summary = 0, None
+        if row:
+            stored = self._validated(StoredSummary, seq=row[0], content=row[1])
+            summary_offset, summary = stored.seq, stored.content
+
+        cursor = self._conn.execute(
+            "SELECT seq, role, content FROM records WHERE session_id = ? AND kind = 'message' AND seq >= ? "
+            "ORDER BY seq DESC",
+            (self.session_id, summary_offset)
+        )
+        tail: List[StoredMessage] = []
+        used = 0
+        done = False
+        while not done:
+            rows = cursor.fetchmany(TAIL_BATCH)
+            if not rows:
+                break
+            for seq, role, content in rows:
+                message = self._validated(StoredMessage, seq=seq, role=role, content=content)
+                used += estimate_tokens(message.content)
+                if used > budget_tokens and tail:
+                    done = True
+                    break
+                tail.append(message)
+        cursor.close()
+
+        # The window has to open with a user message
+        while tail and tail[-1].role != 'user':
+            tail.pop()
+        tail.reverse()
+
+        messages = [{"role": message.role, "content": message.content} for message in tail]
+        offset = tail[0].seq if tail else summary_offset
+        return messages, summary, offset
+
+    def _validated(self, model: Type[Row], **row: Any) -> Row:
+        from pydantic import ValidationError
+        from models.inputs import describe
+        try:
+            return model.model_validate(row)
+        except ValidationError as e:
+            raise ValueError(f"Session {self.session_id} has a damaged record: {describe(e)}") from None
+
+    def close(self) -> None:
+        self._writer.shutdown(wait=True)
+        self._conn.close()
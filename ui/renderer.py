@@ -1,41 +1,136 @@
 from rich.console import Console
 from rich.text import Text
-from rich.style import Style
-from blessed import Terminal
-from typing import Optional
+from rich.cells import cell_len
+from collections import OrderedDict
+from typing import Optional, List, Tuple, Union
+import functools
 import shutil
+import time
 from models.skill_check import SkillCheck
-from config.constants import SKILL_COLORS
+from config.skill_registry import SKILLS
 from localization.locale_manager import LocaleManager
 from config.config_manager import ConfigManager
+from ui.terminal import get_terminal
+
+# Rendered frames kept for reuse, keyed by content and terminal width
+MEASURE_CACHE_SIZE = 256
+
+def _timed(method):
+    """Adds the time spent in a drawing method to DialogRenderer.render_seconds."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.render_seconds += time.perf_counter() - started
+    return wrapper
 
 class DialogRenderer:
+    """Draws the dialogue as frames written with a single flush each.
+
+    Everything below the last permanent line (the blank spacer, the CONTINUE
+    button, whatever prompt_toolkit echoed and a skill check that is still
+    streaming in) is the tail. Tail entries remember the width they were
+    measured at and are measured again if the terminal was resized before
+    they are erased, so wrapped lines are accounted for exactly.
+    """
+
     def __init__(self, config_manager: Optional[ConfigManager] = None):
+        self.console = Console(width=self._terminal_width())
+        self.term = get_terminal()
+        self.locale = LocaleManager(config_manager=config_manager)
+        self.continue_shown = False
+        # (plain text or rich Text, rows, width the rows were measured at)
+        self._tail: List[Tuple[Union[str, Text], int, int]] = []
+        self._frames: "OrderedDict[tuple, Tuple[str, int]]" = OrderedDict()
+        # Running total of the time spent drawing, read by the turn metrics
+        self.render_seconds = 0.0
+
+    @property
+    def max_width(self) -> int:
+        return self.console.width
+
+    def _terminal_width(self) -> int:
         # Get current terminal width, fallback to 80 if unable to determine
         try:
-            terminal_width = shutil.get_terminal_size().columns
+            return shutil.get_terminal_size().columns
         except (OSError, AttributeError):
-            terminal_width = 80
-        
-        self.console = Console(width=terminal_width)
-        self.term = Terminal()
-        self.locale = LocaleManager(config_manager=config_manager)
-        self.last_lines = 0
-        self.max_width = terminal_width
-        self.continue_shown = False
+            return 80
+
+    def _sync_width(self) -> int:
+        width = self._terminal_width()
+        if width != self.console.width:
+            self.console.width = width
+        return width
+
+    def _rows(self, plain: str, width: int) -> int:
+        return max(1, -(-cell_len(plain) // width))
+
+    def _render(self, text: Text, cache: bool = True) -> Tuple[str, int]:
+        """Returns the styled output for `text` and the number of rows it takes."""
+        key = (text.plain, tuple(text.spans), text.style, self.console.width)
+        frame = self._frames.get(key)
+        if frame is not None:
+            self._frames.move_to_end(key)
+            return frame
+
+        with self.console.capture() as capture:
+            self.console.print(text)
+        output = capture.get()
+        frame = (output, output.count('\n'))
+        if not cache:
+            return frame
+
+        self._frames[key] = frame
+        if len(self._frames) > MEASURE_CACHE_SIZE:
+            self._frames.popitem(last=False)
+        return frame
+
+    def _tail_rows(self, width: int) -> int:
+        rows = 0
+        for entry, measured_rows, measured_width in self._tail:
+            if measured_width == width:
+                rows += measured_rows
+            elif isinstance(entry, Text):
+                rows += self._render(entry, cache=False)[1]
+            else:
+                rows += self._rows(entry, width)
+        return rows
+
+    def _add_to_tail(self, plain: str) -> None:
+        width = self.console.width
+        self._tail.append((plain, self._rows(plain, width), width))
+
+    def _draw(self, body: str, tail: List[Tuple[str, Union[str, Text], int]]) -> None:
+        """Erases the current tail and writes `body` plus the new tail in one go.
+
+        `tail` holds (styled output, entry, rows) for the transient rows.
+        """
+        width = self._sync_width()
+        rows = self._tail_rows(width)
+        erase = self.term.move_up(rows) + self.term.clear_eos if rows > 0 else ""
+
+        self.console.file.write(erase + body + ''.join(output for output, _, _ in tail))
+        self.console.file.flush()
+        self._tail = [(entry, entry_rows, width) for _, entry, entry_rows in tail]
+
+    def _continue_tail(self, show_continue: bool, active: bool) -> List[Tuple[str, Union[str, Text], int]]:
+        tail: List[Tuple[str, Union[str, Text], int]] = [("\n", "", 1)]
+        if show_continue:
+            style = "white on #8F2510" if active else "white on #808080"
+            continue_text = Text("  " + self.locale.translate('ui', 'continue_prompt') + " ▶" + "  ", style=style)
+            output, rows = self._render(continue_text)
+            tail.append((output, continue_text, rows))
+        self.continue_shown = show_continue
+        return tail
 
     def get_skill_color(self, skill_check: SkillCheck) -> str:
-        if skill_check.category:
-            return SKILL_COLORS.get(skill_check.category, '#FFFFFF')
-        return '#FFFFFF'
-
-    def render_skill_check(self, skill_check: SkillCheck, show_continue: bool = False, continue_active: bool = False) -> None:
-        total_lines = self.last_lines + (1 if self.continue_shown else 0)
-        if total_lines > 0:
-            print(self.term.move_up(total_lines) + self.term.clear_eos, end='')
+        skill = SKILLS.get(skill_check.skill)
+        return skill.color if skill else '#FFFFFF'
 
+    def skill_text(self, skill_check: SkillCheck) -> Text:
         text = Text()
-        text.append("\n")
 
         skill_color = self.get_skill_color(skill_check)
         skill_name = self.locale.translate('skills', skill_check.skill)
@@ -48,23 +143,28 @@ class DialogRenderer:
         text.append(" - ", style="white")
 
         text.append(skill_check.content, style="white")
+        return text
 
-        self.console.print(text)
-        self.console.print()
-
-        self.last_lines = 2
-
-        if show_continue:
-            self.show_continue(active=continue_active)
-        else:
-            self.continue_shown = False
-
+    @_timed
+    def render_skill_check(self, skill_check: SkillCheck, show_continue: bool = False, continue_active: bool = False) -> None:
+        self._sync_width()
+        body = "\n" + self._render(self.skill_text(skill_check))[0]
+        self._draw(body, self._continue_tail(show_continue, continue_active))
+
+    @_timed
+    def render_live_check(self, skill_check: SkillCheck, show_continue: bool = True, continue_active: bool = False) -> None:
+        """Redraws a skill check that is still streaming in; it stays part of the tail."""
+        self._sync_width()
+        text = self.skill_text(skill_check)
+        output, rows = self._render(text, cache=False)
+        self._draw("", [("\n", "", 1), (output, text, rows)] + self._continue_tail(show_continue, continue_active))
+
+    @_timed
     def render_user_input(self, text: str) -> None:
-        total_lines = self.last_lines + (1 if self.continue_shown else 0)
-        if total_lines > 0:
-            print(self.term.move_up(total_lines) + self.term.clear_eos, end='')
+        # Replace the line prompt_toolkit echoed with the formatted one
+        self._sync_width()
+        self._add_to_tail(">>> " + text)
 
-        self.console.print()
         formatted_text = Text()
         formatted_text.append(
             self.locale.translate('ui', 'you'),
@@ -72,23 +172,43 @@ class DialogRenderer:
         )
         formatted_text.append(" - ", style="white")
         formatted_text.append(f"{text}", style="white")
-        self.console.print(formatted_text)
 
-        self.last_lines = 0
+        self._draw("\n" + self._render(formatted_text)[0], [])
         self.continue_shown = False
 
+    def render_notice(self, text: str) -> None:
+        """Draws program output that is not part of the dialogue, such as /stats."""
+        self._sync_width()
+        self._draw("\n" + self._render(Text(text, style="dim white"), cache=False)[0], [])
+
+    def render_error(self, text: str) -> None:
+        """Draws an error above the tail and then the tail again, so CONTINUE stays where it was."""
+        self._sync_width()
+        self._draw(self._render(Text(text, style="#C0392B"), cache=False)[0], self._redrawn_tail())
+
+    def _redrawn_tail(self) -> List[Tuple[str, Union[str, Text], int]]:
+        tail: List[Tuple[str, Union[str, Text], int]] = []
+        for entry, _, _ in self._tail:
+            if isinstance(entry, Text):
+                output, rows = self._render(entry, cache=False)
+            else:
+                # Blank spacers and lines echoed by prompt_toolkit
+                output, rows = entry + "\n", self._rows(entry, self.console.width)
+            tail.append((output, entry, rows))
+        return tail
+
+    @_timed
     def show_continue(self, active: bool = False) -> None:
-        continue_text = "  " + self.locale.translate('ui', 'continue_prompt') + " ▶" + "  "
-        style = "white on #8F2510" if active else "white on #808080"
-        self.console.print(continue_text, style=style)
-        self.continue_shown = True
+        self._draw("", self._continue_tail(True, active))
 
     def update_continue(self, active: bool = False) -> None:
-        if self.continue_shown:
-            print(self.term.move_up() + self.term.clear_eos, end='')
         self.show_continue(active=active)
 
+    def acknowledge_continue(self) -> None:
+        # CONTINUE was answered; the empty line prompt_toolkit echoed goes away with the next frame
+        self._add_to_tail("")
+
+    @_timed
     def clear_continue(self) -> None:
-        if self.continue_shown:
-            print(self.term.move_up() + self.term.clear_eos, end='')
-            self.continue_shown = False
+        if self.continue_shown or len(self._tail) > 1:
+            self._draw("", self._continue_tail(False, False))
@@ -1,30 +1,92 @@
 from prompt_toolkit import PromptSession
-from typing import Optional, List
+from prompt_toolkit.application import get_app_or_none, run_in_terminal
+from typing import Optional, List, Callable, Union, TYPE_CHECKING
 from processors.xml_processor import XMLStreamProcessor
-from ui.renderer import DialogRenderer
 from audio.sound_manager import SoundManager
 import logging
-from blessed import Terminal
-from models.skill_check import SkillCheck
+from ui.terminal import get_terminal
+from models.skill_check import SkillCheck, SkillCheckStart, SkillCheckDelta
 from models.context_update import ContextUpdate
+from storage.fact_store import FactStore
+from localization.catalog import load_catalog
+from utils.metrics import TurnTimer
 import asyncio
+import time
+
+if TYPE_CHECKING:
+    from ui.renderer import DialogRenderer
+
+# Marks the end of a response in the pending queue
+_END_OF_RESPONSE = object()
+# Minimum delay between two redraws of a check that is streaming in
+LIVE_FRAME_INTERVAL = 1 / 30
+# Input the program answers itself; it is not part of the dialogue
+COMMANDS = frozenset({'/stats'})
+
+
+class _LiveCheck:
+    """A skill check whose text is still arriving; queued as soon as its tag opens."""
+
+    def __init__(self, start: SkillCheckStart):
+        self.start = start
+        self.parts: List[str] = []
+        self.final: Optional[SkillCheck] = None
+        self.changed = asyncio.Event()
+
+    def append(self, text: str) -> None:
+        self.parts.append(text)
+        self.changed.set()
+
+    def close(self, final: SkillCheck) -> None:
+        self.final = final
+        self.changed.set()
+
+    def current(self) -> SkillCheck:
+        if self.final is not None:
+            return self.final
+        start = self.start
+        return SkillCheck(start.skill, start.difficulty, start.success, ''.join(self.parts), start.category)
+
 
 class DialogStateManager:
-    def __init__(self, config_manager=None):
+    def __init__(self, config_manager=None, fact_store: Optional[FactStore] = None):
         self.session = PromptSession()
         self.processor = XMLStreamProcessor()
-        self.renderer = DialogRenderer(config_manager)
-        self.sound_manager = SoundManager()
-        self.term = Terminal()
+        self._renderer: Optional["DialogRenderer"] = None
+        self.sound_manager = SoundManager(config_manager)
+        self.term = get_terminal()
         self._logger = logging.getLogger(__name__)
         self._current_check: Optional[SkillCheck] = None
-        self._next_check: Optional[SkillCheck] = None
-        self._waiting_for_continue = False
+        self._pending: Optional[asyncio.Queue] = None
+        self._presenter: Optional[asyncio.Task] = None
+        self._on_interrupt: Optional[Callable[[], None]] = None
+        self._live: Optional[_LiveCheck] = None
+        # Called with every parsed item, e.g. to persist it
+        self.item_listeners: List[Callable[[Union[SkillCheck, ContextUpdate]], None]] = []
         self.config_manager = config_manager
+        self.fact_store = fact_store
+        # Called once, right after the first prompt has been drawn
+        self.on_prompt: Optional[Callable[[], None]] = None
+        # Timings of the current or the last response
+        self.turn_timer: Optional[TurnTimer] = None
+
+    @property
+    def renderer(self) -> "DialogRenderer":
+        # rich is only needed once there is something to draw, the prompt comes first
+        if self._renderer is None:
+            from ui.renderer import DialogRenderer
+            self._renderer = DialogRenderer(self.config_manager)
+        return self._renderer
+
+    def _prompt_drawn(self) -> None:
+        if self.on_prompt is not None:
+            # pre_run is called just before the first redraw
+            asyncio.get_running_loop().call_soon(self.on_prompt)
+            self.on_prompt = None
 
     async def handle_user_input(self) -> Optional[str]:
         try:
-            user_input = await self.session.prompt_async(">>> ")
+            user_input = await self.session.prompt_async(">>> ", pre_run=self._prompt_drawn)
 
             if user_input.lower() in ('exit', 'quit'):
                 raise EOFError("Check failure: User requested exit")
@@ -32,6 +94,10 @@ class DialogStateManager:
             if not user_input or user_input.isspace():
                 return None
 
+            if user_input.strip() in COMMANDS:
+                # Not a turn, so it's neither drawn as one nor clicked
+                return user_input
+
             self.renderer.render_user_input(user_input)
             self.sound_manager.play_click()
             return user_input
@@ -40,128 +106,211 @@ class DialogStateManager:
             print(self.term.show_cursor, end='', flush=True)
             raise
 
+    def show_notice(self, text: str) -> None:
+        self.renderer.render_notice(text)
+
+    def show_error(self, message: str) -> None:
+        """Draws a logged error through the renderer; a prompt that is waiting is moved below it."""
+        app = get_app_or_none()
+        if app is not None and app.is_running:
+            run_in_terminal(lambda: self.renderer.render_error(message))
+        else:
+            self.renderer.render_error(message)
+
+    def begin_response(self, on_interrupt: Optional[Callable[[], None]] = None) -> None:
+        """Starts presenting a new response. `on_interrupt` is called when Ctrl-C is pressed on CONTINUE."""
+        self._on_interrupt = on_interrupt
+        if self.config_manager:
+            self.processor.streaming = self.config_manager.snapshot.ui['stream_checks']
+        self.turn_timer = TurnTimer(self.renderer.render_seconds)
+        self._pending = asyncio.Queue()
+        self._presenter = asyncio.ensure_future(self._present())
+
     async def process_response_chunk(self, chunk: str) -> None:
         try:
-            for item in self.processor.process_stream(chunk):
-                if not item:
-                    continue
-
-                if isinstance(item, ContextUpdate):
-                    # Handle context update
-                    await self._handle_context_update(item)
-                elif isinstance(item, SkillCheck):
-                    # Handle skill check (existing logic)
-                    if self._current_check is None:
-                        self._current_check = item
-                        self.renderer.render_skill_check(item, show_continue=True, continue_active=False)
-                        if item.category:
-                            self.sound_manager.play_skill_sound(item.category)
-                    elif self._next_check is None:
-                        self._next_check = item
-                        self.renderer.update_continue(active=True)
-                        self._waiting_for_continue = True
-                        await self._wait_for_continue()
-                    else:
-                        while self._waiting_for_continue:
-                            await asyncio.sleep(0.1)
-                        self._current_check = item
-                        self._next_check = None
-                        self.renderer.render_skill_check(item, show_continue=True, continue_active=False)
-                        if item.category:
-                            self.sound_manager.play_skill_sound(item.category)
+            started = time.perf_counter()
+            items = [item for item in self.processor.process_stream(chunk) if item]
+            if self.turn_timer:
+                self.turn_timer.chunk(time.perf_counter() - started)
+            for item in items:
+                self._enqueue(item)
 
         except Exception as e:
-            self._logger.error(f"Check failure: Error processing chunk: {e}")
+            self._logger.error("Check failure: Error processing chunk: %s", e)
 
-    async def _handle_context_update(self, context_update: ContextUpdate) -> None:
-        """Handle context update by appending to user_context.txt and generating a response."""
+    def _enqueue(self, item: Union[SkillCheck, SkillCheckStart, SkillCheckDelta, ContextUpdate]) -> None:
+        if isinstance(item, SkillCheckDelta):
+            if self._live is not None:
+                self._live.append(item.text)
+            return
+
+        if isinstance(item, SkillCheckStart):
+            self._close_live()
+            self._live = _LiveCheck(item)
+            self._queue(self._live)
+            return
+
+        for listener in self.item_listeners:
+            listener(item)
+
+        if isinstance(item, SkillCheck) and self._live is not None:
+            # Final version of the check that is already on screen
+            self._live.close(item)
+            self._live = None
+            return
+
+        if isinstance(item, ContextUpdate):
+            item = self._handle_context_update(item)
+            if item is None:
+                return
+
+        self._queue(item)
+
+    def _queue(self, item: Union[SkillCheck, _LiveCheck]) -> None:
+        if self._presenter is None:
+            self.begin_response()
+        self._pending.put_nowait(item)
+
+    def _close_live(self) -> None:
+        # The processor always finishes a streaming check, this only guards against losing one
+        if self._live is not None:
+            self._live.close(self._live.current())
+            self._live = None
+
+    async def _present(self) -> None:
+        """Shows queued checks one at a time, gating each next one behind CONTINUE.
+
+        Runs alongside the network stream, so later checks keep arriving in the
+        queue while the user is reading the current one.
+        """
         try:
-            # Append to user_context.txt
-            context_file_path = "config/user_context.txt"
-            with open(context_file_path, 'a', encoding='utf-8') as f:
-                f.write(f"\n{context_update.content}\n")
-            
-            self._logger.info(f"Context updated with: {context_update.content}")
-            
-            # Create a skill check response to inform the user
-            # Use Encyclopedia as it's the skill that represents knowledge and learning
-            from models.skill_check import SkillCheck
-            
+            check = await self._pending.get()
+            while check is not _END_OF_RESPONSE:
+                if isinstance(check, _LiveCheck):
+                    await self._present_live(check)
+                else:
+                    self._current_check = check
+                    self.renderer.render_skill_check(check, show_continue=True, continue_active=False)
+                    self.turn_timer.check_shown()
+                    if check.category:
+                        self.sound_manager.play_skill_sound(check.category)
+
+                check = await self._pending.get()
+                if check is _END_OF_RESPONSE:
+                    break
+
+                self.renderer.update_continue(active=True)
+                await self._wait_for_continue()
+
+        except KeyboardInterrupt:
+            print(self.term.show_cursor, end='', flush=True)
+            if self._on_interrupt:
+                self._on_interrupt()
+        except Exception as e:
+            self._logger.error("Check failure: Error presenting skill checks: %s", e)
+
+    async def _present_live(self, live: _LiveCheck) -> None:
+        """Shows the header of a streaming check at once and redraws it as text arrives."""
+        self._current_check = live.current()
+        self.renderer.render_live_check(self._current_check)
+        self.turn_timer.check_shown()
+        if live.start.category:
+            self.sound_manager.play_skill_sound(live.start.category)
+
+        while live.final is None:
+            await live.changed.wait()
+            live.changed.clear()
+            self._current_check = live.current()
+            self.renderer.render_live_check(self._current_check)
+            # Deltas that arrive meanwhile are drawn together in the next frame
+            await asyncio.sleep(LIVE_FRAME_INTERVAL)
+
+        self._current_check = live.final
+        self.renderer.render_skill_check(live.final, show_continue=True, continue_active=False)
+
+    def _handle_context_update(self, context_update: ContextUpdate) -> Optional[SkillCheck]:
+        """Handle context update by storing the new fact and building a notification check."""
+        try:
+            if self.fact_store is None:
+                return None
+            if not self.fact_store.add(context_update.content):
+                # Already known, nothing new to tell the user
+                return None
+
+            self._logger.info("Context updated with: %s", context_update.content)
+
             # Get the language for the notification
             language = self.config_manager.get_language() if self.config_manager else 'en'
-            
-            if language == 'ru':
-                context_notification = f"Новая информация добавлена в память: {context_update.content}"
-            else:
-                context_notification = f"New information added to memory: {context_update.content}"
-            
-            notification_check = SkillCheck(
+
+            context_notification = load_catalog(language).translate('ui', 'context_added').format(
+                content=context_update.content
+            )
+
+            # Use Encyclopedia as it's the skill that represents knowledge and learning
+            return SkillCheck(
                 skill="Encyclopedia",
                 difficulty="Medium",
                 success=True,
                 content=context_notification,
                 category="INTELLECT"
             )
-            
-            # Render the notification
-            if self._current_check is None:
-                self._current_check = notification_check
-                self.renderer.render_skill_check(notification_check, show_continue=True, continue_active=False)
-                self.sound_manager.play_skill_sound("INTELLECT")
-            elif self._next_check is None:
-                self._next_check = notification_check
-                self.renderer.update_continue(active=True)
-                self._waiting_for_continue = True
-                await self._wait_for_continue()
-                
+
         except Exception as e:
-            self._logger.error(f"Check failure: Error handling context update: {e}")
+            self._logger.error("Check failure: Error handling context update: %s", e)
+            return None
 
     async def _wait_for_continue(self) -> None:
-        if not self._waiting_for_continue:
-            return
-
+        started = time.perf_counter()
         try:
             await self.session.prompt_async("", refresh_interval=None)
-            self.renderer.clear_continue()
+            self.turn_timer.continue_wait_seconds += time.perf_counter() - started
+            self.renderer.acknowledge_continue()
             self.sound_manager.play_click()
 
-            if self._next_check:
-                self._current_check = self._next_check
-                self._next_check = None
-                self.renderer.render_skill_check(self._current_check, show_continue=True, continue_active=False)
-                if self._current_check.category:
-                    self.sound_manager.play_skill_sound(self._current_check.category)
-
-            self._waiting_for_continue = False
-
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            raise
         except Exception as e:
-            self._logger.error(f"Check failure: Error waiting for continue: {e}")
+            self._logger.error("Check failure: Error waiting for continue: %s", e)
 
     async def finish_response(self) -> None:
         try:
-            remaining_items = list(self.processor.process_stream(self.processor.get_remaining_buffer()))
-
-            for item in remaining_items:
-                if isinstance(item, ContextUpdate):
-                    await self._handle_context_update(item)
-                elif isinstance(item, SkillCheck):
-                    if self._current_check is None:
-                        self._current_check = item
-                        self.renderer.render_skill_check(item, show_continue=False)
-                        if item.category:
-                            self.sound_manager.play_skill_sound(item.category)
-                    else:
-                        self._next_check = item
-                        self.renderer.update_continue(active=True)
-                        self._waiting_for_continue = True
-                        await self._wait_for_continue()
-
-            self.processor.clear_buffer()
-            self._current_check = None
-            self._next_check = None
-            self._waiting_for_continue = False
+            for item in self.processor.flush():
+                self._enqueue(item)
+            self._close_live()
+
+            if self._presenter is not None:
+                self._pending.put_nowait(_END_OF_RESPONSE)
+                await self._presenter
+
+            self._reset_response()
             self.renderer.clear_continue()
+            if self.turn_timer:
+                self.turn_timer.finish(self.renderer.render_seconds)
 
         except Exception as e:
-            self._logger.error(f"Check failure: Error processing final chunk: {e}")
+            self._logger.error("Check failure: Error processing final chunk: %s", e)
+
+    def _reset_response(self) -> None:
+        self._current_check = None
+        self._live = None
+        self._pending = None
+        self._presenter = None
+        self._on_interrupt = None
+
+    def abort_response(self) -> None:
+        if self._presenter is not None and not self._presenter.done():
+            self._presenter.cancel()
+        self.processor.clear_buffer()
+        self._reset_response()
+        self.renderer.clear_continue()
+        print(self.term.show_cursor, end='', flush=True)
+
+    def restart_response(self) -> None:
+        """Drops a response that broke off, so it can be streamed again from the start."""
+        on_interrupt, turn_timer = self._on_interrupt, self.turn_timer
+        self.abort_response()
+        language = self.config_manager.get_language() if self.config_manager else 'en'
+        self.show_notice(load_catalog(language).translate('ui', 'response_restarted'))
+        self.begin_response(on_interrupt)
+        # Timed from the request, not from the restart
+        self.turn_timer = turn_timer
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, TextIO, Union
+
+from audio.sound_manager import SoundManager
+from localization.locale_manager import LocaleManager
+from models.context_update import ContextUpdate
+from models.skill_check import SkillCheck
+from processors.xml_processor import XMLStreamProcessor
+from storage.fact_store import FactStore
+from utils.metrics import TurnTimer
+from utils.turns import item_record
+
+# 'tty' is the interactive UI, the others are written by StreamDialog
+OUTPUT_MODES = ('auto', 'tty', 'plain', 'json')
+
+
+def resolve_output_mode(mode: str) -> str:
+    """'auto' is the interactive UI only when both stdin and stdout are terminals."""
+    if mode != 'auto':
+        return mode
+    return 'tty' if sys.stdin.isatty() and sys.stdout.isatty() else 'plain'
+
+
+class StreamDialog:
+    """The dialogue over plain stdin and stdout, for pipes, log collectors and slow links.
+
+    Every input line is one message. Each finished skill check, and each
+    context update that was stored, is written as one line as soon as the
+    parser yields it: in `plain` mode as text without any styling or
+    cursor movement, in `json` mode as a compact JSON object with the same
+    fields as batch results and its time since the request in t_ms. A
+    response ends with an empty line, or a `done` object. One that broke
+    off and is streamed again from the start is announced with a notice
+    line, or a `restart` object, and its checks follow anew. There is no
+    CONTINUE gate, nothing is redrawn and no sound is played.
+
+    Stands in for DialogStateManager in the main loop.
+    """
+
+    def __init__(
+        self,
+        mode: str,
+        config_manager=None,
+        fact_store: Optional[FactStore] = None,
+        output: Optional[TextIO] = None
+    ):
+        self._logger = logging.getLogger(__name__)
+        self.json = mode == 'json'
+        self.output = output or sys.stdout
+        self.processor = XMLStreamProcessor()
+        self.locale = LocaleManager(config_manager=config_manager) if config_manager else LocaleManager()
+        self.sound_manager = SoundManager()
+        self.sound_manager.enabled = False
+        self.config_manager = config_manager
+        self.fact_store = fact_store
+        # Called with every parsed item, e.g. to persist it
+        self.item_listeners: List[Callable[[Union[SkillCheck, ContextUpdate]], None]] = []
+        # Called once, before the first message is read
+        self.on_prompt: Optional[Callable[[], None]] = None
+        self.turn_timer: Optional[TurnTimer] = None
+        # Seconds spent formatting and writing output, like DialogRenderer.render_seconds
+        self.render_seconds = 0.0
+
+    async def handle_user_input(self) -> Optional[str]:
+        if self.on_prompt is not None:
+            asyncio.get_running_loop().call_soon(self.on_prompt)
+            self.on_prompt = None
+        # A thread, since stdin may be a regular file that can't be polled
+        line = await asyncio.to_thread(sys.stdin.readline)
+        if not line:
+            raise EOFError("End of input")
+        user_input = line.strip()
+        if user_input.lower() in ('exit', 'quit'):
+            raise EOFError("User requested exit")
+        return user_input or None
+
+    def _write(self, line: str) -> None:
+        started = time.perf_counter()
+        try:
+            self.output.write(line + "\n")
+            # Every event goes out at once, a pipe would otherwise hold it back
+            self.output.flush()
+        except (BrokenPipeError, ValueError):
+            raise EOFError("Output closed")
+        finally:
+            self.render_seconds += time.perf_counter() - started
+
+    def _write_record(self, record: Dict[str, Any]) -> None:
+        self._write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+
+    def _elapsed_ms(self) -> Optional[float]:
+        if self.turn_timer is None:
+            return None
+        return round((time.perf_counter() - self.turn_timer.started) * 1000, 1)
+
+    def show_error(self, message: str) -> None:
+        if not self.json:
+            print(message, file=sys.stderr, flush=True)
+            return
+        try:
+            self._write_record({'type': 'error', 'error': message})
+        except EOFError:
+            # Nobody is reading anymore; the main loop finds out on its next write
+            pass
+
+    def show_notice(self, text: str) -> None:
+        if self.json:
+            self._write_record({'type': 'notice', 'text': text})
+        else:
+            self._write(text)
+
+    def begin_response(self, on_interrupt: Optional[Callable[[], None]] = None) -> None:
+        # Only finished checks are written, the streaming events would be dropped anyway
+        self.processor.streaming = False
+        self.turn_timer = TurnTimer(self.render_seconds)
+
+    async def process_response_chunk(self, chunk: str) -> None:
+        try:
+            started = time.perf_counter()
+            items = [item for item in self.processor.process_stream(chunk) if item]
+            if self.turn_timer:
+                self.turn_timer.chunk(time.perf_counter() - started)
+            for item in items:
+                self._emit(item)
+        except EOFError:
+            raise
+        except Exception as e:
+            self._logger.error("Check failure: Error processing chunk: %s", e)
+
+    def _emit(self, item: Union[SkillCheck, ContextUpdate]) -> None:
+        for listener in self.item_listeners:
+            listener(item)
+
+        if isinstance(item, ContextUpdate):
+            if self.fact_store is None or not self.fact_store.add(item.content):
+                return
+            self._logger.info("Context updated with: %s", item.content)
+
+        if self.turn_timer:
+            self.turn_timer.check_shown()
+        if self.json:
+            self._write_record({**item_record(item), 't_ms': self._elapsed_ms()})
+        elif isinstance(item, ContextUpdate):
+            self._write(self.locale.translate('ui', 'context_added').format(content=item.content))
+        else:
+            self._write(self._plain_check(item))
+
+    def _plain_check(self, check: SkillCheck) -> str:
+        # The same line as DialogRenderer.skill_text, without the colors
+        skill = self.locale.translate('skills', check.skill).upper()
+        difficulty = self.locale.translate('difficulties', check.difficulty)
+        result = self.locale.translate('results', 'Success' if check.success else 'Failure')
+        return f"{skill} [{difficulty}: {result}] - {check.content}"
+
+    async def finish_response(self) -> None:
+        try:
+            for item in self.processor.flush():
+                if item:
+                    self._emit(item)
+            if self.json:
+                ttft = self.turn_timer.values()['ttft_seconds'] if self.turn_timer else None
+                self._write_record({
+                    'type': 'done', 't_ms': self._elapsed_ms(),
+                    'ttft_ms': round(ttft * 1000, 1) if ttft is not None else None
+                })
+            else:
+                self._write("")
+            if self.turn_timer:
+                self.turn_timer.finish(self.render_seconds)
+        except EOFError:
+            raise
+        except Exception as e:
+            self._logger.error("Check failure: Error processing final chunk: %s", e)
+
+    def abort_response(self) -> None:
+        self.processor.clear_buffer()
+
+    def restart_response(self) -> None:
+        # What was written stays written, the reader is told to drop it
+        self.processor.clear_buffer()
+        if self.json:
+            self._write_record({'type': 'restart', 't_ms': self._elapsed_ms()})
+        else:
+            self._write(self.locale.translate('ui', 'response_restarted'))
@@ -0,0 +1,8 @@
+from functools import lru_cache
+from blessed import Terminal
+
+
+@lru_cache(maxsize=None)
+def get_terminal() -> Terminal:
+    """The one blessed Terminal shared by the whole UI."""
+    return Terminal()
@@ -0,0 +1,265 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, TextIO, Union
+
+from config.config_manager import ConfigManager
+from providers.base import Provider, Usage
+from utils.history import DialogueHistory
+from utils.prompt_builder import PromptBuilder
+from utils.turns import Item, stream_turn, item_record, usage_record
+from utils.workers import WORKER_CONTEXT, init_worker, open_provider, shard_of
+
+# Output records that close a conversation
+TERMINAL_TYPES = ('done', 'error')
+
+
+@dataclass(frozen=True)
+class Conversation:
+    id: str
+    turns: List[str]
+    language: Optional[str] = None
+
+
+def load_conversations(path: Union[str, Path]) -> List[Conversation]:
+    """Reads one conversation per line: {"id": ..., "prompt": "..."} or
+    {"id": ..., "turns": ["...", "..."]}, optionally with "language"."""
+    # pydantic stays off the interactive startup path
+    from pydantic import ValidationError
+    from models.inputs import BatchLine, describe
+
+    conversations: List[Conversation] = []
+    seen: Set[str] = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                data = BatchLine.model_validate_json(line)
+            except ValidationError as e:
+                raise ValueError(f"Invalid conversation on line {number}: {describe(e)}") from None
+            conversation_id = str(data.id if data.id is not None else number)
+            if conversation_id in seen:
+                raise ValueError(f"Duplicate conversation id {conversation_id!r} on line {number}")
+            seen.add(conversation_id)
+            conversations.append(Conversation(conversation_id, data.messages, data.language))
+    return conversations
+
+
+# Called with a conversation id, its records as JSON lines and "done" or "error"
+ResultSink = Callable[[str, str, str], None]
+
+
+class BatchOutput:
+    """The results file of a batch, written by one process only.
+
+    A conversation's records (one per parsed item, then a "done" or "error"
+    record) are appended together once it has finished, so after an
+    interruption the file holds only whole conversations, and running again
+    skips the ones that are done.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self._logger = logging.getLogger(__name__)
+        self.path = Path(path)
+        self.finished = 0
+        self.failed = 0
+        self.total = 0
+        self._file: Optional[TextIO] = None
+
+    def completed_ids(self) -> Set[str]:
+        """Ids already done, after cutting off records of a conversation that was interrupted while being written."""
+        if not self.path.exists():
+            return set()
+
+        done: Set[str] = set()
+        keep = 0
+        with open(self.path, 'rb') as f:
+            position = 0
+            for line in f:
+                position += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if record.get('type') in TERMINAL_TYPES:
+                    keep = position
+                    if record['type'] == 'done':
+                        done.add(record['id'])
+        if keep < self.path.stat().st_size:
+            self._logger.warning("Dropping an unfinished conversation from the end of %s", self.path)
+            os.truncate(self.path, keep)
+        return done
+
+    def pending(self, conversations: List[Conversation]) -> List[Conversation]:
+        done = self.completed_ids()
+        pending = [conversation for conversation in conversations if conversation.id not in done]
+        self._logger.info("Batch: %s conversations, %s already done", len(conversations), len(conversations) - len(pending))
+        self.total = len(pending)
+        return pending
+
+    def write(self, conversation_id: str, lines: str, status: str) -> None:
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        # One write per conversation, in the order they finish
+        self._file.write(lines)
+        self._file.flush()
+        if status == 'done':
+            self.finished += 1
+        else:
+            self.failed += 1
+        print(f"[{self.finished + self.failed}/{self.total}] {conversation_id}: {status}", file=sys.stderr)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class BatchRunner:
+    """Runs conversations through the model without the terminal UI or sound.
+
+    Up to `concurrency` conversations run at once, each with its own history
+    and parser; each finished conversation goes to the sink in one piece.
+    """
+
+    def __init__(self, provider: Provider, config_manager: ConfigManager, concurrency: int = 4):
+        self._logger = logging.getLogger(__name__)
+        self.provider = provider
+        self.config_manager = config_manager
+        self.concurrency = concurrency
+        # Same request layout as the interactive mode, including the cache breakpoints
+        self.prompt_builder = PromptBuilder(cache_enabled=config_manager.get_prompt_cache_config()['enabled'])
+
+    async def run(self, conversations: List[Conversation], sink: ResultSink) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_one(conversation: Conversation) -> None:
+            async with semaphore:
+                records = await self._run_conversation(conversation)
+            lines = ''.join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+            sink(conversation.id, lines, records[-1]['type'])
+
+        await asyncio.gather(*(run_one(conversation) for conversation in conversations))
+
+    async def _run_conversation(self, conversation: Conversation) -> List[Dict[str, Any]]:
+        history = DialogueHistory()
+        records: List[Dict[str, Any]] = []
+        started = time.perf_counter()
+        usage = Usage()
+        attempts = 0
+        ttft: List[Optional[float]] = []
+        language = conversation.language or self.config_manager.get_language()
+        try:
+            for turn, user_input in enumerate(conversation.turns):
+                async def collect(item: Item, elapsed: float, turn: int = turn) -> None:
+                    records.append({'id': conversation.id, 'turn': turn, **item_record(item), 't_ms': elapsed})
+
+                history.add_message("user", user_input)
+                completion, turn_ttft = await stream_turn(
+                    self.provider, self.config_manager, self.prompt_builder, history, language, collect
+                )
+                history.add_message("assistant", completion.text)
+                usage += completion.usage
+                attempts += completion.attempts
+                ttft.append(turn_ttft)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._logger.error("Check failure: Batch conversation %s failed: %s", conversation.id, e)
+            return records + [{'id': conversation.id, 'type': 'error', 'turn': len(history.messages) // 2, 'error': str(e)}]
+
+        return records + [{
+            'id': conversation.id, 'type': 'done', 'turns': len(conversation.turns),
+            'seconds': round(time.perf_counter() - started, 3), 'ttft_ms': ttft,
+            'attempts': attempts, 'usage': usage_record(usage)
+        }]
+
+
+def batch_worker(
+    index: int, conversations: List[Conversation], results: Any, concurrency: int, log_format: str, base_url: Optional[str]
+) -> None:
+    """Entry point of a worker process: runs its share and puts every result on `results`, then None."""
+    init_worker(f"batch-{index}", log_format)
+    asyncio.run(_batch_worker(index, conversations, results, concurrency, base_url))
+
+
+async def _batch_worker(
+    index: int, conversations: List[Conversation], results: Any, concurrency: int, base_url: Optional[str]
+) -> None:
+    logger = logging.getLogger(__name__)
+    provider = None
+    try:
+        config_manager = ConfigManager()
+        provider = open_provider(config_manager, base_url)
+        # The lines are already JSON, so they cross the pipe as one string per conversation
+        await BatchRunner(provider, config_manager, concurrency).run(
+            conversations, lambda conversation_id, lines, status: results.put((conversation_id, lines, status))
+        )
+    except Exception as e:
+        logger.error("Check failure: Batch worker %s: %s", index, e)
+    finally:
+        results.put(None)
+        if provider is not None:
+            await provider.close()
+
+
+async def run_workers(
+    conversations: List[Conversation],
+    workers: int,
+    concurrency: int,
+    sink: ResultSink,
+    log_format: str = 'text',
+    base_url: Optional[str] = None
+) -> None:
+    """Runs the conversations in `workers` processes, `concurrency` at a time in each.
+
+    Conversations are sharded by id with shard_of, and results are handed
+    to `sink` in this process, so the output still has a single writer.
+    """
+    logger = logging.getLogger(__name__)
+    shards: List[List[Conversation]] = [[] for _ in range(workers)]
+    for conversation in conversations:
+        shards[shard_of(conversation.id, workers)].append(conversation)
+
+    results = WORKER_CONTEXT.Queue()
+    processes = [
+        WORKER_CONTEXT.Process(
+            target=batch_worker, name=f"batch-{index}", daemon=True,
+            args=(index, shard, results, concurrency, log_format, base_url)
+        )
+        for index, shard in enumerate(shards) if shard
+    ]
+    for process in processes:
+        process.start()
+
+    def next_result() -> Any:
+        # Wakes up now and then to notice workers that died without saying goodbye
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    return None
+
+    running = len(processes)
+    try:
+        while running:
+            result = await asyncio.to_thread(next_result)
+            if result is None:
+                running -= 1
+                continue
+            sink(*result)
+    finally:
+        for process in processes:
+            process.join(5)
+            if process.is_alive():
+                logger.warning("Batch worker %s did not stop, terminating it", process.name)
+                process.terminate()
@@ -1,5 +1,16 @@
+from typing import Optional
+
 class XMLProcessingError(Exception):
     pass
 
 class DialogueSystemError(Exception):
     pass
+
+class ConfigurationError(DialogueSystemError):
+    pass
+
+class ProviderError(DialogueSystemError):
+    def __init__(self, message: str, retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
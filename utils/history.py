@@ -1,15 +1,143 @@
-from typing import List, Dict
+from typing import List, Dict, Optional, Callable, Awaitable
 from dataclasses import dataclass, field
+import asyncio
+import logging
+
+# Rough cost of one token in UTF-8 bytes: ~4 for English, ~2 characters for Cyrillic
+BYTES_PER_TOKEN = 4
+# Per-message overhead of the role markers in the request
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def estimate_tokens(text: str) -> int:
+    return len(text.encode('utf-8')) // BYTES_PER_TOKEN + 1
 
 @dataclass
 class DialogueHistory:
     messages: List[Dict[str, str]] = field(default_factory=list)
+    # Running summary of the turns that were compacted away
+    summary: Optional[str] = None
+    # Position of messages[0] in the whole dialogue, including compacted turns
+    offset: int = 0
+    # Local estimates are multiplied by this to track the real token counts
+    token_scale: float = 1.0
+    _token_counts: List[int] = field(default_factory=list, repr=False)
 
     def add_message(self, role: str, content: str):
         self.messages.append({"role": role, "content": content})
+        self._token_counts.append(estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS)
+
+    def pop_message(self) -> Optional[Dict[str, str]]:
+        if self.messages:
+            self._token_counts.pop()
+            return self.messages.pop()
+        return None
 
     def get_messages(self) -> List[Dict[str, str]]:
         return self.messages
 
+    def next_seq(self) -> int:
+        return self.offset + len(self.messages)
+
+    def load(self, messages: List[Dict[str, str]], summary: Optional[str], offset: int) -> None:
+        self.clear()
+        for msg in messages:
+            self.add_message(msg["role"], msg["content"])
+        self.summary = summary
+        self.offset = offset
+
     def clear(self):
         self.messages = []
+        self._token_counts = []
+        self.summary = None
+        self.offset = 0
+
+    def count_tokens(self, text: str) -> int:
+        return int(estimate_tokens(text) * self.token_scale)
+
+    def total_tokens(self) -> int:
+        return int(sum(self._token_counts) * self.token_scale)
+
+    def calibrate(self, estimated: int, actual: int) -> None:
+        """Nudges the estimate scale towards the token count reported by the API."""
+        if estimated > 0 and actual > 0:
+            observed = self.token_scale * actual / estimated
+            self.token_scale = 0.7 * self.token_scale + 0.3 * observed
+
+    def _fit(self, budget: int) -> int:
+        """Index of the oldest message such that the tail fits into `budget` tokens.
+
+        The tail always starts on a user message and always keeps the newest one.
+        """
+        used = 0
+        start = len(self.messages)
+        for index in range(len(self.messages) - 1, -1, -1):
+            used += int(self._token_counts[index] * self.token_scale)
+            if used > budget and start < len(self.messages):
+                break
+            if self.messages[index]["role"] == "user":
+                start = index
+        return start
+
+    def get_window(self, budget: int) -> List[Dict[str, str]]:
+        return self.messages[self._fit(budget):]
+
+    def compaction_cut(self, keep_tokens: int) -> int:
+        # Always keep at least the newest exchange verbatim
+        return min(self._fit(keep_tokens), max(0, len(self.messages) - 2))
+
+    def apply_compaction(self, cut: int, summary: str) -> None:
+        del self.messages[:cut]
+        del self._token_counts[:cut]
+        self.offset += cut
+        self.summary = summary
+
+
+class HistoryCompactor:
+    """Folds old turns into DialogueHistory.summary in the background.
+
+    `summarize` receives the previous summary and the messages to fold in and
+    returns the new summary. Compaction never blocks the turn loop: until it
+    finishes, the request window simply leaves the oldest turns out.
+    """
+
+    def __init__(
+        self,
+        history: DialogueHistory,
+        summarize: Callable[[Optional[str], List[Dict[str, str]]], Awaitable[str]],
+        budget_tokens: int,
+        on_compacted: Optional[Callable[[DialogueHistory], None]] = None
+    ):
+        self._logger = logging.getLogger(__name__)
+        self.history = history
+        self.budget_tokens = budget_tokens
+        self._summarize = summarize
+        self._on_compacted = on_compacted
+        self._task: Optional[asyncio.Task] = None
+
+    def maybe_compact(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        if self.history.total_tokens() <= self.budget_tokens:
+            return
+        self._task = asyncio.ensure_future(self._compact())
+
+    async def _compact(self) -> None:
+        cut = self.history.compaction_cut(self.budget_tokens // 2)
+        if cut <= 0:
+            return
+
+        try:
+            summary = await self._summarize(self.history.summary, self.history.messages[:cut])
+        except Exception as e:
+            self._logger.warning("History compaction failed: %s", e)
+            return
+
+        if summary.strip():
+            self.history.apply_compaction(cut, summary.strip())
+            self._logger.info("Compacted %s messages, %s history tokens left", cut, self.history.total_tokens())
+            if self._on_compacted:
+                self._on_compacted(self.history)
+
+    def cancel(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
@@ -1,28 +1,138 @@
+import asyncio
+import atexit
+import json
 import logging
+import queue
 import sys
+from datetime import datetime, timezone
 from pathlib import Path
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Callable, Optional
 
-def setup_logging():
-    log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_FORMATS = ('text', 'json')
+
+_listener: Optional[QueueListener] = None
+_console: Optional["ConsoleHandler"] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers and jq."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class LocalQueueHandler(QueueHandler):
+    """Puts records on the queue as they are.
+
+    The stock prepare() formats the record on the calling thread and drops
+    its exc_info, so it can be pickled. The queue never leaves the process,
+    so formatting is left to the listener's handlers, which also get the
+    traceback to format their own way.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class ConsoleHandler(logging.Handler):
+    """Errors for the user.
+
+    Runs on the listener thread, so it never writes into the middle of a
+    frame: once a sink is attached, messages are handed to it on its event
+    loop and drawn by the UI between frames. Before that, and after the loop
+    is gone, they go to stdout.
+    """
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self._sink: Optional[Callable[[str], None]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def attach(self, sink: Callable[[str], None], loop: asyncio.AbstractEventLoop) -> None:
+        self._sink, self._loop = sink, loop
+
+    def detach(self) -> None:
+        self._sink, self._loop = None, None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            message = self.format(record)
+            sink, loop = self._sink, self._loop
+            if sink is not None and loop is not None and not loop.is_closed():
+                try:
+                    loop.call_soon_threadsafe(sink, message)
+                    return
+                except RuntimeError:
+                    # The loop closed in the meantime
+                    pass
+            sys.stdout.write(message + "\n")
+            sys.stdout.flush()
+        except Exception:
+            self.handleError(record)
+
+
+def setup_logging(log_format: str = 'text', process_name: Optional[str] = None):
+    """Routes all records through a queue to a background listener thread.
+
+    Callers only put the record on the queue; formatting, file writes and
+    rotation happen on the listener thread, off the event loop. Worker
+    processes pass `process_name` to get a log file of their own, since
+    rotation can't be shared between processes.
+    """
+    global _listener, _console
 
     log_dir = Path('logs')
     log_dir.mkdir(exist_ok=True)
 
+    formatter = JsonFormatter() if log_format == 'json' else logging.Formatter(LOG_FORMAT)
+    stem = f"disco_inferno.{process_name}" if process_name else 'disco_inferno'
     file_handler = RotatingFileHandler(
-        log_dir / 'disco_inferno.log',
+        log_dir / (f"{stem}.jsonl" if log_format == 'json' else f"{stem}.log"),
         maxBytes=10*1024*1024,
         backupCount=5,
         encoding='utf-8'
     )
-    file_handler.setFormatter(logging.Formatter(log_format))
+    file_handler.setFormatter(formatter)
     file_handler.setLevel(logging.INFO)
 
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(logging.Formatter(log_format))
-    console_handler.setLevel(logging.ERROR)
+    _console = ConsoleHandler()
+    _console.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _listener = QueueListener(records, file_handler, _console, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
 
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.INFO)
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(console_handler)
+    root_logger.addHandler(LocalQueueHandler(records))
+
+
+def route_console(sink: Callable[[str], None], loop: asyncio.AbstractEventLoop) -> None:
+    """Sends console errors to `sink`, called on `loop`, instead of stdout."""
+    if _console is not None:
+        _console.attach(sink, loop)
+
+
+def release_console() -> None:
+    if _console is not None:
+        _console.detach()
+
+
+def stop_logging() -> None:
+    """Writes out whatever is still queued and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,190 @@
+import json
+import os
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Mapping, Optional
+
+# name -> description; the names double as Prometheus metric names after the prefix
+METRICS: Dict[str, str] = {
+    'ttft_seconds': "Time from sending the request to the first text",
+    'first_check_seconds': "Time from sending the request to the first skill check on screen",
+    'output_tokens_per_second': "Output tokens per second between the first and the last text",
+    'input_tokens': "Uncached input tokens",
+    'output_tokens': "Output tokens",
+    'cache_read_tokens': "Input tokens read from the prompt cache",
+    'cache_write_tokens': "Input tokens written to the prompt cache",
+    'parse_seconds': "Time spent in XMLStreamProcessor",
+    'render_seconds': "Time spent in DialogRenderer",
+    'continue_wait_seconds': "Time spent waiting for the user to press CONTINUE",
+    'turn_seconds': "Time from sending the request to the end of the turn",
+}
+PROMETHEUS_PREFIX = "disco_"
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class TurnTimer:
+    """Timestamps and accumulated times of one turn, filled in as it runs."""
+
+    __slots__ = ('started', 'first_token', 'last_token', 'first_check', 'finished',
+                 'parse_seconds', 'continue_wait_seconds', 'render_seconds', '_render_base')
+
+    def __init__(self, render_seconds: float = 0.0):
+        self.started = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.last_token: Optional[float] = None
+        self.first_check: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.parse_seconds = 0.0
+        self.continue_wait_seconds = 0.0
+        self.render_seconds = 0.0
+        # The renderer keeps a running total, the turn gets the difference
+        self._render_base = render_seconds
+
+    def chunk(self, parse_seconds: float) -> None:
+        now = time.perf_counter()
+        if self.first_token is None:
+            self.first_token = now
+        self.last_token = now
+        self.parse_seconds += parse_seconds
+
+    def check_shown(self) -> None:
+        if self.first_check is None:
+            self.first_check = time.perf_counter()
+
+    def finish(self, render_seconds: float) -> None:
+        self.finished = time.perf_counter()
+        self.render_seconds = render_seconds - self._render_base
+
+    def values(self, usage: Any = None) -> Dict[str, Optional[float]]:
+        def since_start(moment: Optional[float]) -> Optional[float]:
+            return moment - self.started if moment is not None else None
+
+        values: Dict[str, Optional[float]] = {
+            'ttft_seconds': since_start(self.first_token),
+            'first_check_seconds': since_start(self.first_check),
+            'parse_seconds': self.parse_seconds,
+            'render_seconds': self.render_seconds,
+            'continue_wait_seconds': self.continue_wait_seconds,
+            'turn_seconds': since_start(self.finished),
+        }
+        if usage is not None:
+            streaming = (self.last_token - self.first_token) if self.first_token is not None else 0.0
+            values.update({
+                'output_tokens_per_second': usage.output_tokens / streaming if streaming > 0 else None,
+                'input_tokens': usage.input_tokens,
+                'output_tokens': usage.output_tokens,
+                'cache_read_tokens': usage.cache_read_input_tokens,
+                'cache_write_tokens': usage.cache_creation_input_tokens,
+            })
+        return values
+
+
+class RollingHistogram:
+    """The newest `window` samples of one metric, plus totals since startup."""
+
+    __slots__ = ('samples', 'count', 'total')
+
+    def __init__(self, window: int):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value: float) -> None:
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantile(self, fraction: float) -> float:
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class MetricsRegistry:
+    """Keeps per-turn metrics in rolling histograms and exports them.
+
+    With `enabled` set, every turn is also appended to `file` as one JSON
+    line (format "jsonl"), or the file is rewritten as a Prometheus textfile
+    with a summary per metric (format "prometheus"). Files are written on a
+    background thread.
+    """
+
+    def __init__(self, config: Mapping[str, Any]):
+        self._logger = logging.getLogger(__name__)
+        self.window = config['window']
+        self.histograms = {name: RollingHistogram(self.window) for name in METRICS}
+        self.turns = 0
+        self.format = config['format']
+        self.path: Optional[Path] = Path(config['file']) if config['enabled'] else None
+        self._writer: Optional[ThreadPoolExecutor] = None
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="metrics")
+
+    def record(self, values: Mapping[str, Optional[float]], **labels: Any) -> None:
+        self.turns += 1
+        for name, value in values.items():
+            if value is not None:
+                self.histograms[name].add(value)
+
+        if self._writer is None:
+            return
+        if self.format == 'prometheus':
+            self._writer.submit(self._write_prometheus, self.prometheus_text())
+        else:
+            rounded = {name: round(value, 6) if isinstance(value, float) else value for name, value in values.items()}
+            line = json.dumps({'time': round(time.time(), 3), **labels, **rounded}, ensure_ascii=False)
+            self._writer.submit(self._append_line, line)
+
+    def _append_line(self, line: str) -> None:
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+        except Exception as e:
+            self._logger.error("Check failure: Error writing metrics: %s", e)
+
+    def _write_prometheus(self, text: str) -> None:
+        # Written aside and renamed, so a collector never reads half a file
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(temporary, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(temporary, self.path)
+        except Exception as e:
+            self._logger.error("Check failure: Error writing metrics: %s", e)
+
+    def prometheus_text(self) -> str:
+        lines: List[str] = []
+        for name, histogram in self.histograms.items():
+            if not histogram.count:
+                continue
+            metric = PROMETHEUS_PREFIX + name
+            lines.append(f"# HELP {metric} {METRICS[name]}")
+            lines.append(f"# TYPE {metric} summary")
+            for fraction in QUANTILES:
+                lines.append(f'{metric}{{quantile="{fraction}"}} {histogram.quantile(fraction):.6g}')
+            lines.append(f"{metric}_sum {histogram.total:.6g}")
+            lines.append(f"{metric}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> str:
+        """Percentiles over the rolling window, for /stats."""
+        if not self.turns:
+            return "No turns measured yet."
+
+        header = f"last {min(self.turns, self.window)} turns"
+        lines = [f"{header:<26}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}"]
+        for name, histogram in self.histograms.items():
+            if not histogram.samples:
+                continue
+            scale, unit = (1000, " ms") if name.endswith('_seconds') else (1, "")
+            cells = [histogram.quantile(fraction) * scale for fraction in QUANTILES] + [max(histogram.samples) * scale]
+            label = name.replace('_seconds', '').replace('_', ' ') + unit
+            lines.append(f"{label:<26}" + "".join(f"{cell:>10.1f}" for cell in cells))
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
@@ -0,0 +1,119 @@
+from typing import List, Dict, Any, Optional, Mapping, Tuple, TYPE_CHECKING
+import copy
+import hashlib
+import json
+from config.prompts import SYSTEM_PROMPT
+from localization.catalog import available_languages, load_catalog
+from utils.history import DialogueHistory
+
+if TYPE_CHECKING:
+    from providers.base import Provider
+
+CACHE_CONTROL: Dict[str, str] = {'type': 'ephemeral'}
+DATETIME_LABEL = "Current date and time: "
+
+
+class PromptBuilder:
+    """Lays out a request so that everything stable forms a cacheable prefix.
+
+    Order: static system prompt, summary of compacted turns, dialogue history,
+    and only then the per-turn lines (date, language and the user facts that
+    are relevant to this turn), which ride along with the newest user message
+    and are never stored in the history. Cache breakpoints sit on the system
+    blocks and on the last assistant message, so each turn reads the previous
+    turn's prefix from the cache.
+    """
+
+    def __init__(self, base_prompt: str = SYSTEM_PROMPT, cache_enabled: bool = True):
+        self.base_prompt = base_prompt.strip()
+        self.cache_enabled = cache_enabled
+
+    def _block(self, text: str, cache: bool = False) -> Dict[str, Any]:
+        block: Dict[str, Any] = {'type': 'text', 'text': text}
+        if cache and self.cache_enabled:
+            block['cache_control'] = CACHE_CONTROL
+        return block
+
+    def build_system(self, summary: Optional[str] = None) -> List[Dict[str, Any]]:
+        system = [self._block(self.base_prompt, cache=True)]
+        if summary:
+            system.append(self._block(f"Summary of the earlier conversation:\n{summary}", cache=True))
+        return system
+
+    def build_volatile(self, current_datetime: str, language: str, facts: Optional[List[str]] = None) -> str:
+        catalog = load_catalog(language if language in available_languages() else 'en')
+        instruction = catalog.translate('prompt', 'language_instruction')
+        volatile = f"{DATETIME_LABEL}{current_datetime}\n\n{instruction}"
+        if facts:
+            volatile += "\n\nKnown facts about the user:\n" + "\n".join(f"- {fact}" for fact in facts)
+        return volatile
+
+    def build_messages(self, messages: List[Dict[str, str]], volatile: Optional[str] = None) -> List[Dict[str, Any]]:
+        result: List[Dict[str, Any]] = [
+            copy.copy(msg) for msg in messages if msg['role'] != 'system'
+        ]
+
+        if self.cache_enabled:
+            for msg in reversed(result[:-1]):
+                if msg['role'] == 'assistant':
+                    msg['content'] = [self._block(msg['content'], cache=True)]
+                    break
+
+        if volatile and result and result[-1]['role'] == 'user':
+            result[-1]['content'] = [self._block(volatile), self._block(result[-1]['content'])]
+
+        return result
+
+
+async def build_request(
+    provider: "Provider",
+    prompt_builder: PromptBuilder,
+    history: DialogueHistory,
+    model_config: Mapping[str, Any],
+    history_config: Mapping[str, Any],
+    volatile: str
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]:
+    system = prompt_builder.build_system(history.summary)
+    # Whatever is left of the context window after the reply and the fixed parts of the prompt
+    input_limit = history_config['context_window'] - model_config['max_tokens']
+    fixed_tokens = sum(history.count_tokens(block['text']) for block in system) + history.count_tokens(volatile)
+    budget = min(history_config['budget_tokens'], input_limit - fixed_tokens)
+
+    window = history.get_window(budget)
+    estimated = fixed_tokens + sum(history.count_tokens(msg['content']) for msg in window)
+    messages = prompt_builder.build_messages(window, volatile)
+
+    if history_config['exact_token_count'] and provider.supports_token_count and estimated > 0.9 * input_limit:
+        counted = await provider.count_tokens(model=model_config['name'], system=system, messages=messages)
+        history.calibrate(estimated, counted)
+        if counted > input_limit:
+            window = history.get_window(budget - (counted - input_limit))
+            messages = prompt_builder.build_messages(window, volatile)
+
+    return system, messages, estimated
+
+
+def _stable_content(content: Any) -> Any:
+    if isinstance(content, str):
+        return content
+    blocks = []
+    for block in content:
+        block = {name: value for name, value in block.items() if name != 'cache_control'}
+        if block.get('type') == 'text' and block['text'].startswith(DATETIME_LABEL):
+            block['text'] = block['text'].partition('\n')[2]
+        blocks.append(block)
+    return blocks
+
+
+def request_key(request: Mapping[str, Any]) -> str:
+    """Hash of everything in a request that shapes the answer: the model
+    settings, system prompt and messages, without cache markers or the time."""
+    stable = {
+        'model': request.get('model'),
+        'max_tokens': request.get('max_tokens'),
+        'temperature': request.get('temperature'),
+        'system': _stable_content(request.get('system', '')),
+        'messages': [{**msg, 'content': _stable_content(msg['content'])} for msg in request.get('messages', [])]
+    }
+    data = json.dumps(stable, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
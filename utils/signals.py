@@ -0,0 +1,40 @@
+import asyncio
+import signal
+import logging
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class InterruptScope:
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.triggered = False
+
+    def trigger(self) -> None:
+        self.triggered = True
+        self.task.cancel()
+
+
+@contextmanager
+def cancel_on_interrupt(task: asyncio.Future) -> Iterator[InterruptScope]:
+    """Routes Ctrl-C to cancelling `task` instead of interrupting the whole program."""
+    logger = logging.getLogger(__name__)
+    scope = InterruptScope(task)
+    loop = asyncio.get_running_loop()
+    previous = signal.getsignal(signal.SIGINT)
+
+    try:
+        loop.add_signal_handler(signal.SIGINT, scope.trigger)
+        installed = True
+    except (NotImplementedError, RuntimeError, ValueError) as e:
+        # Windows event loops and non-main threads can't install signal handlers
+        logger.debug("Interrupt handler not installed: %s", e)
+        installed = False
+
+    try:
+        yield scope
+    finally:
+        if installed:
+            loop.remove_signal_handler(signal.SIGINT)
+            if previous is not None:
+                signal.signal(signal.SIGINT, previous)
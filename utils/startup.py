@@ -0,0 +1,93 @@
+import builtins
+import importlib
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Imported in the background once the prompt is up
+PREWARM_MODULES = ('providers.factory', 'ui.renderer')
+# Imports faster than this are summed up in one line of the report
+REPORT_THRESHOLD_MS = 1.0
+
+
+class StartupProfile:
+    """Times module imports and startup milestones for --startup-report.
+
+    Only the outermost import of each module is recorded, so the import
+    times of one thread add up to the time that thread spent importing.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # (module, milliseconds, thread name)
+        self.imports: List[Tuple[str, float, str]] = []
+        self.marks: Dict[str, float] = {}
+        self._local = threading.local()
+        self._threads: List[threading.Thread] = []
+
+    def _timed(self, name: str, do_import, *args: Any) -> ModuleType:
+        if name in sys.modules or getattr(self._local, 'depth', 0):
+            return do_import(name, *args)
+
+        self._local.depth = 1
+        started = time.perf_counter()
+        try:
+            return do_import(name, *args)
+        finally:
+            self._local.depth = 0
+            self.imports.append((name, (time.perf_counter() - started) * 1000, threading.current_thread().name))
+
+    def record_imports(self) -> None:
+        """Times every import statement from now on; only used for the report."""
+        original = builtins.__import__
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level:
+                return original(name, globals, locals, fromlist, level)
+            return self._timed(name, original, globals, locals, fromlist, level)
+
+        builtins.__import__ = timed_import
+
+    def import_module(self, name: str) -> ModuleType:
+        return self._timed(name, importlib.import_module)
+
+    def prewarm(self, names: Iterable[str] = PREWARM_MODULES) -> None:
+        def run() -> None:
+            for name in names:
+                try:
+                    self.import_module(name)
+                except Exception:
+                    # The import is retried, and the error reported, where the module is used
+                    pass
+
+        thread = threading.Thread(target=run, name="prewarm", daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def mark(self, milestone: str) -> None:
+        self.marks.setdefault(milestone, (time.perf_counter() - self.started) * 1000)
+
+    def report(self) -> str:
+        lines = ["Startup report (ms since the entry point started)"]
+        threads = sorted({thread for _, _, thread in self.imports}, key=lambda t: t != 'MainThread')
+        for thread in threads:
+            imports = [(name, ms) for name, ms, t in self.imports if t == thread]
+            lines.append(f"  imports in {thread}: {sum(ms for _, ms in imports):8.1f}")
+            for name, ms in sorted(imports, key=lambda item: -item[1]):
+                if ms >= REPORT_THRESHOLD_MS:
+                    lines.append(f"    {name:<36}{ms:8.1f}")
+            small = [ms for _, ms in imports if ms < REPORT_THRESHOLD_MS]
+            if small:
+                lines.append(f"    {f'({len(small)} smaller imports)':<36}{sum(small):8.1f}")
+        for milestone, ms in self.marks.items():
+            lines.append(f"  {milestone:<38}{ms:8.1f}")
+        return "\n".join(lines)
+
+
+startup = StartupProfile()
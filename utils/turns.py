@@ -0,0 +1,92 @@
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from config.config_manager import ConfigManager
+from models.skill_check import SkillCheck
+from models.context_update import ContextUpdate
+from processors.xml_processor import XMLStreamProcessor
+from providers.base import Completion, Provider, Usage
+from providers.retry import RetryPolicy, stream_with_retries
+from utils.history import DialogueHistory
+from utils.prompt_builder import PromptBuilder, build_request
+from utils.exceptions import ProviderError
+from utils.time_utils import get_formatted_datetime
+
+Item = Union[SkillCheck, ContextUpdate]
+# Called with every parsed item and its time since the request in ms
+ItemCallback = Callable[[Item, float], Awaitable[None]]
+
+
+def item_record(item: Item) -> Dict[str, Any]:
+    if isinstance(item, SkillCheck):
+        return {
+            'type': 'skill_check', 'skill': item.skill, 'difficulty': item.difficulty,
+            'success': item.success, 'category': item.category, 'content': item.content
+        }
+    return {'type': 'context_update', 'content': item.content}
+
+
+def usage_record(usage: Usage) -> Dict[str, int]:
+    return {
+        'input_tokens': usage.input_tokens, 'output_tokens': usage.output_tokens,
+        'cache_read_tokens': usage.cache_read_input_tokens, 'cache_write_tokens': usage.cache_creation_input_tokens
+    }
+
+
+async def stream_turn(
+    provider: Provider,
+    config_manager: ConfigManager,
+    prompt_builder: PromptBuilder,
+    history: DialogueHistory,
+    language: str,
+    on_item: ItemCallback
+) -> Tuple[Completion, Optional[float]]:
+    """Streams the answer to the last message of `history` through a fresh parser, without any UI.
+
+    Returns the completion and the time to the first token in ms. The answer
+    is not added to `history`. A response that has to be started over after
+    `on_item` has seen some of it fails instead, items can't be taken back.
+    """
+    model_config = config_manager.get_model_config()
+    volatile = prompt_builder.build_volatile(get_formatted_datetime(), language)
+    system, messages, _ = await build_request(
+        provider, prompt_builder, history, model_config, config_manager.get_history_config(), volatile
+    )
+
+    processor = XMLStreamProcessor()
+    started = time.perf_counter()
+    first_token: Optional[float] = None
+    forwarded = False
+
+    async def forward(items) -> None:
+        nonlocal forwarded
+        elapsed = round((time.perf_counter() - started) * 1000, 1)
+        for item in items:
+            if item:
+                forwarded = True
+                await on_item(item, elapsed)
+
+    def restart() -> None:
+        if forwarded:
+            raise ProviderError("Response broken off after some of it was sent, it can't be started over")
+        processor.clear_buffer()
+
+    async def on_text(text: str) -> None:
+        nonlocal first_token
+        if first_token is None:
+            first_token = time.perf_counter()
+        await forward(processor.process_stream(text))
+
+    provider_config = config_manager.get_provider_config()
+    completion = await stream_with_retries(
+        provider, on_text, RetryPolicy.from_config(provider_config), provider_config['resume'], restart,
+        model=model_config['name'],
+        max_tokens=model_config['max_tokens'],
+        temperature=model_config['temperature'],
+        system=system,
+        messages=messages
+    )
+    await forward(processor.flush())
+
+    ttft = round((first_token - started) * 1000, 1) if first_token is not None else None
+    return completion, ttft
@@ -0,0 +1,39 @@
+import hashlib
+import importlib
+import multiprocessing
+import signal
+from typing import Any, Optional, TYPE_CHECKING
+
+from config.config_manager import ConfigManager
+from utils.logging import setup_logging
+
+if TYPE_CHECKING:
+    from providers.base import Provider
+
+# Workers start from a fresh interpreter: forking a process that already
+# runs an event loop, logging thread and HTTP pool is not safe
+WORKER_CONTEXT = multiprocessing.get_context('spawn')
+
+
+def shard_of(key: str, workers: int) -> int:
+    """Worker index for `key`, the same in every process (unlike hash())."""
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % workers
+
+
+def open_provider(config_manager: ConfigManager, base_url: Optional[str] = None, **overrides: Any) -> "Provider":
+    """Provider for the headless modes, with the response cache if it is enabled."""
+    config = {**config_manager.get_provider_config(), **overrides}
+    api_key = config_manager.get_api_key()
+    if not api_key and config['type'] == 'anthropic':
+        raise ValueError("No API key found in config or environment variables")
+    if base_url:
+        config['base_url'] = base_url
+    factory = importlib.import_module('providers.factory')
+    return factory.create_provider(config, api_key, cache_config=config_manager.get_response_cache_config())
+
+
+def init_worker(name: str, log_format: str) -> None:
+    # Ctrl+C reaches the whole process group; the supervisor decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(log_format, name)